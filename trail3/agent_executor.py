@@ -0,0 +1,214 @@
+"""Concurrent stage runner for graph.execute_agent.
+
+Independent agent calls are submitted as named stages to a shared thread
+pool and joined by name when their output is needed. Joining applies a
+per-stage timeout; a timed-out or failed stage re-raises so the caller's
+existing fallback branch handles it exactly as before.
+
+Stages submitted with ``memo_inputs`` are memoized on a fingerprint of
+those inputs: within a run (validation retries reuse unchanged stages)
+and, optionally, across runs via a bounded process-wide LRU.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_STAGE_TIMEOUT_S = float(os.getenv("AGENT_STAGE_TIMEOUT_S", "35"))
+MAX_WORKERS = int(os.getenv("AGENT_MAX_WORKERS", "16"))
+SHARED_MEMO_ENABLED = os.getenv("AGENT_STAGE_MEMO_SHARED", "0").strip() == "1"
+SHARED_MEMO_SIZE = int(os.getenv("AGENT_STAGE_MEMO_SIZE", "512"))
+
+# Per-stage timeouts (seconds); tune individually if one agent is consistently slower.
+STAGE_TIMEOUTS: Dict[str, float] = {
+    "build_method": DEFAULT_STAGE_TIMEOUT_S,
+    "risk_agent": DEFAULT_STAGE_TIMEOUT_S,
+    "cost_optimization": DEFAULT_STAGE_TIMEOUT_S,
+    "validation": DEFAULT_STAGE_TIMEOUT_S,
+    "strategy": DEFAULT_STAGE_TIMEOUT_S,
+}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Shared so a timed-out call never blocks the caller on executor shutdown.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="agent-stage")
+    return _pool
+
+
+class StageTimeout(TimeoutError):
+    pass
+
+
+def fingerprint(name: str, inputs: Any) -> str:
+    """Stable hash of a stage name plus the inputs it reads."""
+    payload = json.dumps([name, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_shared_memo: "OrderedDict[str, Any]" = OrderedDict()
+_shared_lock = threading.Lock()
+
+
+def _shared_get(key: str):
+    with _shared_lock:
+        if key in _shared_memo:
+            _shared_memo.move_to_end(key)
+            return True, _shared_memo[key]
+    return False, None
+
+
+def _shared_put(key: str, value: Any) -> None:
+    with _shared_lock:
+        _shared_memo[key] = value
+        _shared_memo.move_to_end(key)
+        while len(_shared_memo) > SHARED_MEMO_SIZE:
+            _shared_memo.popitem(last=False)
+
+
+def clear_shared_memo() -> None:
+    with _shared_lock:
+        _shared_memo.clear()
+
+
+def _completed(value: Any) -> Future:
+    fut: Future = Future()
+    fut.set_result(value)
+    return fut
+
+
+class StageMemo:
+    """Fingerprint -> Future memo for one run, optionally backed by the shared LRU.
+
+    In-flight futures are reused too, so a retry that resubmits an unchanged
+    stage waits on the original call instead of issuing a new one. Failed
+    stages are evicted so they are retried on the next attempt.
+    """
+
+    def __init__(self, shared: Optional[bool] = None):
+        self.shared = SHARED_MEMO_ENABLED if shared is None else bool(shared)
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._local: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, field: str) -> None:
+        with self._lock:
+            entry = self.stats.setdefault(name, {"hits": 0, "misses": 0})
+            entry[field] += 1
+
+    def get(self, name: str, key: str) -> Optional[Future]:
+        fut = self._local.get(key)
+        if fut is not None and fut.done() and (fut.cancelled() or fut.exception() is not None):
+            fut = None
+        if fut is None and self.shared:
+            found, value = _shared_get(key)
+            if found:
+                fut = _completed(value)
+                self._local[key] = fut
+        self._count(name, "hits" if fut is not None else "misses")
+        return fut
+
+    def put(self, key: str, fut: Future) -> None:
+        self._local[key] = fut
+
+        def _settle(f: Future) -> None:
+            if f.cancelled() or f.exception() is not None:
+                self._local.pop(key, None)
+            elif self.shared:
+                _shared_put(key, f.result())
+
+        fut.add_done_callback(_settle)
+
+
+class StageRunner:
+    """Submit named stages now, collect their results later.
+
+    ``timings_ms`` records wall-clock time from submit to completion (or the
+    timeout, if the stage was abandoned) for each stage.
+    """
+
+    def __init__(self, timeouts: Optional[Dict[str, float]] = None, memo: Optional[StageMemo] = None):
+        self.timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+        self.memo = memo
+        self.timings_ms: Dict[str, float] = {}
+        self._futures: Dict[str, Future] = {}
+        self._started: Dict[str, float] = {}
+
+    def submit(self, name: str, fn: Callable[..., Any], *args: Any, memo_inputs: Any = None, **kwargs: Any) -> None:
+        """Start ``fn`` in the pool; with ``memo_inputs``, reuse a memoized result if inputs match."""
+        started = time.perf_counter()
+        self._started[name] = started
+        key = None
+        if self.memo is not None and memo_inputs is not None:
+            key = fingerprint(name, memo_inputs)
+            cached = self.memo.get(name, key)
+            if cached is not None:
+                self._futures[name] = cached
+                return
+
+        # Run in a copy of the caller's context so per-request context vars (llm_metrics) follow the stage.
+        fut = _get_pool().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+        def _done(_f: Future) -> None:
+            self.timings_ms[name] = (time.perf_counter() - started) * 1000.0
+
+        fut.add_done_callback(_done)
+        if key is not None:
+            self.memo.put(key, fut)
+        self._futures[name] = fut
+
+    def run(self, name: str, fn: Callable[..., Any], *args: Any, memo_inputs: Any = None, **kwargs: Any) -> Any:
+        """Run a cheap deterministic stage inline, memoized like submit()."""
+        key = None
+        if self.memo is not None and memo_inputs is not None:
+            key = fingerprint(name, memo_inputs)
+            cached = self.memo.get(name, key)
+            if cached is not None:
+                return cached.result()
+        started = time.perf_counter()
+        value = fn(*args, **kwargs)
+        self.timings_ms[name] = (time.perf_counter() - started) * 1000.0
+        if key is not None:
+            self.memo.put(key, _completed(value))
+        return value
+
+    def pending(self, name: str) -> bool:
+        return name in self._futures
+
+    def result(self, name: str) -> Any:
+        """Wait for ``name``; re-raises the stage's exception or StageTimeout."""
+        fut = self._futures.pop(name)
+        started = self._started.pop(name)
+        timeout = self.timeouts.get(name, DEFAULT_STAGE_TIMEOUT_S)
+        remaining = max(0.0, timeout - (time.perf_counter() - started))
+        try:
+            return fut.result(timeout=remaining)
+        except FutureTimeout as e:
+            fut.cancel()
+            self.timings_ms[name] = timeout * 1000.0
+            raise StageTimeout(f"Stage '{name}' exceeded {timeout:.0f}s") from e
+
+    def discard(self, name: str) -> None:
+        """Drop a speculative stage whose result is no longer needed.
+
+        Memoized stages keep running so an unchanged resubmit can reuse them.
+        """
+        fut = self._futures.pop(name, None)
+        self._started.pop(name, None)
+        if fut is not None and self.memo is None:
+            fut.cancel()
@@ -9,10 +9,14 @@ import pydeck as pdk
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
-from graph import execute_agent, scenario_estimates
+from graph import enrich_with_llm, execute_agent, scenario_estimates, stream_enrichment
 from geo.geocoder import get_location_details
 from report_generator import generate_costing_pack_pdf, generate_roi_report_pdf, generate_optimization_pack_pdf, generate_monthly_summary_pdf
 from providers import find_nearby_providers, Provider
+from cost_catalog import CATALOG_VERSIONS_DIR, save_catalog, catalog_stats
+from monte_carlo import simulate_cost_distribution
+from llm_cache import cache_stats as llm_cache_stats
+from llm_engine import provider_stats, rate_limit_stats, singleflight_stats
 
 import folium
 from streamlit_folium import st_folium
@@ -22,12 +26,14 @@ from audit_store import (
     update_status,
     get_request,
     list_recent,
-    list_by_status,
+    list_requests_page,
     analytics_last_30_days,
     roi_observed_metrics,
     list_roi_snapshots,
     patch_output,
+    llm_usage_summary,
 )
+from llm_metrics import LATENCY_BUCKETS_MS, usage_snapshot as llm_usage_snapshot
 
 st.set_page_config(
     layout="wide",
@@ -237,7 +243,12 @@ def page_dashboard():
     c2.metric("Pending review", by_status.get("PENDING_REVIEW", 0) + by_status.get("DRAFT", 0))
     c3.metric("Approved", by_status.get("APPROVED", 0))
     avg_tat = stats.get("avg_turnaround_hours_approved_30d")
-    c4.metric("Avg turnaround (approved)", f"{avg_tat:.1f} hrs" if avg_tat is not None else "—")
+    _p50, _p90 = stats.get("p50_turnaround_hours_approved_30d"), stats.get("p90_turnaround_hours_approved_30d")
+    c4.metric(
+        "Avg turnaround (approved)",
+        f"{avg_tat:.1f} hrs" if avg_tat is not None else "—",
+        help=f"Median {_p50:.1f} hrs · P90 {_p90:.1f} hrs" if _p50 is not None and _p90 is not None else None,
+    )
 
     st.markdown("### Operational overview")
 
@@ -260,23 +271,53 @@ def page_dashboard():
         else:
             st.info("Status mix will appear after at least one request is saved.")
 
-    
+    st.markdown("### LLM usage (last 30 days)")
+    usage = llm_usage_summary(30)
+    if not usage.get("by_agent"):
+        # No audit store rollups yet: show what this process has seen.
+        usage = llm_usage_snapshot()
+        if usage.get("by_agent"):
+            st.caption("Showing calls made by this app instance (audit store rollups unavailable).")
+    if usage.get("by_agent"):
+        agent_df = pd.DataFrame([{"agent": k, **v} for k, v in usage["by_agent"].items()]).sort_values("avg_latency_ms", ascending=False)
+        total_calls = int(agent_df["calls"].sum())
+        u1, u2, u3, u4 = st.columns(4)
+        u1.metric("LLM calls", f"{total_calls:,}")
+        u2.metric("Provider spend (est.)", f"${agent_df['cost_usd'].sum():,.2f}")
+        u3.metric("Avg latency", f"{(agent_df['avg_latency_ms'] * agent_df['calls']).sum() / max(total_calls, 1):,.0f} ms")
+        u4.metric("Cache hit rate", f"{agent_df['cache_hits'].sum() / max(total_calls, 1):.0%}")
+        ul, ur = st.columns([2, 1])
+        with ul:
+            show = [c for c in ["agent", "calls", "errors", "cache_hits", "avg_latency_ms", "p95_latency_ms",
+                                "prompt_tokens", "completion_tokens", "retries", "cost_usd"] if c in agent_df.columns]
+            st.dataframe(agent_df[show], use_container_width=True, hide_index=True)
+            if usage.get("by_day"):
+                day_df = pd.DataFrame(usage["by_day"])
+                st.plotly_chart(px.bar(day_df, x="date", y="cost_usd", title="Estimated provider spend per day (USD)"), use_container_width=True)
+        with ur:
+            order = [f"le_{b}" for b in LATENCY_BUCKETS_MS] + [f"gt_{LATENCY_BUCKETS_MS[-1]}"]
+            hist = usage.get("latency_hist") or {}
+            hist_df = pd.DataFrame({
+                "latency": [o.replace("le_", "≤").replace("gt_", ">") + " ms" for o in order],
+                "calls": [hist.get(o, 0) for o in order],
+            })
+            st.plotly_chart(px.bar(hist_df, x="latency", y="calls", title="Call latency"), use_container_width=True)
+    else:
+        st.caption("No LLM calls recorded yet.")
+
     st.markdown("### Request density map")
     try:
         pts = []
+        # list_recent rows already carry latitude/longitude; no per-request lookups.
         for it in recent[:120]:
-            rec = get_request(it["request_id"])
-            if not rec:
-                continue
-            inp = rec.get("inputs") or {}
-            lat = inp.get("latitude")
-            lon = inp.get("longitude")
+            lat = it.get("latitude")
+            lon = it.get("longitude")
             if lat is None or lon is None:
                 continue
             pts.append({
                 "lat": float(lat),
                 "lon": float(lon),
-                "status": (rec.get("status") or "DRAFT").upper(),
+                "status": (it.get("status") or "DRAFT").upper(),
             })
         if pts:
             pdf = pd.DataFrame(pts)
@@ -372,6 +413,29 @@ def page_costing():
         )
 
         st.markdown(" ")
+        fast_mode = st.toggle(
+            "Fast deterministic mode",
+            value=False,
+            help="Skip LLM calls: heuristic build method, catalog costing and local validation (sub-second).",
+        )
+        enrich_later = st.checkbox(
+            "Add AI narratives in the background",
+            value=False,
+            disabled=not fast_mode,
+            help="Runs the risk, cost-optimization and strategy agents after the numbers are shown.",
+        )
+        stream_llm = st.checkbox(
+            "Stream AI narratives",
+            value=False,
+            disabled=fast_mode,
+            help="Show the deterministic numbers immediately, then stream the risk, optimization and strategy text as the agents produce it.",
+        )
+        combined_llm = st.checkbox(
+            "Single combined AI call",
+            value=False,
+            disabled=fast_mode or stream_llm,
+            help="Ask the risk, cost-optimization, validation and strategy agents in one request (2 LLM round trips instead of 5).",
+        )
         b1, b2 = st.columns(2)
         with b1:
             save_draft = st.button("Save Draft", use_container_width=True)
@@ -469,6 +533,8 @@ def page_costing():
         # Clear previous result if new run
         st.session_state.pop("costing_result", None)
         st.session_state.pop("costing_state", None)
+        st.session_state.pop("costing_enrichment", None)
+        st.session_state.pop("costing_stream", None)
         
         state = {
             "distance": float(distance_m),
@@ -485,10 +551,19 @@ def page_costing():
             "nearby_providers": [p.model_dump() for p in providers] if providers else [],
         }
 
-        with st.spinner("Running agentic workflow (decision → costing → risk → simulation)…"):
-            result = execute_agent(state)
-            st.session_state["costing_result"] = result
-            st.session_state["costing_state"] = state
+        if fast_mode:
+            result = execute_agent(state, mode="deterministic")
+            if enrich_later:
+                st.session_state["costing_enrichment"] = enrich_with_llm(result)
+        elif stream_llm:
+            # Numbers first; the narratives stream into their cards at the end of the page.
+            result = execute_agent(state, mode="deterministic")
+            st.session_state["costing_stream"] = result["request_id"]
+        else:
+            with st.spinner("Running agentic workflow (decision → costing → risk → simulation)…"):
+                result = execute_agent(state, mode="combined" if combined_llm else "agentic")
+        st.session_state["costing_result"] = result
+        st.session_state["costing_state"] = state
             
     # Check if we have a result in session state to display
     if "costing_result" in st.session_state:
@@ -497,7 +572,28 @@ def page_costing():
         request_id = result.get("request_id")
         site_ref = state.get("site_ref")
 
+        _enrichment = st.session_state.get("costing_enrichment")
+        if _enrichment is not None and _enrichment.done():
+            st.session_state.pop("costing_enrichment", None)
+            try:
+                result.update(_enrichment.result())
+            except Exception as e:
+                st.warning(f"AI narratives unavailable: {e}")
+
         st.success(f"Assessment complete. Request ID: {request_id}")
+        _streaming = st.session_state.get("costing_stream") == request_id
+        if result.get("mode") == "deterministic":
+            _det_ms = (result.get("stage_timings_ms") or {}).get("deterministic", 0.0)
+            if _streaming:
+                st.caption(f"Numbers computed in {_det_ms:.1f} ms · AI narratives are streaming into the cards below")
+            elif result.get("narratives") == "streamed":
+                st.caption(f"Numbers computed in {_det_ms:.1f} ms · AI narratives streamed")
+            else:
+                st.caption(f"Fast deterministic mode · computed in {_det_ms:.1f} ms · no LLM calls")
+        if "costing_enrichment" in st.session_state:
+            st.info("AI narratives are being generated in the background.")
+            if st.button("Refresh narratives", key=f"refresh_{request_id}"):
+                st.rerun()
         
         # Explicit Save Option
         st.markdown("### Actions")
@@ -574,6 +670,23 @@ def page_costing():
     with cc3:
         st.metric("Potential Savings", _fmt_money(savings), delta="Optimization Impact", help="Difference between standard and optimized costs")
 
+    # Cost uncertainty (Monte Carlo over catalog distributions)
+    st.markdown("#### Cost uncertainty (Monte Carlo)")
+    try:
+        mc = simulate_cost_distribution(
+            {**state, "build_method": result.get("build_method")},
+            budget=_budget_val or None,
+        )
+        mc1, mc2, mc3, mc4 = st.columns(4)
+        mc1.metric("P10", _fmt_money(mc["p10"]))
+        mc2.metric("P50", _fmt_money(mc["p50"]))
+        mc3.metric("P90", _fmt_money(mc["p90"]))
+        pexc = mc.get("prob_exceed_budget")
+        mc4.metric("P(exceed budget)", f"{pexc * 100:.1f}%" if pexc is not None else "—", help="Budget = preview estimate")
+        st.caption(f"{mc['draws']:,} draws • catalog {mc['catalog_version']} • {mc['elapsed_ms']:.0f} ms")
+    except Exception as e:
+        st.caption(f"Monte Carlo unavailable: {e}")
+
     st.divider()
 
 
@@ -680,8 +793,8 @@ def page_costing():
 
     r1, r2 = st.columns(2)
     with r1:
-        st.markdown('<div class="card"><b>Top risk</b><br/>{}</div>'.format(result.get("top_risk", "—")), unsafe_allow_html=True)
-        st.caption(result.get("risk_mitigation", ""))
+        risk_ph = st.empty()
+        _render_top_risk(risk_ph, result)
     with r2:
         assumptions = result.get("assumptions") or []
         if assumptions:
@@ -690,9 +803,48 @@ def page_costing():
             st.markdown('<div class="card"><b>Assumptions</b><br/>—</div>', unsafe_allow_html=True)
 
     st.markdown("#### Cost optimization")
-    opt_text = result.get("cost_optimization") or "—"
-    opt_html = str(opt_text).replace("\n", "<br/>")
-    st.markdown(f"<div class='card'><b>Recommendations</b><br/>{opt_html}</div>", unsafe_allow_html=True)
+    opt_ph = st.empty()
+    _render_optimization(opt_ph, result)
+
+    st.markdown("#### Strategy note")
+    strategy_ph = st.empty()
+    _render_strategy(strategy_ph, result)
+
+    if st.session_state.get("costing_stream") == request_id:
+        st.session_state.pop("costing_stream", None)
+        placeholders = {
+            "top_risk": (risk_ph, _render_top_risk),
+            "risk_mitigation": (risk_ph, _render_top_risk),
+            "cost_optimization": (opt_ph, _render_optimization),
+            "mitigation": (strategy_ph, _render_strategy),
+        }
+        try:
+            for field, value in stream_enrichment(result):
+                result[field] = value
+                if field in placeholders:
+                    ph, render = placeholders[field]
+                    render(ph, result, streaming=field == "mitigation")
+            result["narratives"] = "streamed"
+        except Exception as e:
+            st.warning(f"AI narratives unavailable: {e}")
+        _render_strategy(strategy_ph, result)
+
+
+def _render_top_risk(ph, result, streaming=False):
+    with ph.container():
+        st.markdown('<div class="card"><b>Top risk</b><br/>{}</div>'.format(result.get("top_risk", "—")), unsafe_allow_html=True)
+        st.caption(result.get("risk_mitigation", ""))
+
+
+def _render_optimization(ph, result, streaming=False):
+    opt_html = str(result.get("cost_optimization") or "—").replace("\n", "<br/>")
+    ph.markdown(f"<div class='card'><b>Recommendations</b><br/>{opt_html}</div>", unsafe_allow_html=True)
+
+
+def _render_strategy(ph, result, streaming=False):
+    text = str(result.get("mitigation") or "—").replace("\n", "<br/>")
+    cursor = " ▌" if streaming else ""
+    ph.markdown(f"<div class='card'>{text}{cursor}</div>", unsafe_allow_html=True)
 
 
 def page_approvals():
@@ -700,42 +852,47 @@ def page_approvals():
     st.markdown("### Audit Log")
 
     statuses = ["ALL", "PENDING_REVIEW", "REVIEWED", "NEEDS_SURVEY", "APPROVED", "REJECTED", "DRAFT"]
-    sel = st.selectbox("Filter by status", statuses, index=0)
-
-    if sel == "ALL":
-        items = list_recent(200)
-    else:
-        items = list_by_status(sel, 200)
+    f1, f2, f3, f4 = st.columns(4)
+    sel = f1.selectbox("Filter by status", statuses, index=0)
+    sel_pr = f2.selectbox("Priority", ["ALL", "Critical", "High", "Normal"], index=0)
+    site_prefix = f3.text_input("Site ref starts with", value="").strip()
+    page_size = f4.selectbox("Rows per page", [25, 50, 100, 200], index=1)
+    f5, f6, f7, f8 = st.columns([2, 1, 1, 1])
+    date_range = f5.date_input("Created between", value=(), help="Leave empty for all dates")
+    min_cost = f6.number_input("Min final cost (₹)", min_value=0.0, value=0.0, step=100000.0,
+                               help="Approved cost where set, else the estimated final cost")
+    max_cost = f7.number_input("Max final cost (₹)", min_value=0.0, value=0.0, step=100000.0, help="0 = no limit")
+    sort_label = f8.selectbox("Sort by", ["Priority, then newest", "Newest first"], index=0)
+    order = "priority" if sort_label.startswith("Priority") else "newest"
+
+    filters = {
+        "status": None if sel == "ALL" else sel,
+        "priority": None if sel_pr == "ALL" else sel_pr,
+        "site_ref_prefix": site_prefix or None,
+        "created_from": date_range[0] if len(date_range) > 0 else None,
+        "created_to": date_range[1] if len(date_range) > 1 else None,
+        "min_cost": min_cost or None,
+        "max_cost": max_cost or None,
+    }
+    # Keyset pages: keep the cursor of every page visited so "Previous" needs no offset scan.
+    sig = repr((filters, page_size, order))
+    if st.session_state.get("audit_filters") != sig:
+        st.session_state["audit_filters"] = sig
+        st.session_state["audit_cursors"] = [None]
+    cursors = st.session_state["audit_cursors"]
+    page = list_requests_page(page_size, cursors[-1], order=order, **filters)
+    items = page["items"]
 
     df = pd.DataFrame(items) if items else pd.DataFrame(columns=["request_id", "created_at", "site_ref", "status"])
-    # Enrich table with priority, cost, build method, SLA remaining
+    # Rows come back filtered and sorted, with priority, budget, cost and build method attached
     if not df.empty:
-        pri = []
-        bud = []
-        cost = []
-        bm = []
-        sla_rem = []
-        for rid, created_at, site_ref, status, *rest in df.itertuples(index=False, name=None):
-            rec = get_request(str(rid))
-            inp = (rec.get("inputs") or {}) if rec else {}
-            out = (rec.get("outputs") or {}) if rec else {}
-            pr = inp.get("priority", "")
-            pri.append(pr)
-            bud.append(inp.get("budget_preview", inp.get("budget_estimate", "")))
-            fc = out.get("approved_final_cost", out.get("final_cost", out.get("total_cost", "")))
-            cost.append(fc)
-            bm.append(out.get("build_method", ""))
-            sla = _compute_sla(rec.get("created_at","") if rec else str(created_at), pr)
-            sla_rem.append(sla.get("sla_remaining"))
-        df["priority"] = pri
-        df["budget_preview"] = bud
-        df["final_cost"] = cost
-        df["build_method"] = bm
-        df["sla_remaining"] = sla_rem
-        # Sort by priority then SLA
-        pr_order = {"Critical": 0, "High": 1, "Normal": 2, "": 3}
-        df["_pr"] = df["priority"].map(lambda x: pr_order.get(str(x), 3))
-        df = df.sort_values(["_pr", "created_at"], ascending=[True, False]).drop(columns=["_pr"])
+        df["priority"] = df["priority"].fillna("")
+        df["final_cost"] = df["approved_final_cost"].where(df["approved_final_cost"].notna(), df["final_cost"])
+        df = df.drop(columns=["approved_final_cost", "latitude", "longitude"])
+        df["sla_remaining"] = [
+            _compute_sla(str(created_at or ""), pr).get("sla_remaining")
+            for created_at, pr in zip(df["created_at"], df["priority"])
+        ]
 
     if not df.empty and "budget_preview" in df.columns:
         df["budget_fmt"] = df["budget_preview"].apply(_safe_float).apply(_fmt_money)
@@ -750,6 +907,15 @@ def page_approvals():
     show_cols = [c for c in show_cols if c in df.columns]
     st.dataframe(df[show_cols], use_container_width=True, hide_index=True)
 
+    p1, p2, p3 = st.columns([1, 1, 3])
+    if p1.button("◀ Previous", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    if p2.button("Next ▶", disabled=not page["next_cursor"], use_container_width=True):
+        cursors.append(page["next_cursor"])
+        st.rerun()
+    p3.caption(f"Page {len(cursors)} • {len(df)} rows (exports below cover this page)")
+
     cexp1, cexp2, cexp3 = st.columns(3)
     with cexp1:
         st.download_button("Export Audit Log (CSV)", data=df.to_csv(index=False).encode('utf-8'), file_name="audit_log.csv", mime="text/csv", use_container_width=True)
@@ -887,17 +1053,39 @@ def page_approvals():
                         if not isinstance(new_catalog, dict) or "unit_costs" not in new_catalog:
                             st.error("Invalid catalog. Expected a JSON object with a unit_costs field.")
                         else:
-                            backup_dir = "cost_catalog_versions"
+                            backup_dir = CATALOG_VERSIONS_DIR
                             os.makedirs(backup_dir, exist_ok=True)
                             ts = datetime.now().strftime("%Y%m%d_%H%M%S")
                             ver_path = os.path.join(backup_dir, f"cost_catalog_{ts}.json")
                             with open(ver_path, "w", encoding="utf-8") as f:
                                 json.dump(new_catalog, f, ensure_ascii=False, indent=2)
-                            with open("cost_catalog.json", "w", encoding="utf-8") as f:
-                                json.dump(new_catalog, f, ensure_ascii=False, indent=2)
+                            # Atomic write + cache invalidation so the compiled catalog swaps immediately
+                            save_catalog(new_catalog)
                             st.success(f"Catalog updated. Saved version: {ver_path}")
                     except Exception as e:
                         st.error(f"Upload failed: {e}")
+                st.caption("Catalog cache: {}".format(json.dumps(catalog_stats(), default=str)))
+                _llm = llm_cache_stats()
+                st.caption(
+                    f"LLM response cache: {_llm.get('entries', 0)} entries · "
+                    f"hit rate {_llm['process_hit_rate']:.0%} this process"
+                )
+                _sf = singleflight_stats()
+                st.caption(f"Coalesced LLM calls: {_sf['coalesced']} of {_sf['leaders'] + _sf['coalesced']} ({_sf['coalesced_rate']:.0%})")
+                _ps = provider_stats()
+                for _name, _h in _ps.get("providers", {}).items():
+                    _p95 = f"{_h['p95_ms']:.0f} ms" if _h["p95_ms"] is not None else "n/a"
+                    st.caption(
+                        f"LLM provider {_name}: circuit {_h['state']} · {_h['calls']} calls, "
+                        f"{_h['errors']} errors, {_h['trips']} trips · p95 {_p95}"
+                    )
+                if _ps:
+                    st.caption(f"Hedged requests: {_ps['hedges']} ({_ps['hedge_wins']} won by the backup) · failovers: {_ps['failovers']}")
+                _rl = rate_limit_stats()
+                st.caption(
+                    f"LLM rate limiter ({_rl['backend']}): {_rl['granted']} calls, {_rl['waited']} queued "
+                    f"({_rl['wait_s']:.1f}s total) · batch deferrals {_rl['batch_deferred']} · 429 cool-downs {_rl['cool_downs']}"
+                )
     st.markdown("#### Notes / audit trail")
     st.text(record.get("notes", "") or "—")
 
@@ -1,32 +1,51 @@
 import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import json
 
 try:
-    from pymongo import MongoClient, ASCENDING, DESCENDING
+    from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
     from pymongo.collection import Collection
+    from pymongo.errors import DuplicateKeyError
     HAS_MONGO = True
 except ImportError:
     HAS_MONGO = False
+    Collection = Any
 
 # Configuration
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("MONGO_DB_NAME", "fttp_audit_db")
 COLLECTION_NAME = os.getenv("MONGO_COLLECTION_NAME", "requests")
 ROI_COLLECTION_NAME = os.getenv("MONGO_ROI_COLLECTION", "roi_history")
+LLM_CALLS_COLLECTION_NAME = os.getenv("MONGO_LLM_CALLS_COLLECTION", "llm_calls")
+LLM_USAGE_COLLECTION_NAME = os.getenv("MONGO_LLM_USAGE_COLLECTION", "llm_usage_daily")
+KPI_COLLECTION_NAME = os.getenv("MONGO_KPI_COLLECTION", "kpi_daily")
 STRICT_MONGO = os.getenv("STRICT_MONGO", "0").strip() == "1"
+# Convert legacy ISO-string timestamps to BSON datetimes on first connection (off by default:
+# run `python audit_store.py migrate-timestamps` once instead).
+MONGO_AUTO_MIGRATE = os.getenv("MONGO_AUTO_MIGRATE", "0").strip() == "1"
+# "auto": MongoDB when reachable, else the embedded SQLite store; "local": SQLite only.
+AUDIT_BACKEND = os.getenv("AUDIT_BACKEND", "auto").strip().lower()
+AUDIT_LOCAL_DB = os.getenv("AUDIT_LOCAL_DB", "audit_store.sqlite3")
+# After a failed connect, wait this long before trying MongoDB again (each try can block ~2s).
+MONGO_RETRY_S = float(os.getenv("MONGO_RETRY_S", "30"))
 
 _client = None
 _db = None
 _collection = None
+_mongo_retry_at = 0.0
 
 def _get_collection() -> Optional[Collection]:
-    global _client, _db, _collection
-    if not HAS_MONGO:
+    global _client, _db, _collection, _mongo_retry_at
+    if not HAS_MONGO or AUDIT_BACKEND == "local":
         return None
     
     if _collection is None:
+        if time.monotonic() < _mongo_retry_at:
+            return None
         try:
             _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
             _db = _client[DB_NAME]
@@ -34,16 +53,387 @@ def _get_collection() -> Optional[Collection]:
             
             # Ensure indexes
             _collection.create_index([("request_id", ASCENDING)], unique=True)
-            _collection.create_index([("created_at", DESCENDING)])
-            _collection.create_index([("status", ASCENDING)])
+            # Compound (filter, created_at, request_id) indexes serve the Audit Log's keyset pages.
+            _collection.create_index([("created_at", DESCENDING), ("request_id", DESCENDING)])
+            _collection.create_index([("status", ASCENDING), ("created_at", DESCENDING), ("request_id", DESCENDING)])
+            _collection.create_index([("input_json.priority", ASCENDING), ("created_at", DESCENDING), ("request_id", DESCENDING)])
+            _collection.create_index([("site_ref", ASCENDING), ("created_at", DESCENDING), ("request_id", DESCENDING)])
+            _collection.create_index([("priority_rank", ASCENDING), ("created_at", DESCENDING), ("request_id", DESCENDING)])
+            _collection.create_index([("display_cost", ASCENDING), ("created_at", DESCENDING), ("request_id", DESCENDING)])
             _collection.create_index([("approved_at", DESCENDING)])
+            if _collection.find_one({"created_at": {"$type": "string"}}, {"_id": 1}):
+                if MONGO_AUTO_MIGRATE:
+                    print(f"Migrating audit timestamps to datetimes: {migrate_timestamps(_collection)}")
+                else:
+                    print("Audit log has ISO-string timestamps; run `python audit_store.py migrate-timestamps`.")
+            if _collection.find_one({"priority_rank": {"$exists": False}}, {"_id": 1}):
+                if MONGO_AUTO_MIGRATE:
+                    print(f"Backfilling Audit Log sort/filter fields: {backfill_list_fields(_collection)}")
+                else:
+                    print("Audit log predates display_cost/priority_rank; run `python audit_store.py backfill-list-fields`.")
+            _start_sync_back()
         except Exception as e:
             print(f"MongoDB connection error: {e}")
             if STRICT_MONGO:
                 raise
+            if _client is not None:
+                _client.close()
+            _client = _db = _collection = None
+            _mongo_retry_at = time.monotonic() + MONGO_RETRY_S
             return None
     return _collection
 
+def _json_safe(obj):
+    # Helper for serialization
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    if hasattr(obj, "model_dump"):
+         return obj.model_dump()
+    if hasattr(obj, "dict"):
+         return obj.dict()
+    return str(obj)
+
+
+def _clean(obj: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return json.loads(json.dumps(obj, default=_json_safe))
+    except Exception:
+        return obj
+
+
+def _now() -> datetime:
+    """Current time at BSON precision (ms), so KPI deltas match the stored timestamps exactly."""
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _iso(value):
+    """Timestamps are stored as datetimes but returned as ISO strings (the public shape)."""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Audit Log "Priority" ordering; anything else sorts after Normal.
+_PRIORITY_RANK = {"Critical": 0, "High": 1, "Normal": 2}
+
+
+def _list_fields(inputs: Optional[Dict[str, Any]], outputs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Top-level copies of what the Audit Log filters and sorts on, written with every input/output change.
+
+    ``display_cost`` is the cost the Audit Log shows: the approved override,
+    else the pipeline's final cost, else its total.
+    """
+    out = outputs or {}
+    cost = out.get("approved_final_cost")
+    if cost is None:
+        cost = out.get("final_cost", out.get("total_cost"))
+    try:
+        cost = float(cost) if cost is not None else None
+    except (TypeError, ValueError):
+        cost = None
+    return {"display_cost": cost, "priority_rank": _PRIORITY_RANK.get(str((inputs or {}).get("priority") or ""), 3)}
+
+
+# --------------------------------------------------------------------------
+# Embedded SQLite store
+# --------------------------------------------------------------------------
+# Used whenever MongoDB is unavailable (or AUDIT_BACKEND=local). Each request
+# is kept as its Mongo-shaped document (ISO-string timestamps) plus indexed
+# columns for the fields the list pages and analytics filter on, so every
+# public function below returns the same shapes from either backend. WAL mode
+# lets several Streamlit workers and batch jobs share the file.
+
+_LOCAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    request_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    site_ref TEXT,
+    priority TEXT,
+    final_cost REAL,
+    approved_at TEXT,
+    doc TEXT NOT NULL,
+    display_cost REAL,
+    priority_rank INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_requests_created ON requests(created_at, request_id);
+CREATE INDEX IF NOT EXISTS idx_requests_status ON requests(status, created_at, request_id);
+CREATE INDEX IF NOT EXISTS idx_requests_priority ON requests(priority, created_at, request_id);
+CREATE INDEX IF NOT EXISTS idx_requests_site ON requests(site_ref, created_at, request_id);
+-- Covers the analytics window queries (named with INDEXED BY), which then never read documents.
+CREATE INDEX IF NOT EXISTS idx_requests_window ON requests(created_at, status, final_cost, approved_at);
+CREATE TABLE IF NOT EXISTS roi_history (
+    date TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS llm_calls (
+    ts TEXT NOT NULL,
+    request_id TEXT,
+    agent TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls(ts);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_request ON llm_calls(request_id);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_agent ON llm_calls(agent, ts);
+CREATE TABLE IF NOT EXISTS llm_usage_daily (
+    date TEXT NOT NULL,
+    agent TEXT NOT NULL,
+    model TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value NUMERIC NOT NULL,
+    PRIMARY KEY (date, agent, model, field)
+);
+-- Requests written here while AUDIT_BACKEND=auto could not reach MongoDB; see sync_local_to_mongo.
+CREATE TABLE IF NOT EXISTS mongo_pending (
+    request_id TEXT PRIMARY KEY,
+    queued_at REAL NOT NULL
+);
+"""
+# Created after _local_add_list_columns, so stores from before these columns get them first.
+_LOCAL_LIST_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_requests_rank ON requests(priority_rank, created_at DESC, request_id DESC);
+CREATE INDEX IF NOT EXISTS idx_requests_cost ON requests(display_cost, created_at, request_id);
+"""
+# Bound parameters per IN (...) query, well under SQLite's variable limit.
+_LOCAL_CHUNK = 500
+_local = threading.local()
+_local_init_lock = threading.Lock()
+_local_initialized = set()
+
+
+def _local_conn() -> sqlite3.Connection:
+    """This thread's connection to the embedded audit database."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == AUDIT_LOCAL_DB:
+        return conn
+    conn = sqlite3.connect(AUDIT_LOCAL_DB, timeout=10.0, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=10000")
+    with _local_init_lock:
+        if AUDIT_LOCAL_DB not in _local_initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_LOCAL_SCHEMA)
+            _local_add_list_columns(conn)
+            _local_initialized.add(AUDIT_LOCAL_DB)
+            _import_legacy_json(conn)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+    _local.path = AUDIT_LOCAL_DB
+    return conn
+
+
+def _local_add_list_columns(conn: sqlite3.Connection) -> None:
+    """Add and backfill the Audit Log sort/filter columns on a store created before they existed."""
+    have = {r[1] for r in conn.execute("PRAGMA table_info(requests)")}
+    if not {"display_cost", "priority_rank"} <= have:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for column, kind in (("display_cost", "REAL"), ("priority_rank", "INTEGER")):
+                if column not in have:
+                    conn.execute(f"ALTER TABLE requests ADD COLUMN {column} {kind}")
+            docs = [json.loads(raw) for (raw,) in conn.execute("SELECT doc FROM requests")]
+            _local_put(conn, docs)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    conn.executescript(_LOCAL_LIST_INDEXES)
+
+
+def _local_row(doc: Dict[str, Any]) -> Tuple:
+    inp = doc.get("input_json") or {}
+    listed = _list_fields(inp, doc.get("output_json"))
+    return (
+        doc["request_id"],
+        _iso(doc.get("created_at")) or "",
+        (doc.get("status") or "DRAFT").upper(),
+        doc.get("site_ref"),
+        inp.get("priority"),
+        _final_cost(doc.get("output_json")),
+        _iso(doc.get("approved_at")),
+        json.dumps(doc, default=_json_safe),
+        listed["display_cost"],
+        listed["priority_rank"],
+    )
+
+
+def _local_put(conn: sqlite3.Connection, docs: List[Dict[str, Any]]) -> None:
+    # An upsert (not REPLACE) keeps each row's rowid, so open scans never see a row twice.
+    conn.executemany(
+        "INSERT INTO requests(request_id, created_at, status, site_ref, priority, final_cost, approved_at, doc, "
+        "display_cost, priority_rank) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(request_id) DO UPDATE SET "
+        "created_at = excluded.created_at, status = excluded.status, site_ref = excluded.site_ref, "
+        "priority = excluded.priority, final_cost = excluded.final_cost, approved_at = excluded.approved_at, "
+        "doc = excluded.doc, display_cost = excluded.display_cost, priority_rank = excluded.priority_rank",
+        [_local_row(d) for d in docs],
+    )
+
+
+def _local_get(conn: sqlite3.Connection, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(ids), _LOCAL_CHUNK):
+        chunk = ids[i:i + _LOCAL_CHUNK]
+        rows = conn.execute(
+            f"SELECT doc FROM requests WHERE request_id IN ({','.join('?' * len(chunk))})", chunk
+        )
+        for (raw,) in rows:
+            doc = json.loads(raw)
+            out[doc["request_id"]] = doc
+    return out
+
+
+def _local_find(
+    where: str = "", params: Tuple = (), limit: Optional[int] = None, order: str = "created_at DESC, request_id DESC"
+) -> List[Dict[str, Any]]:
+    """Request documents matching ``where``, newest first unless ``order`` says otherwise."""
+    sql = "SELECT doc FROM requests"
+    if where:
+        sql += f" WHERE {where}"
+    sql += f" ORDER BY {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (*params, int(limit))
+    return [json.loads(raw) for (raw,) in _local_conn().execute(sql, params)]
+
+
+def _local_apply(updates: Dict[str, Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]]) -> List[Tuple[Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """Read-modify-write requests in one transaction.
+
+    Each function gets the stored document (None if missing) and returns the
+    new document, or None to leave it alone. Returns the (before, after)
+    pairs that were written.
+    """
+    conn = _local_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = _local_get(conn, list(updates))
+        pairs = []
+        for rid, fn in updates.items():
+            after = fn(current.get(rid))
+            if after is not None:
+                pairs.append((current.get(rid), after))
+        _local_put(conn, [after for _, after in pairs])
+        if HAS_MONGO and AUDIT_BACKEND != "local":
+            # MongoDB was unreachable: remember these for sync_local_to_mongo once it is back.
+            queued = time.time()
+            conn.executemany(
+                "INSERT INTO mongo_pending(request_id, queued_at) VALUES (?, ?) "
+                "ON CONFLICT(request_id) DO UPDATE SET queued_at = excluded.queued_at",
+                [(after["request_id"], queued) for _, after in pairs],
+            )
+        conn.execute("COMMIT")
+        return pairs
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _import_legacy_json(conn: sqlite3.Connection, path: str = "audit_store.json") -> None:
+    """One-off import of the old write-only JSON fallback into an empty store."""
+    if not os.path.exists(path) or conn.execute("SELECT 1 FROM requests LIMIT 1").fetchone():
+        return
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        docs = [d for d in data.values() if isinstance(d, dict) and d.get("request_id")]
+        conn.execute("BEGIN IMMEDIATE")
+        _local_put(conn, docs)
+        conn.execute("COMMIT")
+        print(f"Imported {len(docs)} requests from {path} into {AUDIT_LOCAL_DB}")
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        print(f"Legacy audit import failed: {e}")
+
+
+_sync_lock = threading.Lock()
+
+
+def sync_local_to_mongo(batch_size: int = 500) -> int:
+    """Copy requests written to the embedded store during a MongoDB outage back to MongoDB.
+
+    A request is copied only if MongoDB has no copy or an older one (by
+    updated_at), so edits made in MongoDB meanwhile win; the KPI rollups
+    move by the same delta. Runs in the background whenever MongoDB
+    (re)connects. Returns the number of requests copied.
+    """
+    col = _get_collection()
+    if col is None or not os.path.exists(AUDIT_LOCAL_DB) or not _sync_lock.acquire(blocking=False):
+        return 0
+    try:
+        conn = _local_conn()
+        copied = 0
+        seen = set()
+        while True:
+            rows = conn.execute(
+                "SELECT request_id, queued_at FROM mongo_pending ORDER BY queued_at LIMIT ?", (int(batch_size),)
+            ).fetchall()
+            rows = [r for r in rows if r not in seen]
+            if not rows:
+                return copied
+            seen.update(rows)
+            docs = _local_get(conn, [rid for rid, _ in rows])
+            pairs, settled = [], []
+            try:
+                for rid, queued in rows:
+                    doc = {k: v for k, v in (docs.get(rid) or {}).items() if k != "_id"}
+                    if doc:
+                        for f in _TIMESTAMP_FIELDS:
+                            if isinstance(doc.get(f), str):
+                                doc[f] = _to_datetime(doc[f]) or doc[f]
+                        created = doc.pop("created_at", None)
+                        newer = [{"updated_at": {"$exists": False}}]
+                        if isinstance(doc.get("updated_at"), datetime):
+                            newer.append({"updated_at": {"$lt": doc["updated_at"]}})
+                        try:
+                            before = col.find_one_and_update(
+                                {"request_id": rid, "$or": newer},
+                                {"$set": {**doc, **_list_fields(doc.get("input_json"), doc.get("output_json"))},
+                                 "$setOnInsert": {"created_at": created}},
+                                projection=_KPI_PROJECTION,
+                                upsert=True,
+                                return_document=ReturnDocument.BEFORE,
+                            )
+                            pairs.append((before, {**doc, "created_at": (before or {}).get("created_at", created)}))
+                            copied += 1
+                        except DuplicateKeyError:
+                            pass  # MongoDB already holds a newer version
+                    settled.append((rid, queued))
+            finally:
+                # Even if MongoDB drops mid-batch, account for and dequeue what was copied.
+                try:
+                    _apply_kpi_deltas(pairs)
+                except Exception as e:
+                    print(f"KPI rollup update failed: {e}")
+                # A row re-queued by a write since it was read has a newer queued_at and stays pending.
+                conn.executemany("DELETE FROM mongo_pending WHERE request_id = ? AND queued_at = ?", settled)
+    finally:
+        _sync_lock.release()
+
+
+def _start_sync_back() -> None:
+    # Never create the embedded store just to look for pending writes.
+    if not os.path.exists(AUDIT_LOCAL_DB):
+        return
+
+    def _run():
+        try:
+            n = sync_local_to_mongo()
+            if n:
+                print(f"Copied {n} requests written during the MongoDB outage from {AUDIT_LOCAL_DB}")
+        except Exception as e:
+            print(f"Audit sync-back failed: {e}")
+
+    threading.Thread(target=_run, name="audit-sync-back", daemon=True).start()
+
+
+def _local_save(docs: List[Dict[str, Any]], now_iso: str) -> None:
+    _local_apply({
+        d["request_id"]: (lambda old, d=d: {**(old or {}), **d, "created_at": (old or {}).get("created_at", now_iso)})
+        for d in docs
+    })
+    _daily_roi_snapshot()
+
+
 def save_request(
     request_id: str,
     site_ref: str,
@@ -51,92 +441,125 @@ def save_request(
     outputs: Dict[str, Any],
     status: str = "DRAFT",
 ) -> None:
-    # Helper for serialization
-    def _json_safe(obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        if hasattr(obj, "model_dump"):
-             return obj.model_dump()
-        if hasattr(obj, "dict"):
-             return obj.dict()
-        return str(obj)
-
     # Ensure clean dicts
-    try:
-        inputs_safe = json.loads(json.dumps(inputs, default=_json_safe))
-        outputs_safe = json.loads(json.dumps(outputs, default=_json_safe))
-    except Exception:
-        inputs_safe = inputs
-        outputs_safe = outputs
+    inputs_safe = _clean(inputs)
+    outputs_safe = _clean(outputs)
 
     col = _get_collection()
     
     # Mongo Save
     if col is not None:
-        now = datetime.now().isoformat()
-        # Upsert logic
-        existing = col.find_one({"request_id": request_id}, {"created_at": 1})
-        created_at = existing["created_at"] if existing else now
-
+        # Native BSON datetimes, so range queries and pipelines need no string parsing.
+        now = _now()
         doc = {
             "request_id": request_id,
-            "created_at": created_at,
             "site_ref": site_ref,
             "status": status,
             "input_json": inputs_safe,
             "output_json": outputs_safe,
-            "updated_at": now
+            "updated_at": now,
+            **_list_fields(inputs_safe, outputs_safe),
         }
         
         try:
-            col.update_one(
+            # Upsert and read the previous version in one atomic step, so the
+            # KPI rollups move by exactly this save's delta.
+            before = col.find_one_and_update(
                 {"request_id": request_id},
-                {"$set": doc},
-                upsert=True
+                {"$set": doc, "$setOnInsert": {"created_at": now}},
+                projection=_KPI_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
             )
-            # Update daily ROI snapshot (non-blocking)
+            after = {**(before or {"created_at": now}), "status": status, "output_json": outputs_safe}
+            # Update KPI rollups and the daily ROI snapshot (non-blocking)
             try:
-                record_roi_snapshot()
-            except Exception:
-                pass
+                _apply_kpi_deltas([(before, after)])
+            except Exception as e:
+                print(f"KPI rollup update failed: {e}")
+            _daily_roi_snapshot()
             return
         except Exception as e:
             print(f"Mongo save failed: {e}")
             # Fall through to file save if mongo fails
 
-    # File-based Fallback (audit_store.json)
-    try:
-        store_file = "audit_store.json"
-        data = {}
-        if os.path.exists(store_file):
-            with open(store_file, "r") as f:
-                try:
-                    data = json.load(f)
-                except:
-                    data = {}
-        
-        now = datetime.now().isoformat()
-        record = {
-            "request_id": request_id,
-            "created_at": data.get(request_id, {}).get("created_at", now),
-            "site_ref": site_ref,
-            "status": status,
-            "input_json": inputs_safe,
-            "output_json": outputs_safe,
-            "updated_at": now
+    # Embedded store fallback (MongoDB unavailable)
+    now = datetime.now().isoformat()
+    _local_save([{
+        "request_id": request_id,
+        "site_ref": site_ref,
+        "status": status,
+        "input_json": inputs_safe,
+        "output_json": outputs_safe,
+        "updated_at": now,
+    }], now)
+
+def save_requests_bulk(records: List[Dict[str, Any]], chunk_size: int = 500) -> int:
+    """Upsert many requests at once (unordered bulk writes, one transaction on fallback).
+
+    Each record has request_id, site_ref, inputs, outputs and optionally
+    status (default PENDING_REVIEW). Returns the number of records written.
+    """
+    if not records:
+        return 0
+    now = _now()
+    docs = [
+        {
+            "request_id": r["request_id"],
+            "site_ref": r.get("site_ref") or "Unknown",
+            "status": r.get("status") or "PENDING_REVIEW",
+            "input_json": _clean(r.get("inputs") or {}),
+            "output_json": _clean(r.get("outputs") or {}),
+            "updated_at": now,
         }
-        data[request_id] = record
-        
-        with open(store_file, "w") as f:
-            json.dump(data, f, indent=2)
-            
-    except Exception as e:
-        print(f"File save failed: {e}")
-        raise e
+        for r in records
+    ]
+
+    col = _get_collection()
+    if col is not None:
+        try:
+            for i in range(0, len(docs), chunk_size):
+                chunk = docs[i:i + chunk_size]
+                # Previous versions (one query per chunk) for the KPI deltas.
+                before = {
+                    b["request_id"]: b
+                    for b in col.find({"request_id": {"$in": [d["request_id"] for d in chunk]}}, _KPI_PROJECTION)
+                }
+                ops = [
+                    UpdateOne(
+                        {"request_id": d["request_id"]},
+                        {"$set": {**d, **_list_fields(d["input_json"], d["output_json"])}, "$setOnInsert": {"created_at": now}},
+                        upsert=True,
+                    )
+                    for d in chunk
+                ]
+                col.bulk_write(ops, ordered=False)
+                try:
+                    _apply_kpi_deltas([
+                        (before.get(d["request_id"]),
+                         {**before.get(d["request_id"], {"created_at": now}), "status": d["status"], "output_json": d["output_json"]})
+                        for d in chunk
+                    ])
+                except Exception as e:
+                    print(f"KPI rollup update failed: {e}")
+            _daily_roi_snapshot()
+            return len(docs)
+        except Exception as e:
+            print(f"Mongo bulk save failed: {e}")
+            # Fall through to file save if mongo fails
+
+    now_iso = now.isoformat()
+    _local_save([{**d, "updated_at": now_iso} for d in docs], now_iso)
+    return len(docs)
+
 
 def patch_output(request_id: str, patch: Dict[str, Any]) -> None:
     col = _get_collection()
     if col is None:
+        _local_apply({request_id: lambda old: old and {
+            **old, "output_json": {**(old.get("output_json") or {}), **(patch if isinstance(patch, dict) else {})},
+            "updated_at": datetime.now().isoformat(),
+        }})
         return
 
     # MongoDB supports dot notation for nested updates if we knew the structure,
@@ -144,18 +567,22 @@ def patch_output(request_id: str, patch: Dict[str, Any]) -> None:
     # For atomic deep merge we might need a pipeline or fetch-merge-save.
     # Simple fetch-merge-save for now.
     
-    doc = col.find_one({"request_id": request_id}, {"output_json": 1})
+    doc = col.find_one({"request_id": request_id}, {"output_json": 1, "created_at": 1, "status": 1, "approved_at": 1})
     if not doc:
         return
         
-    current_out = doc.get("output_json", {})
+    current_out = dict(doc.get("output_json") or {})
     if isinstance(patch, dict):
         current_out.update(patch)
     
     col.update_one(
         {"request_id": request_id},
-        {"$set": {"output_json": current_out}}
+        {"$set": {"output_json": current_out, "updated_at": _now(), "display_cost": _list_fields(None, current_out)["display_cost"]}}
     )
+    try:
+        _apply_kpi_deltas([(doc, {**doc, "output_json": current_out})])
+    except Exception as e:
+        print(f"KPI rollup update failed: {e}")
 
 def update_status(
     request_id: str,
@@ -164,13 +591,11 @@ def update_status(
     notes: str = "",
 ) -> None:
     col = _get_collection()
-    if col is None:
-        return
-
-    now = datetime.now().isoformat()
+    now = _now()
     status_upper = (status or "").upper().strip()
     
-    update_fields = {"status": status_upper}
+    # updated_at also decides which copy wins when outage writes sync back (sync_local_to_mongo).
+    update_fields = {"status": status_upper, "updated_at": now}
     
     if status_upper in {"REVIEWED", "PENDING_REVIEW"}:
         update_fields["reviewer"] = actor or None
@@ -180,6 +605,15 @@ def update_status(
         update_fields["approved_by"] = actor or None
         update_fields["approved_at"] = now
         
+    if col is None:
+        ts = now.isoformat()
+        local_fields = {k: ts if isinstance(v, datetime) else v for k, v in update_fields.items()}
+        _local_apply({request_id: lambda old: old and {
+            **old, **local_fields,
+            **({"notes": f"{old.get('notes') or ''}\n{notes}".strip()} if notes else {}),
+        }})
+        return
+
     # Append notes logic
     if notes:
         # We can append to a list or simple string concatenation. 
@@ -189,193 +623,685 @@ def update_status(
         new_notes = f"{existing_notes}\n{notes}".strip()
         update_fields["notes"] = new_notes
 
-    col.update_one(
+    before = col.find_one_and_update(
         {"request_id": request_id},
-        {"$set": update_fields}
+        {"$set": update_fields},
+        projection=_KPI_PROJECTION,
+        return_document=ReturnDocument.BEFORE,
     )
+    if before is not None:
+        try:
+            _apply_kpi_deltas([(before, {**before, **update_fields})])
+        except Exception as e:
+            print(f"KPI rollup update failed: {e}")
 
-def get_request(request_id: str) -> Optional[Dict[str, Any]]:
-    col = _get_collection()
-    if col is None:
-        return None
-        
-    doc = col.find_one({"request_id": request_id})
-    if not doc:
-        return None
-        
+def _public_record(doc: Dict[str, Any]) -> Dict[str, Any]:
     return {
         "request_id": doc.get("request_id"),
-        "created_at": doc.get("created_at"),
+        "created_at": _iso(doc.get("created_at")),
         "site_ref": doc.get("site_ref"),
         "status": doc.get("status") or "DRAFT",
         "reviewer": doc.get("reviewer"),
-        "reviewed_at": doc.get("reviewed_at"),
+        "reviewed_at": _iso(doc.get("reviewed_at")),
         "approved_by": doc.get("approved_by"),
-        "approved_at": doc.get("approved_at"),
+        "approved_at": _iso(doc.get("approved_at")),
         "notes": doc.get("notes") or "",
         "inputs": doc.get("input_json") or {},
         "outputs": doc.get("output_json") or {},
     }
 
+def get_request(request_id: str) -> Optional[Dict[str, Any]]:
+    col = _get_collection()
+    if col is None:
+        doc = _local_get(_local_conn(), [request_id]).get(request_id)
+    else:
+        doc = col.find_one({"request_id": request_id})
+    if not doc:
+        return None
+        
+    return _public_record(doc)
+
+def get_requests_many(ids: List[str], projection: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+    """Fetch many requests in one ``$in`` query, keyed by request_id.
+
+    Records have the get_request shape. ``projection`` narrows what is read
+    (e.g. ``{"input_json.latitude": 1}``); fields left out come back empty.
+    Unknown ids are simply missing from the result.
+    """
+    col = _get_collection()
+    ids = list(dict.fromkeys(str(i) for i in ids if i))
+    if not ids:
+        return {}
+    if col is None:
+        return {rid: _public_record(doc) for rid, doc in _local_get(_local_conn(), ids).items()}
+    if projection is not None:
+        projection = {**projection, "request_id": 1, "_id": 0}
+    return {doc["request_id"]: _public_record(doc) for doc in col.find({"request_id": {"$in": ids}}, projection)}
+
+# Everything the Dashboard and Audit Log tables show, so list pages need no per-row lookups.
+_SUMMARY_PROJECTION = {
+    "_id": 0, "request_id": 1, "created_at": 1, "site_ref": 1, "status": 1, "reviewer": 1, "approved_at": 1,
+    "input_json.priority": 1, "input_json.budget_preview": 1, "input_json.budget_estimate": 1,
+    "input_json.latitude": 1, "input_json.longitude": 1,
+    "output_json.approved_final_cost": 1, "output_json.final_cost": 1, "output_json.total_cost": 1,
+    "output_json.build_method": 1,
+}
+
+def _summary_row(d: Dict[str, Any]) -> Dict[str, Any]:
+    inp = d.get("input_json") or {}
+    out = d.get("output_json") or {}
+    return {
+        "request_id": d.get("request_id"),
+        "created_at": _iso(d.get("created_at")),
+        "site_ref": d.get("site_ref"),
+        "status": d.get("status") or "DRAFT",
+        "reviewer": d.get("reviewer"),
+        "approved_at": _iso(d.get("approved_at")),
+        "priority": inp.get("priority", ""),
+        "budget_preview": inp.get("budget_preview", inp.get("budget_estimate")),
+        "final_cost": out.get("final_cost", out.get("total_cost")),
+        "approved_final_cost": out.get("approved_final_cost"),
+        "build_method": out.get("build_method", ""),
+        "latitude": inp.get("latitude"),
+        "longitude": inp.get("longitude"),
+    }
+
 def list_recent(limit: int = 50) -> List[Dict[str, Any]]:
     col = _get_collection()
     if col is None:
-        return []
+        return [_summary_row(d) for d in _local_find(limit=limit)]
         
-    cursor = col.find(
-        {}, 
-        {"request_id": 1, "created_at": 1, "site_ref": 1, "status": 1, "approved_at": 1, "input_json.budget_preview": 1, "output_json.final_cost": 1, "output_json.total_cost": 1, "output_json.budget_estimate": 1}
-    ).sort("created_at", DESCENDING).limit(limit)
-    
-    return [
-        {
-            "request_id": d.get("request_id"),
-            "created_at": d.get("created_at"),
-            "site_ref": d.get("site_ref"),
-            "status": d.get("status") or "DRAFT",
-            "approved_at": d.get("approved_at"),
-            "budget_preview": (d.get("input_json") or {}).get("budget_preview"),
-            "final_cost": (d.get("output_json") or {}).get("final_cost", (d.get("output_json") or {}).get("total_cost")),
-        }
-        for d in cursor
-    ]
+    cursor = col.find({}, _SUMMARY_PROJECTION).sort("created_at", DESCENDING).limit(limit)
+    return [_summary_row(d) for d in cursor]
 
 def list_by_status(status: str, limit: int = 200) -> List[Dict[str, Any]]:
     col = _get_collection()
+    status_upper = (status or "").upper().strip()
     if col is None:
-        return []
+        return [_summary_row(d) for d in _local_find("status = ?", (status_upper,), limit)]
         
-    status_upper = (status or "").upper().strip()
-    cursor = col.find(
-        {"status": status_upper},
-        {"request_id": 1, "created_at": 1, "site_ref": 1, "status": 1, "reviewer": 1, "approved_at": 1}
-    ).sort("created_at", DESCENDING).limit(limit)
-    
-    return [
-        {
-            "request_id": d.get("request_id"),
-            "created_at": d.get("created_at"),
-            "site_ref": d.get("site_ref"),
-            "status": d.get("status") or "DRAFT",
-            "reviewer": d.get("reviewer"),
-            "approved_at": d.get("approved_at"),
-            "budget_preview": (d.get("input_json") or {}).get("budget_preview"),
-            "final_cost": (d.get("output_json") or {}).get("final_cost", (d.get("output_json") or {}).get("total_cost")),
-        }
-        for d in cursor
-    ]
+    cursor = col.find({"status": status_upper}, _SUMMARY_PROJECTION).sort("created_at", DESCENDING).limit(limit)
+    return [_summary_row(d) for d in cursor]
 
-def analytics_last_30_days() -> Dict[str, Any]:
+def _page_bound(value, end: bool = False) -> Optional[datetime]:
+    """A date/datetime/ISO filter bound as a datetime; a bare date as ``end`` covers that whole day."""
+    from datetime import date, timedelta
+    if value is None or value == "":
+        return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value + timedelta(days=1) if end else value, datetime.min.time())
+    return _to_datetime(value)
+
+
+def _encode_page_cursor(row: Dict[str, Any], order: str = "newest") -> str:
+    key = f"{row['created_at']}|{row['request_id']}"
+    if order == "priority":
+        key = f"{_list_fields({'priority': row.get('priority')}, None)['priority_rank']}|{key}"
+    return key
+
+
+def _decode_page_cursor(cursor: str, order: str = "newest") -> Tuple[Optional[int], str, str]:
+    rank = None
+    if order == "priority":
+        head, _, cursor = cursor.partition("|")
+        rank = int(head)
+    created_at, _, request_id = cursor.partition("|")
+    return rank, created_at, request_id
+
+
+def list_requests_page(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    site_ref_prefix: Optional[str] = None,
+    created_from=None,
+    created_to=None,
+    min_cost: Optional[float] = None,
+    max_cost: Optional[float] = None,
+    order: str = "newest",
+) -> Dict[str, Any]:
+    """One page of the Audit Log, filtered server-side.
+
+    ``order="newest"`` pages on (created_at, request_id), newest first;
+    ``order="priority"`` pages on (priority rank, created_at, request_id):
+    Critical, High, Normal, then anything else, newest first within each.
+    Pass the returned ``next_cursor`` back as ``cursor`` (with the same
+    order) for the following page. Pages walk a matching index, so status,
+    priority and created_at filters cost the same at any depth; a site_ref
+    prefix or cost range is a second range on a different key, so those
+    pages cost more the fewer rows match. ``created_to`` is exclusive (a
+    bare date includes that day). The cost range applies to
+    ``display_cost``, the approved cost if set, else the final (or total)
+    cost, as the Audit Log shows it. Rows have the list_recent shape.
+    """
+    limit = max(1, int(limit))
+    order = "priority" if order == "priority" else "newest"
+    status = (status or "").upper().strip() or None
+    after = _decode_page_cursor(cursor, order) if cursor else None
+    start, end = _page_bound(created_from), _page_bound(created_to, end=True)
     col = _get_collection()
+
     if col is None:
-        return {"total_30d": 0, "by_status_30d": {}, "avg_turnaround_hours_approved_30d": None}
-    
-    # Calculate 30 days ago using datetime logic might be complex if we store ISO strings.
-    # For simplicity, we can fetch more and filter in python, OR use string comparison if ISO format.
-    # ISO strings are lexicographically sortable.
-    
-    cutoff = datetime.now() # We need to subtract 30 days properly
-    # But for string comparison, we can just filter by string > cutoff_iso
-    # To be safe on imports, let's just use Python filtering for small datasets, 
-    # but ideally we use mongo query.
-    
-    # Approximate "30 days ago" as ISO string? 
-    # Let's trust Python's datetime subtraction
-    from datetime import timedelta
-    cutoff_dt = datetime.now() - timedelta(days=30)
-    cutoff_iso = cutoff_dt.isoformat()
-    
-    cursor = col.find(
-        {"created_at": {"$gte": cutoff_iso}},
-        {"created_at": 1, "status": 1, "approved_at": 1}
+        where, params = [], []
+        for clause, value in (
+            ("status = ?", status),
+            ("priority = ?", priority or None),
+            ("site_ref >= ?", site_ref_prefix or None),
+            ("site_ref < ?", site_ref_prefix + "\U0010ffff" if site_ref_prefix else None),
+            ("created_at >= ?", start.isoformat() if start else None),
+            ("created_at < ?", end.isoformat() if end else None),
+            ("display_cost >= ?", min_cost),
+            ("display_cost <= ?", max_cost),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        sort = "created_at DESC, request_id DESC"
+        if order == "priority":
+            sort = "priority_rank, " + sort
+            if after:
+                where.append("(priority_rank > ? OR (priority_rank = ? AND (created_at, request_id) < (?, ?)))")
+                params.extend([after[0], after[0], after[1], after[2]])
+        elif after:
+            where.append("(created_at, request_id) < (?, ?)")
+            params.extend(after[1:])
+        docs = _local_find(" AND ".join(where), tuple(params), limit + 1, order=sort)
+    else:
+        import re
+        query: Dict[str, Any] = {}
+        if status:
+            query["status"] = status
+        if priority:
+            query["input_json.priority"] = priority
+        if site_ref_prefix:
+            query["site_ref"] = {"$regex": f"^{re.escape(site_ref_prefix)}"}
+        if start or end:
+            query["created_at"] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+        if min_cost is not None or max_cost is not None:
+            query["display_cost"] = {
+                **({"$gte": float(min_cost)} if min_cost is not None else {}),
+                **({"$lte": float(max_cost)} if max_cost is not None else {}),
+            }
+        sort = [("created_at", DESCENDING), ("request_id", DESCENDING)]
+        if after:
+            rank, created, rid = after[0], _to_datetime(after[1]), after[2]
+            later = [{"created_at": {"$lt": created}}, {"created_at": created, "request_id": {"$lt": rid}}]
+            if order == "priority":
+                later = [{"priority_rank": {"$gt": rank}}] + [{"priority_rank": rank, **k} for k in later]
+            query = {"$and": [query, {"$or": later}]}
+        if order == "priority":
+            sort = [("priority_rank", ASCENDING)] + sort
+        docs = list(col.find(query, _SUMMARY_PROJECTION).sort(sort).limit(limit + 1))
+
+    rows = [_summary_row(d) for d in docs[:limit]]
+    return {"items": rows, "next_cursor": _encode_page_cursor(rows[-1], order) if len(docs) > limit else None}
+
+
+def iter_request_batches(
+    batch_size: int = 5000,
+    projection: Optional[Dict[str, Any]] = None,
+    query: Optional[Dict[str, Any]] = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Stream raw request documents in lists of ``batch_size``.
+
+    Uses a server-side cursor, so memory stays bounded by one batch no matter
+    how many requests are stored. Default projection is request_id + input_json.
+    """
+    col = _get_collection()
+    if col is None:
+        yield from _local_batches(batch_size, query)
+        return
+    if projection is None:
+        projection = {"_id": 0, "request_id": 1, "input_json": 1}
+    cursor = col.find(query or {}, projection).batch_size(batch_size)
+    batch: List[Dict[str, Any]] = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _local_batches(batch_size: int, query: Optional[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    # Keyset scan on the primary key: no long-lived cursor, so callers may write between batches.
+    # Only top-level equality queries are supported here.
+    conn = _local_conn()
+    last = ""
+    while True:
+        rows = conn.execute(
+            "SELECT request_id, doc FROM requests WHERE request_id > ? ORDER BY request_id LIMIT ?", (last, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        last = rows[-1][0]
+        batch = [json.loads(raw) for _, raw in rows]
+        if query:
+            batch = [d for d in batch if all(d.get(k) == v for k, v in query.items())]
+        if batch:
+            yield batch
+
+
+def bulk_set_fields(updates: List[Tuple[str, Dict[str, Any]]], chunk_size: int = 1000) -> int:
+    """Apply ``$set`` updates for many request_ids with unordered bulk writes.
+
+    ``updates`` is a list of (request_id, fields) pairs. Returns the number of
+    modified documents.
+    """
+    col = _get_collection()
+    if not updates:
+        return 0
+    if col is None:
+        return len(_local_apply({rid: (lambda old, f=fields: old and {**old, **f}) for rid, fields in updates}))
+    modified = 0
+    for i in range(0, len(updates), chunk_size):
+        ops = [UpdateOne({"request_id": rid}, {"$set": fields}) for rid, fields in updates[i:i + chunk_size]]
+        res = col.bulk_write(ops, ordered=False)
+        modified += res.modified_count
+    return modified
+
+
+_TIMESTAMP_FIELDS = ("created_at", "updated_at", "reviewed_at", "approved_at")
+
+
+def migrate_timestamps(
+    col: Optional[Collection] = None,
+    batch_size: int = 1000,
+    limit: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
+    """Rewrite ISO-string timestamps as BSON datetimes (idempotent).
+
+    Only documents that still hold a string in one of the timestamp fields
+    are touched, so a run stopped early (or capped with ``limit`` documents)
+    resumes where it left off. ``progress`` is called with the running
+    document count after each batch. Returns the number of values converted
+    per field.
+    """
+    col = col if col is not None else _get_collection()
+    counts = {f: 0 for f in _TIMESTAMP_FIELDS}
+    if col is None:
+        return counts
+    query = {"$or": [{f: {"$type": "string"}} for f in _TIMESTAMP_FIELDS]}
+    ops = []
+    done = 0
+    cursor = col.find(query, {f: 1 for f in _TIMESTAMP_FIELDS}).batch_size(batch_size)
+    if limit is not None:
+        cursor = cursor.limit(int(limit))
+    for doc in cursor:
+        fields = {}
+        for f in _TIMESTAMP_FIELDS:
+            value = doc.get(f)
+            if isinstance(value, str):
+                dt = _to_datetime(value)
+                if dt is not None:
+                    fields[f] = dt
+                    counts[f] += 1
+        if fields:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        done += 1
+        if len(ops) >= batch_size:
+            col.bulk_write(ops, ordered=False)
+            ops = []
+            if progress is not None:
+                progress(done)
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    if progress is not None:
+        progress(done)
+    return counts
+
+
+def backfill_list_fields(
+    col: Optional[Collection] = None,
+    batch_size: int = 1000,
+    limit: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Set display_cost and priority_rank on requests saved before they existed (idempotent, resumable).
+
+    Returns the number of documents updated.
+    """
+    col = col if col is not None else _get_collection()
+    if col is None:
+        return 0
+    projection = {"input_json.priority": 1, "output_json.approved_final_cost": 1,
+                  "output_json.final_cost": 1, "output_json.total_cost": 1}
+    cursor = col.find({"priority_rank": {"$exists": False}}, projection).batch_size(batch_size)
+    if limit is not None:
+        cursor = cursor.limit(int(limit))
+    ops, done = [], 0
+    for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": _list_fields(doc.get("input_json"), doc.get("output_json"))}))
+        done += 1
+        if len(ops) >= batch_size:
+            col.bulk_write(ops, ordered=False)
+            ops = []
+            if progress is not None:
+                progress(done)
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    if progress is not None:
+        progress(done)
+    return done
+
+
+# Aggregation expressions shared by the analytics pipelines and the KPI rebuild.
+_STATUS_EXPR = {"$toUpper": {"$ifNull": ["$status", "DRAFT"]}}
+_COST_EXPR = {"$convert": {
+    "input": {"$ifNull": ["$output_json.final_cost", {"$ifNull": ["$output_json.total_cost", "$output_json.base_cost"]}]},
+    "to": "double", "onError": None, "onNull": None,
+}}
+_TURNAROUND_HOURS_EXPR = {"$cond": [
+    {"$and": [{"$eq": [{"$type": "$approved_at"}, "date"]}, {"$eq": [{"$type": "$created_at"}, "date"]}]},
+    {"$divide": [{"$subtract": ["$approved_at", "$created_at"]}, 3600000.0]},
+    None,
+]}
+
+
+# SQLite equivalents for the embedded store (created_at/approved_at are ISO strings).
+_LOCAL_TURNAROUND_SQL = "(julianday(approved_at) - julianday(created_at)) * 24.0"
+
+
+def _local_status_totals(cutoff: str) -> List[Dict[str, Any]]:
+    """Per-status request counts, cost sums and turnaround sums for requests created since ``cutoff``."""
+    rows = _local_conn().execute(
+        "SELECT status, COUNT(*), SUM(final_cost), COUNT(final_cost), "
+        f"SUM({_LOCAL_TURNAROUND_SQL}), COUNT({_LOCAL_TURNAROUND_SQL}) "
+        "FROM requests INDEXED BY idx_requests_window WHERE created_at >= ? GROUP BY status",
+        (cutoff,),
     )
-    
-    rows = list(cursor)
-    total = len(rows)
-    by_status = {}
-    turnaround_hours = []
-    
-    for d in rows:
-        st = (d.get("status") or "DRAFT").upper()
-        by_status[st] = by_status.get(st, 0) + 1
-        
-        c_str = d.get("created_at")
-        a_str = d.get("approved_at")
-        
-        if c_str and a_str:
-            try:
-                c = datetime.fromisoformat(c_str)
-                a = datetime.fromisoformat(a_str)
-                turnaround_hours.append((a - c).total_seconds() / 3600.0)
-            except Exception:
-                pass
-                
-    avg_tat = sum(turnaround_hours) / len(turnaround_hours) if turnaround_hours else None
-    
-    return {
-        "total_30d": total,
-        "by_status_30d": by_status,
-        "avg_turnaround_hours_approved_30d": avg_tat,
-    }
+    keys = ("status", "requests", "cost_sum", "cost_count", "turnaround_hours_sum", "turnaround_count")
+    return [dict(zip(keys, r)) for r in rows]
 
-def roi_observed_metrics(days: int = 30) -> Dict[str, Any]:
+
+def _window_match(days: int) -> Dict[str, Any]:
+    from datetime import timedelta
+    return {"$match": {"created_at": {"$gte": datetime.now() - timedelta(days=days)}}}
+
+
+def turnaround_percentiles(days: int = 30, percentiles: Tuple[float, ...] = (0.5, 0.9, 0.95)) -> Dict[str, Any]:
+    """Approval turnaround (hours) percentiles for requests created in the last ``days``.
+
+    Computed server-side with $percentile (MongoDB 7+); older servers stream
+    just the per-request hours back and the percentiles are taken here.
+    """
     col = _get_collection()
+    out: Dict[str, Any] = {"count": 0, "avg": None, **{f"p{int(p * 100)}": None for p in percentiles}}
     if col is None:
-         return {
-            "period_days": days,
-            "requests": 0,
-            "estimated_requests_per_month": 0,
-            "by_status": {},
-            "avg_turnaround_hours_approved": None,
-            "avg_final_cost": None,
-        }
+        from datetime import timedelta
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+        hours = [h for (h,) in _local_conn().execute(
+            f"SELECT {_LOCAL_TURNAROUND_SQL} AS h FROM requests INDEXED BY idx_requests_window "
+            "WHERE created_at >= ? AND approved_at IS NOT NULL ORDER BY h", (cutoff,)
+        ) if h is not None]
+        if hours:
+            out.update({"count": len(hours), "avg": sum(hours) / len(hours)})
+            out.update({f"p{int(p * 100)}": hours[min(len(hours) - 1, int(p * len(hours)))] for p in percentiles})
+        return out
+    base = [
+        _window_match(days),
+        {"$project": {"_id": 0, "h": _TURNAROUND_HOURS_EXPR}},
+        {"$match": {"h": {"$ne": None}}},
+    ]
+    try:
+        rows = list(col.aggregate(base + [{"$group": {
+            "_id": None, "count": {"$sum": 1}, "avg": {"$avg": "$h"},
+            "p": {"$percentile": {"input": "$h", "p": list(percentiles), "method": "approximate"}},
+        }}]))
+        if rows:
+            out.update({"count": rows[0]["count"], "avg": rows[0]["avg"]})
+            out.update({f"p{int(p * 100)}": v for p, v in zip(percentiles, rows[0]["p"])})
+        return out
+    except Exception:
+        pass
+    hours = sorted(r["h"] for r in col.aggregate(base))
+    if hours:
+        out.update({"count": len(hours), "avg": sum(hours) / len(hours)})
+        out.update({f"p{int(p * 100)}": hours[min(len(hours) - 1, int(p * len(hours)))] for p in percentiles})
+    return out
 
+
+# --------------------------------------------------------------------------
+# KPI rollups
+# --------------------------------------------------------------------------
+# One document per creation day holds counters for the requests created that
+# day: how many, how many currently sit in each status, cost sums and
+# turnaround sums for approved requests. Every write applies the difference
+# between a request's contribution before and after it ($inc), so analytics
+# read at most ``days`` small documents instead of rescanning requests.
+#
+# Seeding an existing database is claimed through a marker document (no
+# ``date``, so window reads never see it): one process rebuilds while the
+# others skip their deltas, and the marker only flips to "done" after a
+# successful rebuild, so a failed seed is retried.
+
+_KPI_SEED_ID = "_seed"
+# A seed still "building" after this long belongs to a dead process and may be taken over.
+KPI_SEED_STALE_S = 600.0
+_KPI_PROJECTION = {
+    "_id": 0, "request_id": 1, "created_at": 1, "status": 1, "approved_at": 1,
+    "output_json.final_cost": 1, "output_json.total_cost": 1, "output_json.base_cost": 1,
+}
+_kpi_checked = False
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    # Stored timestamps are naive local time; fold any offset into that.
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def _final_cost(out: Optional[Dict[str, Any]]) -> Optional[float]:
+    out = out or {}
+    fc = out.get("final_cost", out.get("total_cost", out.get("base_cost")))
+    try:
+        return float(fc) if fc is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _kpi_contribution(doc: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Dict[str, float]]:
+    """(creation day, counters) that one request adds to the rollups."""
+    if not doc:
+        return None, {}
+    created = _to_datetime(doc.get("created_at"))
+    if created is None:
+        return None, {}
+    fields: Dict[str, float] = {"requests": 1, f"by_status.{(doc.get('status') or 'DRAFT').upper()}": 1}
+    cost = _final_cost(doc.get("output_json"))
+    if cost is not None:
+        fields["cost_sum"] = cost
+        fields["cost_count"] = 1
+    approved = _to_datetime(doc.get("approved_at"))
+    if approved is not None:
+        fields["turnaround_hours_sum"] = (approved - created).total_seconds() / 3600.0
+        fields["turnaround_count"] = 1
+    return created.date().isoformat(), fields
+
+
+def _kpi_incs(pairs: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> Dict[str, Dict[str, float]]:
+    incs: Dict[str, Dict[str, float]] = {}
+    for before, after in pairs:
+        for doc, sign in ((before, -1), (after, 1)):
+            day, fields = _kpi_contribution(doc)
+            if day is None:
+                continue
+            inc = incs.setdefault(day, {})
+            for k, v in fields.items():
+                inc[k] = inc.get(k, 0) + sign * v
+    return {day: {k: v for k, v in inc.items() if v} for day, inc in incs.items()}
+
+
+def _seed_kpi_rollups(col: Collection, kpi: Collection) -> str:
+    """Build the rollups once per database: "ready", "seeded", or "busy" (another process is seeding)."""
     from datetime import timedelta
-    cutoff_dt = datetime.now() - timedelta(days=days)
-    cutoff_iso = cutoff_dt.isoformat()
-    
-    cursor = col.find(
-        {"created_at": {"$gte": cutoff_iso}},
-        {"created_at": 1, "status": 1, "approved_at": 1, "output_json": 1}
+    marker = kpi.find_one({"_id": _KPI_SEED_ID})
+    if marker is not None and marker.get("state") == "done":
+        return "ready"
+    now = _now()
+    if marker is None:
+        if kpi.estimated_document_count() > 0 or col.estimated_document_count() == 0:
+            # Rollups predating the marker, or nothing to count yet: deltas alone are exact.
+            kpi.update_one({"_id": _KPI_SEED_ID}, {"$set": {"state": "done", "at": now}}, upsert=True)
+            return "ready"
+        try:
+            kpi.insert_one({"_id": _KPI_SEED_ID, "state": "building", "at": now})
+        except DuplicateKeyError:
+            return "busy"
+    else:
+        stale = isinstance(marker.get("at"), datetime) and marker["at"] < now - timedelta(seconds=KPI_SEED_STALE_S)
+        # Take over a seed left "building" by a process that died; the "at" match makes the claim atomic.
+        if not stale or kpi.find_one_and_update({"_id": _KPI_SEED_ID, "at": marker["at"]}, {"$set": {"at": now}}) is None:
+            return "busy"
+    try:
+        rebuild_kpi_rollups()
+    except Exception:
+        kpi.delete_one({"_id": _KPI_SEED_ID, "at": now})
+        raise
+    kpi.update_one({"_id": _KPI_SEED_ID}, {"$set": {"state": "done", "at": _now()}})
+    return "seeded"
+
+
+def _get_kpi_collection() -> Tuple[Optional[Collection], bool]:
+    """The rollup collection, and whether this write is already covered by a seed rebuild."""
+    global _kpi_checked
+    col = _get_collection()
+    if col is None:
+        return None, False
+    try:
+        kpi = col.database[KPI_COLLECTION_NAME]
+        if _kpi_checked:
+            return kpi, False
+        kpi.create_index([("date", ASCENDING)], unique=True)
+        state = _seed_kpi_rollups(col, kpi)
+        # Only settle once the rollups are complete; until then every write re-checks the marker.
+        _kpi_checked = state != "busy"
+        return kpi, state != "ready"
+    except Exception as e:
+        print(f"MongoDB KPI collection error: {e}")
+        if STRICT_MONGO:
+            raise
+        return None, False
+
+
+def _apply_kpi_deltas(pairs: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> None:
+    """Fold (before, after) request versions into the daily KPI counters."""
+    incs = {day: inc for day, inc in _kpi_incs(pairs).items() if inc}
+    if not incs:
+        return
+    kpi, seeded = _get_kpi_collection()
+    if kpi is None or seeded:
+        return  # a fresh rebuild already counted this write
+    kpi.bulk_write(
+        [UpdateOne({"date": day}, {"$inc": inc}, upsert=True) for day, inc in incs.items()],
+        ordered=False,
     )
-    
-    rows = list(cursor)
-    total = len(rows)
-    by_status = {}
-    turnaround_hours = []
-    final_costs = []
-    
-    for d in rows:
-        st = (d.get("status") or "DRAFT").upper()
-        by_status[st] = by_status.get(st, 0) + 1
-        
-        if d.get("approved_at"):
-            try:
-                c = datetime.fromisoformat(d.get("created_at"))
-                a = datetime.fromisoformat(d.get("approved_at"))
-                turnaround_hours.append((a - c).total_seconds() / 3600.0)
-            except Exception:
-                pass
-        
-        out = d.get("output_json") or {}
-        fc = out.get("final_cost", out.get("total_cost", out.get("base_cost")))
-        if fc is not None:
-            try:
-                final_costs.append(float(fc))
-            except:
-                pass
 
-    avg_tat = sum(turnaround_hours) / len(turnaround_hours) if turnaround_hours else None
-    avg_final_cost = sum(final_costs) / len(final_costs) if final_costs else None
-    est_monthly_volume = round(total * (30.0 / max(1.0, float(days))))
-    
+
+def rebuild_kpi_rollups() -> int:
+    """Recompute the KPI rollups from the requests collection with one aggregation.
+
+    Used to seed the rollups for existing data and to repair drift (run it
+    while nothing else writes: deltas applied mid-rebuild are lost). Returns
+    the number of requests counted.
+    """
+    col = _get_collection()
+    if col is None:
+        return 0
+    kpi = col.database[KPI_COLLECTION_NAME]
+    rows = col.aggregate([
+        {"$match": {"created_at": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}, "status": _STATUS_EXPR},
+            "requests": {"$sum": 1},
+            "cost_sum": {"$sum": _COST_EXPR},
+            "cost_count": {"$sum": {"$cond": [{"$eq": [_COST_EXPR, None]}, 0, 1]}},
+            "turnaround_hours_sum": {"$sum": _TURNAROUND_HOURS_EXPR},
+            "turnaround_count": {"$sum": {"$cond": [{"$eq": [_TURNAROUND_HOURS_EXPR, None]}, 0, 1]}},
+        }},
+    ], allowDiskUse=True)
+    days: Dict[str, Dict[str, Any]] = {}
+    counted = 0
+    for r in rows:
+        day = days.setdefault(r["_id"]["day"], {"date": r["_id"]["day"], "by_status": {}, "requests": 0, "cost_sum": 0.0,
+                                                 "cost_count": 0, "turnaround_hours_sum": 0.0, "turnaround_count": 0})
+        day["by_status"][r["_id"]["status"]] = r["requests"]
+        for k in ("requests", "cost_sum", "cost_count", "turnaround_hours_sum", "turnaround_count"):
+            day[k] += r.get(k) or 0
+        counted += r["requests"]
+    kpi.delete_many({"_id": {"$ne": _KPI_SEED_ID}})
+    if days:
+        kpi.insert_many(list(days.values()), ordered=False)
+    return counted
+
+
+def _nest(fields: Dict[str, float]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for k, v in fields.items():
+        head, _, tail = k.partition(".")
+        if tail:
+            out.setdefault(head, {})[tail] = v
+        else:
+            out[k] = v
+    return out
+
+
+def kpi_window(days: int = 30) -> Dict[str, Any]:
+    """Sum the daily KPI counters for requests created in the last ``days``.
+
+    The embedded store has no rollups; its created_at index makes the
+    equivalent GROUP BY over the window cheap.
+    """
+    totals: Dict[str, Any] = {"requests": 0, "by_status": {}, "cost_sum": 0.0, "cost_count": 0,
+                              "turnaround_hours_sum": 0.0, "turnaround_count": 0}
+    from datetime import timedelta
+    cutoff = (datetime.now() - timedelta(days=days)).date().isoformat()
+    if _get_collection() is None:
+        docs = [{**r, "by_status": {r["status"]: r["requests"]}} for r in _local_status_totals(cutoff)]
+    else:
+        kpi, _ = _get_kpi_collection()
+        if kpi is None:
+            return totals
+        docs = kpi.find({"date": {"$gte": cutoff}}, {"_id": 0})
+    for d in docs:
+        for k in ("requests", "cost_sum", "cost_count", "turnaround_hours_sum", "turnaround_count"):
+            totals[k] += d.get(k, 0) or 0
+        for st, n in (d.get("by_status") or {}).items():
+            totals["by_status"][st] = totals["by_status"].get(st, 0) + n
+    totals["by_status"] = {st: int(n) for st, n in totals["by_status"].items() if n}
+    return totals
+
+
+def analytics_last_30_days() -> Dict[str, Any]:
+    k = kpi_window(30)
+    tat = turnaround_percentiles(30)
+    return {
+        "total_30d": int(k["requests"]),
+        "by_status_30d": k["by_status"],
+        "avg_turnaround_hours_approved_30d": k["turnaround_hours_sum"] / k["turnaround_count"] if k["turnaround_count"] else None,
+        "p50_turnaround_hours_approved_30d": tat.get("p50"),
+        "p90_turnaround_hours_approved_30d": tat.get("p90"),
+    }
+
+def roi_observed_metrics(days: int = 30) -> Dict[str, Any]:
+    k = kpi_window(days)
+    total = int(k["requests"])
     return {
         "period_days": days,
         "requests": total,
-        "estimated_requests_per_month": est_monthly_volume,
-        "by_status": by_status,
-        "avg_turnaround_hours_approved": avg_tat,
-        "avg_final_cost": avg_final_cost,
+        "estimated_requests_per_month": round(total * (30.0 / max(1.0, float(days)))),
+        "by_status": k["by_status"],
+        "avg_turnaround_hours_approved": k["turnaround_hours_sum"] / k["turnaround_count"] if k["turnaround_count"] else None,
+        "avg_final_cost": k["cost_sum"] / k["cost_count"] if k["cost_count"] else None,
     }
 
 
@@ -398,24 +1324,243 @@ def _get_roi_collection() -> Optional[Collection]:
 
 def record_roi_snapshot(date_iso: Optional[str] = None) -> None:
     """Upsert a daily snapshot of observed metrics (for ROI/history)."""
-    roi_col = _get_roi_collection()
-    if roi_col is None:
+    local = _get_collection() is None
+    roi_col = None if local else _get_roi_collection()
+    if roi_col is None and not local:
         return
     from datetime import date
     today = date.today().isoformat() if not date_iso else date_iso
-    # Use observed metrics for last 30 days, plus today's counts if needed
+    # Built from the KPI rollups (a handful of small documents), not a rescan.
     obs = roi_observed_metrics(days=30)
-    now = datetime.now().isoformat()
+    now = datetime.now()
     doc = {
         "date": today,
         "created_at": now,
         "observed_30d": obs,
     }
+    if local:
+        _local_conn().execute(
+            "INSERT OR REPLACE INTO roi_history(date, doc) VALUES (?, ?)", (today, json.dumps(doc, default=_json_safe))
+        )
+        return
     roi_col.update_one({"date": today}, {"$set": doc}, upsert=True)
 
+# (backend, day) of the last snapshot this process wrote; see _daily_roi_snapshot.
+_roi_snapshot_key: Optional[Tuple[bool, str]] = None
+
+
+def _daily_roi_snapshot() -> None:
+    """Write paths record at most one ROI snapshot per day (and backend); list_roi_snapshots refreshes it."""
+    global _roi_snapshot_key
+    from datetime import date
+    key = (_get_collection() is None, date.today().isoformat())
+    if key == _roi_snapshot_key:
+        return
+    try:
+        record_roi_snapshot()
+        _roi_snapshot_key = key
+    except Exception as e:
+        print(f"ROI snapshot failed: {e}")
+
+
 def list_roi_snapshots(limit: int = 90) -> List[Dict[str, Any]]:
+    """Newest-first daily snapshots; today's is recomputed first so the history ends at current figures."""
+    try:
+        record_roi_snapshot()
+    except Exception as e:
+        print(f"ROI snapshot failed: {e}")
+    if _get_collection() is None:
+        rows = _local_conn().execute("SELECT doc FROM roi_history ORDER BY date DESC LIMIT ?", (int(limit),))
+        return [json.loads(raw) for (raw,) in rows]
     roi_col = _get_roi_collection()
     if roi_col is None:
         return []
     cursor = roi_col.find({}, {"_id": 0}).sort("date", DESCENDING).limit(limit)
-    return list(cursor)
+    return [{**d, "created_at": _iso(d.get("created_at"))} for d in cursor]
+
+
+def _get_llm_collections() -> Tuple[Optional[Collection], Optional[Collection]]:
+    """Raw per-call LLM records and their per-day rollups (see llm_metrics)."""
+    col = _get_collection()
+    if col is None:
+        return None, None
+    try:
+        db = col.database
+        calls = db[LLM_CALLS_COLLECTION_NAME]
+        usage = db[LLM_USAGE_COLLECTION_NAME]
+        calls.create_index([("ts", DESCENDING)])
+        calls.create_index([("request_id", ASCENDING)])
+        calls.create_index([("agent", ASCENDING), ("ts", DESCENDING)])
+        usage.create_index([("date", ASCENDING), ("agent", ASCENDING), ("model", ASCENDING)], unique=True)
+        return calls, usage
+    except Exception as e:
+        print(f"MongoDB LLM usage collection error: {e}")
+        if STRICT_MONGO:
+            raise
+        return None, None
+
+
+def record_llm_calls(records: List[Dict[str, Any]]) -> int:
+    """Store per-call LLM records and fold them into the per-day rollups.
+
+    Rollup documents are keyed on (date, agent, model) and only ever
+    incremented, so dashboards read a handful of small documents instead of
+    scanning raw calls.
+    """
+    if not records:
+        return 0
+    local = _get_collection() is None
+    calls, usage = (None, None) if local else _get_llm_collections()
+    if calls is None and not local:
+        return 0
+
+    rollups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for r in records:
+        inc = rollups.setdefault((r["date"], r["agent"], r["model"]), {})
+        for field, value in (
+            ("calls", 1),
+            ("errors", int(r.get("status") != "ok")),
+            ("cache_hits", int(r.get("cache") in ("hit", "coalesced"))),
+            ("provider_calls", int(r.get("cache") in ("miss", "bypass"))),
+            ("prompt_tokens", int(r.get("prompt_tokens", 0))),
+            ("completion_tokens", int(r.get("completion_tokens", 0))),
+            ("retries", int(r.get("retries", 0))),
+            ("cost_usd", float(r.get("cost_usd", 0.0))),
+            ("latency_ms_sum", float(r.get("latency_ms", 0.0))),
+            (f"latency_hist.{r.get('latency_bucket', 'unknown')}", 1),
+        ):
+            inc[field] = inc.get(field, 0) + value
+    if local:
+        conn = _local_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO llm_calls(ts, request_id, agent, doc) VALUES (?, ?, ?, ?)",
+                [(r.get("ts"), r.get("request_id"), r.get("agent"), json.dumps(r, default=_json_safe)) for r in records],
+            )
+            conn.executemany(
+                "INSERT INTO llm_usage_daily(date, agent, model, field, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(date, agent, model, field) DO UPDATE SET value = value + excluded.value",
+                [(d, a, m, f, v) for (d, a, m), inc in rollups.items() for f, v in inc.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(records)
+    calls.insert_many([dict(r) for r in records], ordered=False)
+    ops = [
+        UpdateOne({"date": d, "agent": a, "model": m}, {"$inc": inc}, upsert=True)
+        for (d, a, m), inc in rollups.items()
+    ]
+    usage.bulk_write(ops, ordered=False)
+    return len(records)
+
+
+def llm_usage_summary(days: int = 30) -> Dict[str, Any]:
+    """Per-day and per-agent LLM totals plus a latency histogram for the last ``days``."""
+    empty = {"by_day": [], "by_agent": {}, "latency_hist": {}, "totals": {}}
+    from datetime import timedelta
+    cutoff = (datetime.now() - timedelta(days=days)).date().isoformat()
+    if _get_collection() is None:
+        # One counter row per (date, agent, model, field); regroup into the rollup document shape.
+        grouped: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        for d, a, m, f, v in _local_conn().execute(
+            "SELECT date, agent, model, field, value FROM llm_usage_daily WHERE date >= ?", (cutoff,)
+        ):
+            grouped.setdefault((d, a, m), {})[f] = v
+        docs = [{"date": d, "agent": a, "model": m, **_nest(f)} for (d, a, m), f in grouped.items()]
+    else:
+        _, usage = _get_llm_collections()
+        if usage is None:
+            return empty
+        docs = list(usage.find({"date": {"$gte": cutoff}}, {"_id": 0}))
+    if not docs:
+        return empty
+
+    fields = ["calls", "errors", "cache_hits", "provider_calls", "prompt_tokens", "completion_tokens", "retries", "cost_usd", "latency_ms_sum"]
+    by_day: Dict[str, Dict[str, Any]] = {}
+    by_agent: Dict[str, Dict[str, Any]] = {}
+    hist: Dict[str, int] = {}
+    for d in docs:
+        for bucket, target in ((d["date"], by_day), (d["agent"], by_agent)):
+            row = target.setdefault(bucket, {k: 0 for k in fields})
+            for k in fields:
+                row[k] += d.get(k, 0) or 0
+        for b, n in (d.get("latency_hist") or {}).items():
+            hist[b] = hist.get(b, 0) + int(n)
+    for row in list(by_day.values()) + list(by_agent.values()):
+        row["avg_latency_ms"] = row.pop("latency_ms_sum") / row["calls"] if row["calls"] else 0.0
+    totals = {k: sum(r[k] for r in by_agent.values()) for k in fields if k != "latency_ms_sum"}
+    return {
+        "by_day": [{"date": k, **v} for k, v in sorted(by_day.items())],
+        "by_agent": by_agent,
+        "latency_hist": hist,
+        "totals": totals,
+    }
+
+
+def list_llm_calls(request_id: Optional[str] = None, agent: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    if _get_collection() is None:
+        where, params = [], []
+        if request_id:
+            where.append("request_id = ?")
+            params.append(request_id)
+        if agent:
+            where.append("agent = ?")
+            params.append(agent)
+        sql = "SELECT doc FROM llm_calls" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY ts DESC LIMIT ?"
+        return [json.loads(raw) for (raw,) in _local_conn().execute(sql, (*params, int(limit)))]
+    calls, _ = _get_llm_collections()
+    if calls is None:
+        return []
+    query: Dict[str, Any] = {}
+    if request_id:
+        query["request_id"] = request_id
+    if agent:
+        query["agent"] = agent
+    return list(calls.find(query, {"_id": 0}).sort("ts", DESCENDING).limit(limit))
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Audit store maintenance (MongoDB backend).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate-timestamps", help="Convert legacy ISO-string timestamps to BSON datetimes")
+    mig.add_argument("--batch-size", type=int, default=1000)
+    mig.add_argument("--limit", type=int, default=None, help="Stop after this many documents (re-run to continue)")
+    fill = sub.add_parser("backfill-list-fields", help="Add the Audit Log sort/filter fields to older requests")
+    fill.add_argument("--batch-size", type=int, default=1000)
+    fill.add_argument("--limit", type=int, default=None, help="Stop after this many documents (re-run to continue)")
+    sub.add_parser("rebuild-kpis", help="Recompute the daily KPI rollups from the requests")
+    sub.add_parser("sync-local", help="Copy requests saved locally during a MongoDB outage to MongoDB")
+    args = parser.parse_args(argv)
+
+    col = _get_collection()
+    if col is None:
+        print("MongoDB is not reachable (check MONGO_URI); nothing to do.")
+        return 1
+    if args.command == "migrate-timestamps":
+        counts = migrate_timestamps(
+            col, batch_size=args.batch_size, limit=args.limit,
+            progress=lambda n: print(f"[migrate] {n:,} documents", flush=True),
+        )
+        print(json.dumps(counts, indent=2))
+    elif args.command == "backfill-list-fields":
+        n = backfill_list_fields(
+            col, batch_size=args.batch_size, limit=args.limit,
+            progress=lambda n: print(f"[backfill] {n:,} documents", flush=True),
+        )
+        print(f"Updated {n:,} requests")
+    elif args.command == "sync-local":
+        print(f"Copied {sync_local_to_mongo():,} requests from {AUDIT_LOCAL_DB}")
+    else:
+        print(f"Counted {rebuild_kpi_rollups():,} requests into {KPI_COLLECTION_NAME}")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Rate-limited batch runs of the full agentic pipeline.
+
+Runs graph.execute_agent over many sites with bounded concurrency. Every
+LLM call is paced by llm_ratelimit's shared per-model limiter (LLM_RPM /
+LLM_TPM) at batch priority, so a large batch uses the Groq/OpenAI quota
+without tripping 429s and interactive sessions keep headroom while it runs.
+Failed sites are retried with exponential backoff and full jitter;
+results are persisted to audit_store in bulk. A site where any LLM stage
+fell back to placeholder output counts as failed and is not saved.
+
+Usage:
+    python batch_runner.py sites.csv --report batch_results.csv
+    python batch_runner.py sites.parquet --concurrency 8
+    python batch_runner.py sites.csv --mode deterministic --no-persist
+
+Input columns match the Network Assessment form: distance, premises,
+build_type, terrain, traffic, contractor, priority and optionally site_ref.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from audit_store import save_requests_bulk
+from graph import execute_agent
+from llm_metrics import flush as flush_llm_metrics
+from llm_ratelimit import priority
+from portfolio_costing import iter_site_chunks
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+DEFAULT_RETRIES = 3
+DEFAULT_FLUSH_EVERY = 50
+BACKOFF_BASE_S = 2.0
+BACKOFF_CAP_S = 60.0
+
+SITE_FIELDS = ["distance", "premises", "build_type", "terrain", "traffic", "contractor", "priority", "site_ref"]
+REPORT_COLUMNS = ["request_id", "site_ref", "status", "attempts", "build_method", "final_cost", "validation", "error"]
+
+
+class DegradedResult(RuntimeError):
+    """execute_agent fell back to placeholders for at least one LLM stage."""
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries out so workers do not retry in lockstep.
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+
+def _site_state(row: Dict[str, Any]) -> Dict[str, Any]:
+    state = {k: v for k, v in row.items() if not (isinstance(v, float) and v != v)}
+    state["distance"] = float(state.get("distance", 0) or 0)
+    state["premises"] = int(float(state.get("premises", 0) or 0))
+    state["build_type"] = str(state.get("build_type") or "Urban")
+    state["terrain"] = str(state.get("terrain") or "Normal")
+    state["traffic"] = str(state.get("traffic") or state.get("traffic_mgmt") or "Standard")
+    state["site_ref"] = str(state.get("site_ref") or "Unknown")
+    return state
+
+
+def iter_sites(path: str, chunksize: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Yield one site dict per row of a CSV/Parquet site list."""
+    for df in iter_site_chunks(path, chunksize=chunksize):
+        for row in df.to_dict(orient="records"):
+            yield row
+
+
+def _run_site(
+    site: Dict[str, Any],
+    mode: str,
+    retries: int,
+) -> Dict[str, Any]:
+    attempts = 0
+    while True:
+        attempts += 1
+        state = _site_state(site)
+        inputs = dict(state)
+        try:
+            # Batch calls yield to interactive Network Assessment calls in the shared LLM limiter,
+            # which paces each call and cools the model down after a 429.
+            with priority("batch"):
+                result = execute_agent(state, mode=mode)
+            degraded = result.get("degraded_stages") or {}
+            if degraded:
+                # execute_agent swallows LLM errors into placeholders; never save those as results.
+                raise DegradedResult("; ".join(f"{stage}: {err}" for stage, err in degraded.items()))
+            return {"ok": True, "attempts": attempts, "inputs": inputs, "result": result}
+        except Exception as e:
+            if attempts > retries:
+                return {"ok": False, "attempts": attempts, "inputs": inputs, "error": str(e)}
+            time.sleep(_backoff(attempts))
+
+
+def run_batch(
+    sites: Iterable[Dict[str, Any]],
+    mode: str = "agentic",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    retries: int = DEFAULT_RETRIES,
+    persist: bool = True,
+    flush_every: int = DEFAULT_FLUSH_EVERY,
+    status: str = "PENDING_REVIEW",
+    report_path: Optional[str] = None,
+    progress: bool = True,
+) -> Dict[str, Any]:
+    """Run execute_agent for every site and persist results in bulk.
+
+    At most ``2 * concurrency`` sites are in flight, so ``sites`` may be a
+    lazy iterator of any length. LLM pacing comes from the shared
+    llm_ratelimit limiter, not from this function. Returns a summary with counts and failures.
+    """
+    concurrency = max(1, int(concurrency))
+    started = time.perf_counter()
+    done = succeeded = failed = persisted = 0
+    failures: List[Dict[str, Any]] = []
+    pending_saves: List[Dict[str, Any]] = []
+    header = True
+
+    def _flush() -> None:
+        nonlocal persisted
+        if persist and pending_saves:
+            try:
+                persisted += save_requests_bulk(pending_saves)
+            except Exception as e:
+                print(f"[batch] bulk save failed: {e}", file=sys.stderr)
+        pending_saves.clear()
+
+    def _collect(outcome: Dict[str, Any]) -> None:
+        nonlocal done, succeeded, failed, header
+        done += 1
+        inputs = outcome["inputs"]
+        row = {"site_ref": inputs.get("site_ref"), "attempts": outcome["attempts"]}
+        if outcome["ok"]:
+            succeeded += 1
+            result = outcome["result"]
+            pending_saves.append({
+                "request_id": result["request_id"],
+                "site_ref": inputs.get("site_ref"),
+                "inputs": inputs,
+                "outputs": result,
+                "status": status,
+            })
+            row.update({
+                "request_id": result["request_id"],
+                "status": "ok",
+                "build_method": result.get("build_method"),
+                "final_cost": result.get("final_cost"),
+                "validation": result.get("validation"),
+            })
+            if len(pending_saves) >= flush_every:
+                _flush()
+        else:
+            failed += 1
+            failures.append({"site_ref": inputs.get("site_ref"), "error": outcome["error"]})
+            row.update({"status": "failed", "error": outcome["error"]})
+        if report_path:
+            pd.DataFrame([row], columns=REPORT_COLUMNS).to_csv(
+                report_path, mode="w" if header else "a", header=header, index=False
+            )
+            header = False
+        if progress:
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed * 60.0 if elapsed > 0 else 0.0
+            print(f"[batch] {done:,} sites ({succeeded:,} ok, {failed:,} failed, {rate:,.1f}/min)", file=sys.stderr)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-site") as pool:
+        in_flight = set()
+        for site in sites:
+            in_flight.add(pool.submit(_run_site, site, mode, retries))
+            if len(in_flight) >= 2 * concurrency:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    _collect(fut.result())
+        for fut in in_flight:
+            _collect(fut.result())
+    _flush()
+    # The metrics writer is a daemon thread; push its backlog before a CLI run exits.
+    flush_llm_metrics()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "sites": done,
+        "succeeded": succeeded,
+        "failed": failed,
+        "persisted": persisted,
+        "failures": failures,
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "sites_per_min": done / elapsed * 60.0 if elapsed > 0 else 0.0,
+        "report": report_path,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the FTTP agentic pipeline over a site list.")
+    parser.add_argument("input", help="Site list (.csv or .parquet)")
+    parser.add_argument("--mode", choices=["agentic", "deterministic"], default="agentic")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Sites in progress at once")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--status", default="PENDING_REVIEW", help="Audit status for saved requests")
+    parser.add_argument("--report", default=None, help="Per-site result CSV to write")
+    parser.add_argument("--no-persist", action="store_true", help="Do not save results to the audit store")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        iter_sites(args.input),
+        mode=args.mode,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        persist=not args.no_persist,
+        status=args.status,
+        report_path=args.report,
+        progress=not args.quiet,
+    )
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
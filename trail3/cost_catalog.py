@@ -1,8 +1,17 @@
+import hashlib
 import json
 import os
-from typing import Any, Dict
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional, Tuple
 
 CATALOG_FILE = os.getenv("COST_CATALOG_FILE", "cost_catalog.json")
+CATALOG_VERSIONS_DIR = os.getenv("COST_CATALOG_VERSIONS_DIR", "cost_catalog_versions")
+
+# Minimum seconds between os.stat() checks of CATALOG_FILE on the hot path.
+# 0 means "check on every lookup" (still only a stat, never a re-parse).
+CATALOG_CHECK_INTERVAL_S = float(os.getenv("COST_CATALOG_CHECK_INTERVAL_S", "1.0"))
 
 
 def load_catalog() -> Dict[str, Any]:
@@ -13,8 +22,12 @@ def load_catalog() -> Dict[str, Any]:
 
 
 def save_catalog(catalog: Dict[str, Any]) -> None:
-    with open(CATALOG_FILE, "w", encoding="utf-8") as f:
-        json.dump(catalog, f, indent=2)
+    # Write to a sibling temp file and rename so readers never see a half-written catalog.
+    tmp_path = f"{CATALOG_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, CATALOG_FILE)
+    invalidate_catalog_cache()
 
 
 def get_unit_cost(catalog: Dict[str, Any], key: str, default: float) -> float:
@@ -23,3 +36,195 @@ def get_unit_cost(catalog: Dict[str, Any], key: str, default: float) -> float:
 
 def get_uplift(catalog: Dict[str, Any], category: str, key: str, default: float = 1.0) -> float:
     return float(catalog.get("uplifts", {}).get(category, {}).get(key, default))
+
+
+# -----------------------------
+# Compiled (process-wide) catalog
+# -----------------------------
+@dataclass(frozen=True)
+class CompiledCatalog:
+    """Immutable snapshot of the cost catalog with pre-resolved lookups.
+
+    Unit costs and uplifts are flattened to plain float dicts so the costing
+    hot path never walks the raw JSON structure.
+    """
+
+    version: str
+    currency: str
+    unit_costs: Dict[str, float]
+    uplifts: Dict[Tuple[str, str], float]
+    uplift_tables: Dict[str, Dict[str, float]]
+    raw: Dict[str, Any] = field(repr=False)
+    sha256: str = ""
+    mtime_ns: int = 0
+    size: int = 0
+
+    def unit_cost(self, key: str, default: float) -> float:
+        return self.unit_costs.get(key, float(default))
+
+    def uplift(self, category: str, key: str, default: float = 1.0) -> float:
+        return self.uplifts.get((category, key), float(default))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.raw.get(key, default)
+
+
+def compile_catalog(catalog: Dict[str, Any], sha256: str = "", mtime_ns: int = 0, size: int = 0) -> CompiledCatalog:
+    unit_costs: Dict[str, float] = {}
+    for k, v in (catalog.get("unit_costs") or {}).items():
+        try:
+            unit_costs[str(k)] = float(v)
+        except (TypeError, ValueError):
+            continue
+
+    uplifts: Dict[Tuple[str, str], float] = {}
+    tables: Dict[str, Dict[str, float]] = {}
+    for category, table in (catalog.get("uplifts") or {}).items():
+        if not isinstance(table, dict):
+            continue
+        resolved: Dict[str, float] = {}
+        for k, v in table.items():
+            try:
+                resolved[str(k)] = float(v)
+            except (TypeError, ValueError):
+                continue
+        tables[str(category)] = resolved
+        for k, v in resolved.items():
+            uplifts[(str(category), k)] = v
+
+    return CompiledCatalog(
+        version=str(catalog.get("version", "unknown")),
+        currency=str(catalog.get("currency", "")),
+        unit_costs=unit_costs,
+        uplifts=uplifts,
+        uplift_tables=tables,
+        raw=catalog,
+        sha256=sha256,
+        mtime_ns=mtime_ns,
+        size=size,
+    )
+
+
+_lock = threading.Lock()
+_snapshot: Optional[CompiledCatalog] = None
+_last_check = float("-inf")
+_stats = {"loads": 0, "reloads": 0, "unchanged_reloads": 0, "hits": 0, "stat_checks": 0}
+
+
+def _read_and_compile(st: os.stat_result) -> CompiledCatalog:
+    with open(CATALOG_FILE, "rb") as f:
+        payload = f.read()
+    catalog = json.loads(payload.decode("utf-8"))
+    return compile_catalog(
+        catalog,
+        sha256=hashlib.sha256(payload).hexdigest(),
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+    )
+
+
+def get_compiled_catalog() -> CompiledCatalog:
+    """Return the current compiled catalog, reloading only if the file changed.
+
+    The file is re-read only when its mtime/size differ from the active
+    snapshot; if the content hash is unchanged the snapshot is kept. Swaps are
+    atomic: callers always see either the old or the new snapshot.
+    """
+    global _snapshot, _last_check
+
+    snap = _snapshot
+    now = time.monotonic()
+    if snap is not None and (now - _last_check) < CATALOG_CHECK_INTERVAL_S:
+        _stats["hits"] += 1
+        return snap
+
+    with _lock:
+        snap = _snapshot
+        _stats["stat_checks"] += 1
+        try:
+            st = os.stat(CATALOG_FILE)
+        except FileNotFoundError:
+            if snap is not None:
+                # Keep serving the last good snapshot if the file vanishes mid-upload.
+                _last_check = now
+                _stats["hits"] += 1
+                return snap
+            raise FileNotFoundError(f"Cost catalog not found: {CATALOG_FILE}")
+
+        if snap is not None and snap.mtime_ns == st.st_mtime_ns and snap.size == st.st_size:
+            _last_check = now
+            _stats["hits"] += 1
+            return snap
+
+        try:
+            fresh = _read_and_compile(st)
+        except ValueError:
+            if snap is None:
+                raise
+            # Malformed JSON: keep serving the last good snapshot.
+            _last_check = now
+            return snap
+
+        if snap is None:
+            _stats["loads"] += 1
+        elif fresh.sha256 == snap.sha256:
+            _stats["unchanged_reloads"] += 1
+            fresh = replace(snap, mtime_ns=fresh.mtime_ns, size=fresh.size)
+        else:
+            _stats["reloads"] += 1
+        _snapshot = fresh
+        _last_check = now
+        return fresh
+
+
+def load_catalog_version(path: Optional[str] = None) -> CompiledCatalog:
+    """Compile a specific catalog file (e.g. a snapshot in CATALOG_VERSIONS_DIR).
+
+    ``None`` or ``"current"`` returns the active compiled catalog. Snapshots are
+    read directly and are not cached.
+    """
+    if not path or path == "current":
+        return get_compiled_catalog()
+    if not os.path.exists(path) and os.path.exists(os.path.join(CATALOG_VERSIONS_DIR, path)):
+        path = os.path.join(CATALOG_VERSIONS_DIR, path)
+    with open(path, "rb") as f:
+        payload = f.read()
+    st = os.stat(path)
+    return compile_catalog(
+        json.loads(payload.decode("utf-8")),
+        sha256=hashlib.sha256(payload).hexdigest(),
+        mtime_ns=st.st_mtime_ns,
+        size=st.st_size,
+    )
+
+
+def list_catalog_versions() -> List[str]:
+    """Snapshot files written by the Admin Cost Catalog uploader, oldest first."""
+    if not os.path.isdir(CATALOG_VERSIONS_DIR):
+        return []
+    return sorted(
+        os.path.join(CATALOG_VERSIONS_DIR, name)
+        for name in os.listdir(CATALOG_VERSIONS_DIR)
+        if name.endswith(".json")
+    )
+
+
+def invalidate_catalog_cache() -> None:
+    """Force the next lookup to re-check the catalog file (e.g. after an upload)."""
+    global _snapshot, _last_check
+    with _lock:
+        _last_check = float("-inf")
+        if _snapshot is not None:
+            # Drop the stat signature so a same-second rewrite is still detected;
+            # the content hash decides whether a real swap happens.
+            _snapshot = replace(_snapshot, mtime_ns=-1)
+
+
+def catalog_stats() -> Dict[str, Any]:
+    """Load/hit counters for the compiled catalog (for diagnostics)."""
+    snap = _snapshot
+    out: Dict[str, Any] = dict(_stats)
+    out["version"] = snap.version if snap else None
+    out["sha256"] = snap.sha256 if snap else None
+    out["file"] = CATALOG_FILE
+    return out
@@ -24,42 +24,46 @@
 
 #     return CostBreakdown(trench, fibre, labour, equipment, overhead, contingency, total)
 
+# Simple productivity model (can be upgraded later)
+LABOUR_PRODUCTIVITY_M_PER_DAY = 50.0
+
+# Build method nuance (lightweight): underground has higher civils; overhead lower.
+TRENCH_MULTIPLIERS = {
+    "underground": 1.15,
+    "overhead": 0.65,
+}
+
+
 def compute_cost(state):
     """Compute base cost using the centralized cost catalog.
 
     This replaces hard-coded unit rates (previously embedded in code) so costs are
-    consistent, versioned, and auditable.
+    consistent, versioned, and auditable. The catalog is served from the
+    process-wide compiled snapshot, so no file I/O happens per call.
     """
 
-    from cost_catalog import load_catalog, get_unit_cost, get_uplift
+    from cost_catalog import get_compiled_catalog
 
-    catalog = load_catalog()
+    catalog = get_compiled_catalog()
 
-    fibre_material_per_m = get_unit_cost(catalog, "fibre_material_per_m", 8.0)
-    trench_civil_per_m = get_unit_cost(catalog, "trench_civils_per_m", 25.0)
-    labour_rate_per_day = get_unit_cost(catalog, "labour_rate_per_day", float(state.get("labour_rate", 500.0)))
-    equipment_per_premise = get_unit_cost(catalog, "equipment_per_premise", 2000.0)
+    fibre_material_per_m = catalog.unit_cost("fibre_material_per_m", 8.0)
+    trench_civil_per_m = catalog.unit_cost("trench_civils_per_m", 25.0)
+    labour_rate_per_day = catalog.unit_cost("labour_rate_per_day", float(state.get("labour_rate", 500.0)))
+    equipment_per_premise = catalog.unit_cost("equipment_per_premise", 2000.0)
 
-    # Simple productivity model (can be upgraded later)
-    labour_productivity_m_per_day = 50.0
+    labour_productivity_m_per_day = LABOUR_PRODUCTIVITY_M_PER_DAY
 
     # Uplifts
     location_key = (state.get("build_type") or "").lower().replace("_", "-")
     terrain_key = (state.get("terrain") or "").lower()
     traffic_key = (state.get("traffic") or "").lower()
-    uplift_location = get_uplift(catalog, "location_type", location_key, 1.0)
-    uplift_terrain = get_uplift(catalog, "terrain_type", terrain_key, 1.0)
-    uplift_traffic = get_uplift(catalog, "traffic_management", traffic_key, 1.0)
+    uplift_location = catalog.uplift("location_type", location_key, 1.0)
+    uplift_terrain = catalog.uplift("terrain_type", terrain_key, 1.0)
+    uplift_traffic = catalog.uplift("traffic_management", traffic_key, 1.0)
     uplift = uplift_location * uplift_terrain * uplift_traffic
 
-    # Apply build method nuance (lightweight): underground has higher civils; overhead lower.
     build_method = (state.get("build_method") or "").lower()
-    if build_method == "underground":
-        trench_multiplier = 1.15
-    elif build_method == "overhead":
-        trench_multiplier = 0.65
-    else:
-        trench_multiplier = 1.00
+    trench_multiplier = TRENCH_MULTIPLIERS.get(build_method, 1.00)
 
     fibre_cost = state["fibre_distance_m"] * fibre_material_per_m * uplift
     trench_cost = state["trench_length_m"] * trench_civil_per_m * trench_multiplier * uplift
@@ -77,7 +81,7 @@ def compute_cost(state):
     )
 
     state["base_cost"] = base_cost
-    state["catalog_version"] = catalog.get("version", "unknown")
+    state["catalog_version"] = catalog.version
     state["uplift_multiplier"] = uplift
 
     state.setdefault("expert_outputs", {})
@@ -99,3 +103,126 @@ def compute_cost(state):
     }
 
     return state
+
+
+# -----------------------------
+# Vectorized batch costing
+# -----------------------------
+BATCH_COST_FIELDS = [
+    "fibre_material_cost",
+    "trench_civil_cost",
+    "labour_days",
+    "labour_cost",
+    "equipment_cost",
+    "base_cost",
+    "cost_per_premise",
+    "uplift_multiplier",
+]
+
+
+def _column(sites, name, n, default=None):
+    """Fetch a column from a DataFrame / mapping as a 1-D numpy array of length n."""
+    import numpy as np
+
+    col = None
+    if sites is not None:
+        try:
+            col = sites[name] if name in sites else None
+        except TypeError:
+            col = None
+    if col is None:
+        if default is None:
+            raise KeyError(f"compute_cost_batch: missing required column '{name}'")
+        return np.full(n, default, dtype=object if isinstance(default, str) else float)
+    arr = np.asarray(col)
+    if arr.ndim == 0:
+        arr = np.full(n, arr.item())
+    return arr
+
+
+def _lookup_vector(values, table, normalize, default=1.0):
+    """Map a column of category labels to floats, resolving each distinct label once."""
+    import numpy as np
+
+    if len(values) <= 256:
+        # Small batches (scenario grids): a plain dict walk beats factorize overhead.
+        resolved = {}
+        out = np.empty(len(values), dtype=float)
+        for i, v in enumerate(values):
+            key = "" if v is None or v != v else str(v)
+            if key not in resolved:
+                resolved[key] = float(table.get(normalize(key), default))
+            out[i] = resolved[key]
+        return out
+
+    import pandas as pd
+
+    codes, uniq = pd.factorize(pd.Series(values, copy=False))
+    lut = np.array([float(table.get(normalize(str(u)), default)) for u in uniq] + [float(default)], dtype=float)
+    # factorize marks missing labels with -1, which indexes the trailing default.
+    return lut[codes]
+
+
+def compute_cost_batch(sites=None, *, catalog=None, **columns):
+    """Vectorized equivalent of compute_cost for many sites at once.
+
+    Accepts a pandas DataFrame or a mapping of column name -> array-like (or
+    keyword columns) with: distance, premises, build_type, terrain, traffic,
+    build_method and optionally labour_rate. Distance is used for both fibre
+    and trench length, as in graph.execute_agent.
+
+    Returns a dict of numpy arrays keyed by BATCH_COST_FIELDS plus
+    ``catalog_version``. Numbers match compute_cost row-for-row. Pass a
+    CompiledCatalog as ``catalog`` to cost against a specific catalog version
+    instead of the active one.
+    """
+    import numpy as np
+    from cost_catalog import get_compiled_catalog
+
+    if columns:
+        sites = {**(dict(sites) if sites is not None else {}), **columns}
+
+    distance = np.asarray(_column(sites, "distance", 0), dtype=float)
+    n = distance.shape[0]
+    premises = np.asarray(_column(sites, "premises", n), dtype=float)
+
+    if catalog is None:
+        catalog = get_compiled_catalog()
+
+    fibre_material_per_m = catalog.unit_cost("fibre_material_per_m", 8.0)
+    trench_civil_per_m = catalog.unit_cost("trench_civils_per_m", 25.0)
+    equipment_per_premise = catalog.unit_cost("equipment_per_premise", 2000.0)
+    if "labour_rate_per_day" in catalog.unit_costs:
+        labour_rate_per_day = np.full(n, catalog.unit_costs["labour_rate_per_day"])
+    else:
+        labour_rate_per_day = np.asarray(_column(sites, "labour_rate", n, 500.0), dtype=float)
+
+    tables = catalog.uplift_tables
+    uplift = (
+        _lookup_vector(_column(sites, "build_type", n, ""), tables.get("location_type", {}), lambda s: s.lower().replace("_", "-"))
+        * _lookup_vector(_column(sites, "terrain", n, ""), tables.get("terrain_type", {}), str.lower)
+        * _lookup_vector(_column(sites, "traffic", n, ""), tables.get("traffic_management", {}), str.lower)
+    )
+    trench_multiplier = _lookup_vector(_column(sites, "build_method", n, ""), TRENCH_MULTIPLIERS, str.lower)
+
+    fibre_cost = distance * fibre_material_per_m * uplift
+    trench_cost = distance * trench_civil_per_m * trench_multiplier * uplift
+    labour_days = distance / LABOUR_PRODUCTIVITY_M_PER_DAY
+    labour_cost = labour_days * labour_rate_per_day * uplift
+    equipment_cost = premises * equipment_per_premise
+    base_cost = fibre_cost + trench_cost + labour_cost + equipment_cost
+
+    cost_per_premise = np.zeros(n, dtype=float)
+    np.divide(base_cost, premises, out=cost_per_premise, where=premises > 0)
+
+    return {
+        "fibre_material_cost": fibre_cost,
+        "trench_civil_cost": trench_cost,
+        "labour_days": labour_days,
+        "labour_cost": labour_cost,
+        "equipment_cost": equipment_cost,
+        "base_cost": base_cost,
+        "cost_per_premise": cost_per_premise,
+        "uplift_multiplier": uplift,
+        "catalog_version": catalog.version,
+    }
@@ -0,0 +1,173 @@
+"""Feature-bucketed cache for build-method decisions.
+
+The build-method agent only reads build_type, terrain, traffic, distance
+and premises. Distance and premises are quantized into buckets (edges are
+configurable), so every site in the same bucket reuses one structured
+decision (build_method, survey_required, assumptions, confidence) instead
+of a fresh LLM round trip.
+
+Invalidation is confidence-aware: decisions below
+DECISION_CACHE_MIN_CONFIDENCE are never cached, and the rest live for
+DECISION_CACHE_TTL_S scaled by their confidence, so shaky decisions are
+re-asked sooner than confident ones.
+
+Rows live in the llm_cache SQLite file, so the cache is shared across
+Streamlit workers and restarts.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_cache import connect
+
+
+def _edges(name: str, default: str) -> List[float]:
+    raw = os.getenv(name, default)
+    return sorted(float(x) for x in raw.split(",") if x.strip())
+
+
+DECISION_CACHE_ENABLED = os.getenv("DECISION_CACHE_ENABLED", "1").strip() == "1"
+DISTANCE_EDGES_M = _edges("DECISION_DISTANCE_EDGES_M", "100,250,500,1000,2000,5000")
+PREMISES_EDGES = _edges("DECISION_PREMISES_EDGES", "5,10,25,50,100,250")
+DECISION_CACHE_TTL_S = float(os.getenv("DECISION_CACHE_TTL_S", str(30 * 24 * 3600)))
+DECISION_CACHE_MIN_CONFIDENCE = float(os.getenv("DECISION_CACHE_MIN_CONFIDENCE", "0.6"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS build_decisions (
+    bucket TEXT PRIMARY KEY,
+    decision TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_schema_ready = set()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0, "skipped_low_confidence": 0}
+
+
+def _conn() -> sqlite3.Connection:
+    conn = connect()
+    db = conn.execute("PRAGMA database_list").fetchone()[2]
+    if db not in _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready.add(db)
+    return conn
+
+
+def _bucket_label(value: float, edges: List[float]) -> str:
+    i = bisect_right(edges, value)
+    low = edges[i - 1] if i > 0 else 0
+    high = edges[i] if i < len(edges) else None
+    return f"{low:g}+" if high is None else f"{low:g}-{high:g}"
+
+
+def bucket_for(state: Dict[str, Any]) -> Tuple[str, ...]:
+    """The feature bucket a site falls into (the cache key)."""
+    return (
+        str(state.get("build_type") or "").strip().lower(),
+        str(state.get("terrain") or "").strip().lower(),
+        str(state.get("traffic") or "").strip().lower(),
+        _bucket_label(float(state.get("distance", 0) or 0), DISTANCE_EDGES_M),
+        _bucket_label(float(state.get("premises", 0) or 0), PREMISES_EDGES),
+    )
+
+
+def _key(bucket: Tuple[str, ...]) -> str:
+    return "|".join(bucket)
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def lookup(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Cached decision for this site's bucket, or None."""
+    if not DECISION_CACHE_ENABLED:
+        return None
+    key = _key(bucket_for(state))
+    try:
+        conn = _conn()
+        row = conn.execute(
+            "SELECT decision FROM build_decisions WHERE bucket = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            _count("misses")
+            return None
+        conn.execute("UPDATE build_decisions SET hits = hits + 1 WHERE bucket = ?", (key,))
+    except sqlite3.Error as e:
+        print(f"Decision cache read failed: {e}")
+        return None
+    _count("hits")
+    decision = json.loads(row[0])
+    decision["decision_bucket"] = key
+    return decision
+
+
+def store(state: Dict[str, Any], decision: Dict[str, Any]) -> bool:
+    """Cache ``decision`` for this site's bucket if it is confident enough."""
+    if not DECISION_CACHE_ENABLED or not isinstance(decision, dict) or not decision.get("build_method"):
+        return False
+    try:
+        confidence = float(decision.get("confidence", 0) or 0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    if confidence < DECISION_CACHE_MIN_CONFIDENCE:
+        _count("skipped_low_confidence")
+        return False
+    payload = {
+        "build_method": decision.get("build_method"),
+        "survey_required": bool(decision.get("survey_required", False)),
+        "assumptions": list(decision.get("assumptions") or [])[:6],
+        "confidence": confidence,
+    }
+    now = time.time()
+    try:
+        _conn().execute(
+            "INSERT OR REPLACE INTO build_decisions(bucket, decision, confidence, created_at, expires_at, hits) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            (_key(bucket_for(state)), json.dumps(payload), confidence, now, now + DECISION_CACHE_TTL_S * min(confidence, 1.0)),
+        )
+    except sqlite3.Error as e:
+        print(f"Decision cache write failed: {e}")
+        return False
+    _count("stored")
+    return True
+
+
+def invalidate(build_type: Optional[str] = None, terrain: Optional[str] = None) -> int:
+    """Drop cached decisions (all, or those for a build type and/or terrain)."""
+    clauses, params = [], []
+    if build_type:
+        clauses.append("bucket LIKE ?")
+        params.append(f"{build_type.strip().lower()}|%")
+    if terrain:
+        clauses.append("bucket LIKE ?")
+        params.append(f"%|{terrain.strip().lower()}|%")
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = _conn().execute(f"DELETE FROM build_decisions{where}", params)
+    return max(cur.rowcount, 0)
+
+
+def decision_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    lookups = out["hits"] + out["misses"]
+    out["hit_rate"] = out["hits"] / lookups if lookups else 0.0
+    try:
+        out["buckets"] = _conn().execute(
+            "SELECT COUNT(*) FROM build_decisions WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+    except sqlite3.Error:
+        pass
+    return out
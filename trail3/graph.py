@@ -63,135 +63,485 @@ from risk_engine import compute_risk
 from simulation_engine import simulate_network
 from memory_agent import store_memory
 from llm_engine import llm_validate
+from llm_metrics import llm_context
+import time
 import uuid
 from optimization_agent import heuristic_cost_optimizations
 
 
-def execute_agent(state):
+def heuristic_build_decision(state):
+    """Deterministic build-method decision used when the LLM agent is unavailable.
+
+    Returns the same shape as llm_engine.run_build_method_agent.
+    """
+    terrain = str(state.get("terrain") or "").lower()
+    build_type = str(state.get("build_type") or "").lower()
+    if terrain == "rocky" or build_type == "rural":
+        build_method = "Underground"
+    else:
+        build_method = "Hybrid"
+    return {
+        "build_method": build_method,
+        "survey_required": terrain in {"rocky", "water crossing"},
+        "assumptions": ["Build method chosen by heuristic fallback."],
+        "confidence": 0.45,
+    }
+
+
+def _run_build_method_agent(state):
+    # Sites in the same feature bucket reuse one decision (see decision_cache).
+    from decision_cache import lookup, store
+    cached = lookup(state)
+    if cached is not None:
+        return cached
+    from llm_engine import run_build_method_agent
+    decision = run_build_method_agent(state)
+    store(state, decision)
+    return decision
+
+
+class AgentDegraded(RuntimeError):
+    """An agent answered with its placeholder because the LLM call failed."""
+
+
+def _accept(reply):
+    # Raising keeps placeholders out of the stage memo and routes them to the fallback branch.
+    if isinstance(reply, dict) and reply.get("degraded"):
+        raise AgentDegraded(reply["degraded"])
+    return reply
+
+
+def _run_cost_optimization_agent(state):
+    from llm_engine import run_cost_optimization_agent
+    return _accept(run_cost_optimization_agent(state))
+
+
+def _run_risk_agent(state):
+    from llm_engine import run_risk_agent
+    return _accept(run_risk_agent(state))
+
+
+def _run_strategy_agent(state):
+    from llm_engine import run_strategy_agent
+    return run_strategy_agent(state)
+
+
+# execute_agent stage name -> llm_engine combined section
+_COMBINED_STAGES = {
+    "risk_agent": "risk",
+    "cost_optimization": "cost_optimization",
+    "validation": "validation",
+    "strategy": "strategy",
+}
+
+
+def _run_combined_agents(state, validation_prompt):
+    from llm_engine import run_combined_agents
+    sections = ["risk", "cost_optimization", "validation"]
+    if state.get("risk_multiplier", 1.0) <= 1.5:
+        sections.append("strategy")
+    return run_combined_agents(state, validation_prompt, sections)
+
+
+def _provider_names(state):
+    return [p.get("name") for p in (state.get("nearby_providers") or []) if isinstance(p, dict) and p.get("name")][:3]
+
+
+def _stage_inputs(stage, state):
+    """The subset of state each memoized stage reads (its fingerprint inputs)."""
+    if stage == "build_method":
+        keys = ("build_type", "terrain", "distance", "premises", "traffic")
+    elif stage == "risk_agent":
+        keys = ("location_type", "terrain_type", "risk_multiplier")
+    elif stage == "simulation":
+        keys = ("distance", "premises")
+    elif stage == "cost":
+        from cost_catalog import get_compiled_catalog
+        inputs = {k: state[k] for k in (
+            "fibre_distance_m", "trench_length_m", "number_of_premises",
+            "build_type", "terrain", "traffic", "build_method", "labour_rate",
+        ) if k in state}
+        inputs["catalog_sha256"] = get_compiled_catalog().sha256
+        return inputs
+    elif stage == "cost_optimization":
+        inputs = {k: state.get(k) for k in (
+            "trench_civil_cost", "fibre_material_cost", "labour_cost", "base_cost",
+            "build_method", "build_type", "location_type", "terrain", "terrain_type", "traffic",
+        )}
+        inputs["nearby_providers"] = _provider_names(state)
+        return inputs
+    elif stage == "strategy":
+        inputs = {k: state.get(k) for k in ("build_type", "terrain", "premises", "final_cost", "risk_multiplier")}
+        inputs["total_days"] = getattr(state.get("simulation"), "total_days", None)
+        return inputs
+    else:
+        raise KeyError(stage)
+    return {k: state.get(k) for k in keys}
+
+
+def _cost_stage(inputs):
+    # compute_cost on a throwaway dict so the result can be memoized and replayed.
+    s = compute_cost(dict(inputs))
+    return {
+        "base_cost": s["base_cost"],
+        "catalog_version": s["catalog_version"],
+        "uplift_multiplier": s["uplift_multiplier"],
+        "cost_breakdown": s["cost_breakdown"],
+        "expert_outputs": s["expert_outputs"],
+    }
+
+
+def _map_inputs(state):
+    # Map state keys for new functions
+    state["fibre_distance_m"] = state["distance"]
+    state["trench_length_m"] = state["distance"]
+    state["number_of_premises"] = state["premises"]
+    # Rates are loaded from cost_catalog.json inside compute_cost()
+    state["location_type"] = state["build_type"].lower()
+    state["terrain_type"] = state["terrain"].lower()
+    return state
+
+
+def _apply_decision(state, decision):
+    state.setdefault("assumptions", [])
+    state["build_method"] = decision.get("build_method", "Hybrid")
+    state["survey_required"] = bool(decision.get("survey_required", False))
+    state["build_method_confidence"] = float(decision.get("confidence", 0.5))
+    if decision.get("decision_bucket"):
+        state["decision_bucket"] = decision["decision_bucket"]
+    for a in decision.get("assumptions", [])[:6]:
+        if isinstance(a, str) and a.strip() and a.strip() not in state["assumptions"]:
+            state["assumptions"].append(a.strip())
+    return state
+
+
+def _apply_cost(state, cost):
+    state.update({k: v for k, v in cost.items() if k != "expert_outputs"})
+    state["cost_breakdown"] = dict(cost["cost_breakdown"])
+    state.setdefault("expert_outputs", {})
+    state["expert_outputs"].update(cost["expert_outputs"])
+    # Deterministic optimization suggestions (stable, auditable)
+    try:
+        state["optimization_suggestions"] = heuristic_cost_optimizations(state)
+    except Exception:
+        state["optimization_suggestions"] = []
+    return state
+
+
+def _aggregate(state):
+    # Final Aggregation
+    state["final_cost"] = (
+        state["base_cost"] * state.get("risk_multiplier", 1.0)
+        + state.get("regulatory_cost", 0)
+        + state.get("simulation_adjustment", 0)
+    )
+
+    state["confidence_score"] = 1 / state["risk_multiplier"]
+    state["anomaly_flag"] = state["final_cost"] > 200000
+    return state
+
+
+def _validation_prompt(state):
+    return f"""
+        Validate this FTTP output.
+        Return JSON ONLY:
+
+        {{
+            "status": "VALID or INVALID",
+            "issue": "short explanation if invalid"
+        }}
+
+        Final Cost: {state["final_cost"]}
+        Risk Multiplier: {state["risk_multiplier"]}
+        Confidence Score: {state["confidence_score"]}
+        Deployment Days: {state["simulation"].total_days}
+        """
+
+
+def _hint_text(state):
+    hints = state.get("optimization_suggestions") or []
+    return "\n".join([
+        f"- {h.get('title')}: {h.get('rationale')} (est. {h.get('estimated_savings_pct')}%)" for h in hints if isinstance(h, dict)
+    ])
+
+
+def _merge_optimization_text(state, llm_opt):
+    # Merge deterministic + LLM suggestions into a single field for UI/report
+    hint_text = _hint_text(state)
+    if hint_text.strip():
+        return f"Deterministic suggestions:\n{hint_text}\n\nLLM suggestion:\n- {llm_opt}"
+    return llm_opt
+
+
+def local_validate(state):
+    """Deterministic stand-in for llm_validate: sanity-check the aggregated numbers."""
+    final_cost = float(state.get("final_cost", 0) or 0)
+    risk = float(state.get("risk_multiplier", 0) or 0)
+    days = getattr(state.get("simulation"), "total_days", 0) or 0
+    if not (final_cost > 0) or final_cost != final_cost or final_cost == float("inf"):
+        return {"status": "INVALID", "issue": "Final cost is not a positive finite number"}
+    if not (1.0 <= risk <= 3.0):
+        return {"status": "INVALID", "issue": f"Risk multiplier {risk} outside expected range"}
+    if days < 0:
+        return {"status": "INVALID", "issue": "Negative deployment days"}
+    return {"status": "VALID", "issue": ""}
+
+
+def _execute_deterministic(state):
+    """No-network assessment: heuristic build method, catalog costing, local validation."""
+    started = time.perf_counter()
+    state.setdefault("request_id", str(uuid.uuid4()))
+    _map_inputs(state)
+    state = compute_risk(state)
+    state["simulation"] = simulate_network(state["distance"], state["premises"])
+    _apply_decision(state, heuristic_build_decision(state))
+    state = compute_cost(state)
+    try:
+        state["optimization_suggestions"] = heuristic_cost_optimizations(state)
+    except Exception:
+        state["optimization_suggestions"] = []
+    _aggregate(state)
+
+    state["cost_validation"] = "Deterministic"
+    state["cost_optimization"] = _merge_optimization_text(state, "Not requested (deterministic mode)") if _hint_text(state).strip() else "No deterministic suggestions."
+    state["top_risk"] = "Unknown"
+    state["risk_mitigation"] = "Proceed with caution"
+    validation = local_validate(state)
+    if validation["status"] == "VALID":
+        state["validation"] = "VALID (local)"
+    else:
+        state["validation"] = f"Invalid: {validation['issue']}"
+    if state["risk_multiplier"] > 1.5:
+        state["mitigation"] = "Governance approval required due to high risk."
+    else:
+        state["mitigation"] = "Analysis complete. Proceed with standard deployment protocols."
+    state["mode"] = "deterministic"
+    state["stage_timings_ms"] = {"deterministic": (time.perf_counter() - started) * 1000.0}
+
+    state = store_memory(state)
+    return state
+
+
+def enrich_with_llm(state):
+    """Start the narrative agents for a deterministic result in the background.
+
+    Returns a Future resolving to a patch dict (top_risk, risk_mitigation,
+    cost_validation, cost_optimization and, for normal risk, mitigation)
+    that can be merged with ``state.update(patch)``. Failed agents are left
+    out of the patch so the deterministic values stay in place.
+    """
+    # All three agents share one event loop and its pooled connections (no thread per call).
+    from llm_engine import arun_agents, submit_async
+
+    snapshot = dict(state)
+    agents = ["risk", "cost_optimization"]
+    if snapshot.get("risk_multiplier", 1.0) <= 1.5:
+        agents.append("strategy")
+
+    async def _collect():
+        with llm_context(request_id=snapshot.get("request_id")):
+            results = await arun_agents(snapshot, agents)
+        patch = {}
+        risk_insight = results.get("risk")
+        if isinstance(risk_insight, dict) and not risk_insight.get("degraded"):
+            patch["top_risk"] = risk_insight.get("top_risk", "General Operational Risk")
+            patch["risk_mitigation"] = risk_insight.get("mitigation", "Standard Protocols")
+        cost_insight = results.get("cost_optimization")
+        if isinstance(cost_insight, dict) and not cost_insight.get("degraded"):
+            patch["cost_validation"] = cost_insight.get("validation", "Checked")
+            patch["cost_optimization"] = _merge_optimization_text(snapshot, cost_insight.get("optimization", "None"))
+        strategy = results.get("strategy")
+        if isinstance(strategy, str):
+            patch["mitigation"] = strategy
+        return patch
+
+    return submit_async(_collect())
+
+
+def stream_enrichment(state):
+    """Generator form of enrich_with_llm for progressive rendering.
+
+    Yields ``(field, value)`` pairs as the agents produce them: the strategy
+    note (``mitigation``) grows token by token, while ``top_risk`` /
+    ``risk_mitigation`` and ``cost_validation`` / ``cost_optimization``
+    arrive when their agents finish. Failed agents yield nothing, so the
+    deterministic values stay in place.
+    """
+    from llm_engine import stream_agents
+
+    snapshot = dict(state)
+    agents = ["risk", "cost_optimization"]
+    if snapshot.get("risk_multiplier", 1.0) <= 1.5:
+        agents.append("strategy")
+
+    strategy = ""
+    with llm_context(request_id=snapshot.get("request_id")):
+        events = stream_agents(snapshot, agents)
+    for agent, kind, value in events:
+        if agent == "strategy" and kind == "chunk":
+            strategy += value
+            yield "mitigation", strategy
+        elif agent == "strategy" and kind == "done":
+            yield "mitigation", value
+        elif agent == "risk" and kind == "done" and isinstance(value, dict) and not value.get("degraded"):
+            yield "top_risk", value.get("top_risk", "General Operational Risk")
+            yield "risk_mitigation", value.get("mitigation", "Standard Protocols")
+        elif agent == "cost_optimization" and kind == "done" and isinstance(value, dict) and not value.get("degraded"):
+            yield "cost_validation", value.get("validation", "Checked")
+            yield "cost_optimization", _merge_optimization_text(snapshot, value.get("optimization", "None"))
+
+
+def execute_agent(state, shared_memo=None, mode="agentic"):
+    """Run the agentic assessment pipeline.
+
+    Stage dependencies (independent stages run concurrently via StageRunner):
+        risk/simulation (deterministic) -> risk agent
+        build-method agent -> cost -> cost-optimization agent, validation, strategy
+    Each agent sees a shallow snapshot of the state taken when it is submitted.
+
+    Stages are memoized on their inputs, so a validation retry only re-runs
+    stages whose inputs changed; validation itself is always re-asked.
+    ``shared_memo=True`` also reuses stage results across runs (default from
+    AGENT_STAGE_MEMO_SHARED). Hit/miss counters are stored in ``stage_cache``.
+
+    ``mode="deterministic"`` skips every LLM call and uses the heuristic
+    fallbacks and local validation instead (see enrich_with_llm to attach
+    narratives afterwards). ``mode="combined"`` asks the risk, cost
+    optimization, validation and strategy agents in one structured request
+    (two round trips per attempt including the build method); any section
+    missing from the reply falls back to its own agent call.
+
+    Every stage that had to fall back to a heuristic or placeholder because
+    its LLM call failed is listed in ``state["degraded_stages"]`` (stage ->
+    error), so callers that must not accept placeholders can retry.
+    """
+    if mode == "deterministic":
+        return _execute_deterministic(state)
 
     # Ensure every run has a unique request id for traceability
     state.setdefault("request_id", str(uuid.uuid4()))
+    # LLM calls made by any stage are accounted to this request (llm_metrics).
+    with llm_context(request_id=state["request_id"]):
+        return _execute_agentic(state, shared_memo, mode)
+
+
+def _execute_agentic(state, shared_memo, mode):
+    from agent_executor import StageMemo, StageRunner
 
     retries = 0
     max_retries = 2
+    memo = StageMemo(shared=shared_memo)
+    runner = StageRunner(memo=memo)
+    combined = mode == "combined"
+    sections = None
+    degraded = {}
+
+    def _result(name):
+        # Combined mode serves agent stages from the single combined reply.
+        if sections is None:
+            return _accept(runner.result(name))
+        value = sections.get(_COMBINED_STAGES[name])
+        if value is None:
+            raise KeyError(name)
+        if isinstance(value, BaseException):
+            raise value
+        return _accept(value)
 
     while retries <= max_retries:
 
-        # Map state keys for new functions
-        state["fibre_distance_m"] = state["distance"]
-        state["trench_length_m"] = state["distance"]
-        state["number_of_premises"] = state["premises"]
-        # Rates are loaded from cost_catalog.json inside compute_cost()
-        state["location_type"] = state["build_type"].lower()
-        state["terrain_type"] = state["terrain"].lower()
+        _map_inputs(state)
+        # Only the final attempt's fallbacks count.
+        degraded.clear()
+
+        # Risk and simulation only need the inputs, so the risk agent can start
+        # alongside the build method agent.
+        state = compute_risk(state)
+        state["simulation"] = runner.run(
+            "simulation",
+            simulate_network,
+            state["distance"],
+            state["premises"],
+            memo_inputs=_stage_inputs("simulation", state),
+        )
+        runner.submit("build_method", _run_build_method_agent, dict(state),
+                      memo_inputs=_stage_inputs("build_method", state))
+        if not combined:
+            runner.submit("risk_agent", _run_risk_agent, dict(state),
+                          memo_inputs=_stage_inputs("risk_agent", state))
 
         # ------------------------------------
         # Build Method Decision (AI + guardrails)
         # ------------------------------------
-        state.setdefault("assumptions", [])
         try:
-            from llm_engine import run_build_method_agent
-            decision = run_build_method_agent(state)
-            state["build_method"] = decision.get("build_method", "Hybrid")
-            state["survey_required"] = bool(decision.get("survey_required", False))
-            state["build_method_confidence"] = float(decision.get("confidence", 0.5))
-            for a in decision.get("assumptions", [])[:6]:
-                if isinstance(a, str) and a.strip():
-                    state["assumptions"].append(a.strip())
-        except Exception:
+            _apply_decision(state, runner.result("build_method"))
+        except Exception as e:
+            degraded["build_method"] = str(e) or type(e).__name__
             # Heuristic fallback
-            if state["terrain"].lower() == "rocky" or state["build_type"].lower() == "rural":
-                state["build_method"] = "Underground"
-            else:
-                state["build_method"] = "Hybrid"
-            state["survey_required"] = state["terrain"].lower() in {"rocky", "water crossing"}
-            state["build_method_confidence"] = 0.45
-            state["assumptions"].append("Build method chosen by heuristic fallback.")
+            _apply_decision(state, heuristic_build_decision(state))
 
         # Compute cost
-        state = compute_cost(state)
-        # Deterministic optimization suggestions (stable, auditable)
-        try:
-            state["optimization_suggestions"] = heuristic_cost_optimizations(state)
-        except Exception:
-            state["optimization_suggestions"] = []
+        cost = runner.run("cost", _cost_stage, _stage_inputs("cost", state),
+                          memo_inputs=_stage_inputs("cost", state))
+        _apply_cost(state, cost)
+        _aggregate(state)
+
+        # LLM validation prompt
+        prompt = _validation_prompt(state)
+
+        # Everything downstream of cost is independent: optimization, validation
+        # and (speculatively, if this attempt validates) the strategy note.
+        if combined:
+            runner.submit("combined", _run_combined_agents, dict(state), prompt)
+            try:
+                sections = runner.result("combined")
+            except Exception:
+                sections = {}
+            state["combined_sources"] = dict(sections.get("_sources") or {})
+        else:
+            runner.submit("cost_optimization", _run_cost_optimization_agent, dict(state),
+                          memo_inputs=_stage_inputs("cost_optimization", state))
+            runner.submit("validation", llm_validate, prompt)
+            if state["risk_multiplier"] <= 1.5:
+                runner.submit("strategy", _run_strategy_agent, dict(state),
+                              memo_inputs=_stage_inputs("strategy", state))
+
         # ------------------------------------
         # Cost Optimization Agent (AI)
         # ------------------------------------
         try:
-            from llm_engine import run_cost_optimization_agent
-            cost_insight = run_cost_optimization_agent(state)
+            cost_insight = _result("cost_optimization")
             state["cost_validation"] = cost_insight.get("validation", "Checked")
-            llm_opt = cost_insight.get("optimization", "None")
-            # Merge deterministic + LLM suggestions into a single field for UI/report
-            hints = state.get("optimization_suggestions") or []
-            hint_text = "\n".join([
-                f"- {h.get('title')}: {h.get('rationale')} (est. {h.get('estimated_savings_pct')}%)" for h in hints if isinstance(h, dict)
-            ])
-            if hint_text.strip():
-                state["cost_optimization"] = f"Deterministic suggestions:\n{hint_text}\n\nLLM suggestion:\n- {llm_opt}"
-            else:
-                state["cost_optimization"] = llm_opt
-        except Exception:
+            state["cost_optimization"] = _merge_optimization_text(state, cost_insight.get("optimization", "None"))
+        except Exception as e:
+            degraded["cost_optimization"] = str(e) or type(e).__name__
             state["cost_validation"] = "System Error"
             state["cost_optimization"] = "Manual Review Required"
 
-        # Compute risk
-        state = compute_risk(state)
         # ------------------------------------
         # Risk Agent (AI)
         # ------------------------------------
         try:
-            from llm_engine import run_risk_agent
-            risk_insight = run_risk_agent(state)
+            risk_insight = _result("risk_agent")
             state["top_risk"] = risk_insight.get("top_risk", "General Operational Risk")
             state["risk_mitigation"] = risk_insight.get("mitigation", "Standard Protocols")
-        except Exception:
+        except Exception as e:
+            degraded["risk_agent"] = str(e) or type(e).__name__
             state["top_risk"] = "Unknown"
             state["risk_mitigation"] = "Proceed with caution"
 
-        # Simulation
-        state["simulation"] = simulate_network(
-            state["distance"],
-            state["premises"]
-        )
-
-        # Final Aggregation
-        state["final_cost"] = (
-            state["base_cost"] * state.get("risk_multiplier", 1.0)
-            + state.get("regulatory_cost", 0)
-            + state.get("simulation_adjustment", 0)
-        )
-
-        state["confidence_score"] = 1 / state["risk_multiplier"]
-        state["anomaly_flag"] = state["final_cost"] > 200000
-
-        # LLM validation prompt
-        prompt = f"""
-        Validate this FTTP output.
-        Return JSON ONLY:
-
-        {{
-            "status": "VALID or INVALID",
-            "issue": "short explanation if invalid"
-        }}
-
-        Final Cost: {state["final_cost"]}
-        Risk Multiplier: {state["risk_multiplier"]}
-        Confidence Score: {state["confidence_score"]}
-        Deployment Days: {state["simulation"].total_days}
-        """
-
         try:
             # OpenAI validation only
-            validation = llm_validate(prompt)
+            validation = _result("validation")
             if validation.get("status") == "VALID":
                 state["validation"] = "VALID (OpenAI)"
                 break
             else:
                 retries += 1
                 state["validation"] = f"Invalid: {validation.get('issue', 'N/A')}"
+                if retries <= max_retries:
+                    runner.discard("strategy")
         except Exception as e:
+            degraded["validation"] = str(e) or type(e).__name__
             state["validation"] = f"LLM Error: {str(e)} - Assuming Valid"
             break
 
@@ -201,47 +551,43 @@ def execute_agent(state):
     else:
         # Generate AI Strategic Insight for normal/low risk scenarios
         try:
-            from llm_engine import run_strategy_agent
-            state["mitigation"] = run_strategy_agent(state)
+            state["mitigation"] = _result("strategy")
         except Exception as e:
+            degraded["strategy"] = str(e) or type(e).__name__
             state["mitigation"] = "Analysis complete. Proceed with standard deployment protocols."
 
+    state["degraded_stages"] = dict(degraded)
+    state["stage_timings_ms"] = dict(runner.timings_ms)
+    state["stage_cache"] = {k: dict(v) for k, v in memo.stats.items()}
+
     state = store_memory(state)
 
     return state
 
 
-
-
-
 def scenario_estimates(base_state: dict) -> list:
     """Deterministic scenario comparison without LLM calls.
     Returns a list of scenario dicts with method, final_cost, risk_multiplier, confidence_score, total_days.
+
+    Only the compact ScenarioInput is read from ``base_state``; the state itself
+    (history, providers, nested outputs) is never copied.
     """
-    import copy as _copy
-    scenarios = []
-    for method in ["Underground", "Overhead", "Hybrid"]:
-        s = _copy.deepcopy(base_state)
-        s["build_method"] = method
-        s.setdefault("assumptions", [])
-        # Ensure mappings for compute_cost/compute_risk
-        s["fibre_distance_m"] = s.get("distance", 0)
-        s["trench_length_m"] = s.get("distance", 0)
-        s["number_of_premises"] = s.get("premises", 0)
-        s["location_type"] = str(s.get("build_type", "urban")).lower()
-        s["terrain_type"] = str(s.get("terrain", "normal")).lower()
-        try:
-            s = compute_cost(s)
-            s = compute_risk(s)
-            s["simulation"] = simulate_network(s.get("distance", 0), s.get("premises", 0))
-        except Exception:
-            # keep partial if any error
-            pass
-        scenarios.append({
-            "method": method,
-            "final_cost": float(s.get("final_cost", s.get("total_cost", 0)) or 0),
-            "risk_multiplier": float(s.get("risk_multiplier", 1.0) or 1.0),
-            "confidence_score": float(s.get("confidence_score", 0.6) or 0.6),
-            "total_days": int(getattr(s.get("simulation", None), "total_days", 0) or 0),
-        })
-    return scenarios
+    from scenario_engine import BUILD_METHODS, ScenarioInput, evaluate_grid
+
+    try:
+        grid = evaluate_grid(ScenarioInput.from_state(base_state), build_methods=BUILD_METHODS)
+    except Exception:
+        return [
+            {"method": m, "final_cost": 0.0, "risk_multiplier": 1.0, "confidence_score": 0.6, "total_days": 0}
+            for m in BUILD_METHODS
+        ]
+    return [
+        {
+            "method": str(grid["build_method"][i]),
+            "final_cost": float(grid["final_cost"][i]),
+            "risk_multiplier": float(grid["risk_multiplier"][i]),
+            "confidence_score": float(grid["confidence_score"][i]),
+            "total_days": int(grid["total_days"][i]),
+        }
+        for i in range(len(grid["build_method"]))
+    ]
@@ -0,0 +1,189 @@
+"""Persistent LLM response cache (SQLite).
+
+Responses are keyed on model, normalized prompt, temperature and the other
+request options that change the reply, and survive Streamlit restarts.
+The database runs in WAL mode with a busy timeout, so several Streamlit
+workers (or batch_runner threads) can read and write it at once.
+
+Entries expire after LLM_CACHE_TTL_S seconds; when the table grows past
+LLM_CACHE_MAX_ENTRIES the least recently used rows are evicted. Lookups
+only read: a hit refreshes its row's last_access only once that is older
+than a tenth of the TTL, so LRU order is approximate and hits do not
+queue on the SQLite write lock. Hit/miss counts are per process.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").strip() == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Evict in slightly larger steps than needed so inserts near the cap do not each pay for a DELETE.
+_EVICT_SLACK = 0.05
+# A hit rewrites last_access only when it is older than this fraction of the TTL.
+_TOUCH_FRACTION = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so re-indented f-string prompts share a key."""
+    return " ".join(str(prompt).split())
+
+
+def cache_key(model: str, prompt: str, temperature: Optional[float] = None, **options: Any) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "prompt": normalize_prompt(prompt),
+            "temperature": temperature,
+            "options": {k: v for k, v in options.items() if v is not None},
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def connect() -> sqlite3.Connection:
+    """This thread's connection to the cache database (also used by decision_cache)."""
+    # One connection per thread; sqlite3 connections are not shareable across threads.
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "path", None) == LLM_CACHE_PATH:
+        return conn
+    conn = sqlite3.connect(LLM_CACHE_PATH, timeout=10.0, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout=10000")
+    with _init_lock:
+        if LLM_CACHE_PATH not in _initialized_paths:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized_paths.add(LLM_CACHE_PATH)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+    _local.path = LLM_CACHE_PATH
+    return conn
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def get(key: str) -> Optional[str]:
+    """Cached response for ``key`` or None (missing, expired or cache disabled)."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        conn = connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT response, created_at, last_access FROM llm_cache WHERE key = ?", (key,)
+        ).fetchone()
+        # An expired row is left for put() to overwrite or purge_expired()/eviction to drop.
+        if row is None or now - row[1] > LLM_CACHE_TTL_S:
+            _count("misses")
+            return None
+        if now - row[2] > LLM_CACHE_TTL_S * _TOUCH_FRACTION:
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        _count("hits")
+        return row[0]
+    except sqlite3.Error as e:
+        _count("errors")
+        print(f"LLM cache read failed: {e}")
+        return None
+
+
+def put(key: str, response: str, model: Optional[str] = None) -> None:
+    if not LLM_CACHE_ENABLED or response is None:
+        return
+    try:
+        conn = connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache(key, model, response, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, model, str(response), now, now),
+        )
+        _count("writes")
+        _evict(conn)
+    except sqlite3.Error as e:
+        _count("errors")
+        print(f"LLM cache write failed: {e}")
+
+
+def _evict(conn: sqlite3.Connection) -> None:
+    total = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    if total <= LLM_CACHE_MAX_ENTRIES:
+        return
+    # Lookups leave expired rows in place; they go first.
+    cur = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - LLM_CACHE_TTL_S,))
+    expired = max(cur.rowcount, 0)
+    _count("evictions", expired)
+    total -= expired
+    if total <= LLM_CACHE_MAX_ENTRIES:
+        return
+    target = int(LLM_CACHE_MAX_ENTRIES * (1 - _EVICT_SLACK))
+    cur = conn.execute(
+        "DELETE FROM llm_cache WHERE key IN "
+        "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+        (total - target,),
+    )
+    _count("evictions", max(cur.rowcount, 0))
+
+
+def purge_expired() -> int:
+    """Delete expired rows now; returns the number removed."""
+    conn = connect()
+    cur = conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - LLM_CACHE_TTL_S,))
+    return max(cur.rowcount, 0)
+
+
+def clear() -> None:
+    conn = connect()
+    conn.execute("DELETE FROM llm_cache")
+    with _stats_lock:
+        for k in _stats:
+            _stats[k] = 0
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for this process, plus the number of stored entries."""
+    with _stats_lock:
+        process = dict(_stats)
+    lookups = process["hits"] + process["misses"]
+    out: Dict[str, Any] = {
+        "enabled": LLM_CACHE_ENABLED,
+        "path": LLM_CACHE_PATH,
+        "process": process,
+        "process_hit_rate": process["hits"] / lookups if lookups else 0.0,
+    }
+    if not LLM_CACHE_ENABLED:
+        return out
+    try:
+        out["entries"] = connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    except sqlite3.Error as e:
+        out["error"] = str(e)
+    return out
@@ -1,9 +1,20 @@
 
 import os
 import json
-from functools import lru_cache
+import asyncio
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import Future
 from tenacity import retry, stop_after_attempt, wait_exponential
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+import httpx
+
+import llm_cache
+import llm_metrics
+from llm_providers import Provider, ProviderPool
+from llm_ratelimit import limiter as rate_limiter
 
 # Ensure local .env is loaded for Streamlit and CLI usage
 try:
@@ -28,16 +39,30 @@ MODEL_MAPPING = {
     "openai": "llama-3.3-70b-versatile" # default fallback
 }
 
+# Clients are built with max_retries=0: ProviderPool retries, so every retry goes through the rate limiter.
 openai_client = None
 if _GROQ_KEY:
     # Use the OpenAI-compatible client pointed at Groq's API base
     # NOTE: 'api_base' is deprecated in newer openai versions, use 'base_url'
-    openai_client = OpenAI(api_key=_GROQ_KEY, base_url=_GROQ_BASE)
+    openai_client = OpenAI(api_key=_GROQ_KEY, base_url=_GROQ_BASE, max_retries=0)
 else:
     # If a pure OpenAI key is present but GROQ_API_KEY is not, default to OpenAI base URL.
     _OPENAI_KEY = os.getenv("OPENAI_API_KEY")
     if _OPENAI_KEY:
-        openai_client = OpenAI(api_key=_OPENAI_KEY)
+        openai_client = OpenAI(api_key=_OPENAI_KEY, max_retries=0)
+
+
+# Secondary provider for failover and hedged requests: the OpenAI API itself,
+# used when a Groq key and a separate OpenAI key are both configured. Groq
+# model names are swapped for LLM_OPENAI_MODEL on this provider.
+LLM_OPENAI_MODEL = os.getenv("LLM_OPENAI_MODEL", "gpt-4o-mini")
+_OPENAI_FALLBACK_KEY = os.getenv("OPENAI_API_KEY")
+openai_fallback_client = None
+if os.getenv("GROQ_API_KEY") and _OPENAI_FALLBACK_KEY and _OPENAI_FALLBACK_KEY != os.getenv("GROQ_API_KEY"):
+    openai_fallback_client = OpenAI(
+        api_key=_OPENAI_FALLBACK_KEY, base_url=os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),
+        max_retries=0,
+    )
 
 
 def _ensure_openai():
@@ -45,6 +70,118 @@ def _ensure_openai():
         raise ValueError("GROQ_API_KEY or OPENAI_API_KEY not configured in environment (.env)")
 
 
+# Async client: pooled keep-alive connections, one client per event loop
+# (httpx connections cannot be shared across loops).
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "10"))
+LLM_HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY_S", "60"))
+LLM_HTTP_TIMEOUT_S = float(os.getenv("LLM_HTTP_TIMEOUT_S", "30"))
+# Overall deadline for one stream_agents() run (all agents, including rate-limit waits).
+LLM_STREAM_TIMEOUT_S = float(os.getenv("LLM_STREAM_TIMEOUT_S", "90"))
+
+_async_clients = weakref.WeakKeyDictionary()
+# Optional factory for the async clients' httpx transport (llm_replay installs
+# its recorder / stand-in here); None uses httpx's pooled default.
+async_transport_factory = None
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_async_client(provider=None) -> AsyncOpenAI:
+    """Pooled async client for ``provider`` (default: the primary) on the running loop."""
+    _ensure_openai()
+    sync_client = provider.get_client() if provider is not None else openai_client
+    name = provider.name if provider is not None else "primary"
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=httpx.Timeout(LLM_HTTP_TIMEOUT_S, connect=10.0),
+            transport=async_transport_factory() if async_transport_factory is not None else None,
+        )
+        # Same key/base selection as the provider's sync client; ProviderPool does the retrying.
+        client = AsyncOpenAI(
+            api_key=sync_client.api_key, base_url=sync_client.base_url, http_client=http_client, max_retries=0
+        )
+        clients[name] = client
+    return client
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProviderPool:
+    """Providers in priority order: the primary client (Groq when configured), then OpenAI."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                primary_name = "groq" if "groq" in str(openai_client.base_url) else "openai"
+                providers = [Provider(primary_name, lambda: openai_client)]
+                if openai_fallback_client is not None and primary_name != "openai":
+                    providers.append(Provider("openai", lambda: openai_fallback_client, default_model=LLM_OPENAI_MODEL))
+                _pool = ProviderPool(providers, _get_async_client, limiter=rate_limiter)
+    return _pool
+
+
+def rate_limit_stats() -> dict:
+    """Shared LLM rate limiter counters (grants, waits, batch deferrals, 429 cool-downs)."""
+    return rate_limiter.stats()
+
+
+def provider_stats() -> dict:
+    """Health, circuit state and hedging counters for each configured provider."""
+    if openai_client is None:
+        return {}
+    return _get_pool().stats()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived event loop on a daemon thread; keeps the async client's connections warm."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-async", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def submit_async(coro) -> Future:
+    """Schedule ``coro`` on the shared background loop; returns a concurrent Future.
+
+    The caller's context variables (e.g. the llm_metrics request id) are
+    carried over to the coroutine.
+    """
+    ctx = contextvars.copy_context()
+
+    async def _in_caller_context():
+        for var, value in ctx.items():
+            var.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(_in_caller_context(), _background_loop())
+
+
+def run_sync(coro, timeout=None):
+    """Sync facade: run an async agent call to completion from ordinary (threaded) code."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None and running is _loop:
+        raise RuntimeError("run_sync() called from the LLM event loop; await the coroutine instead")
+    return submit_async(coro).result(timeout)
+
+
 def _extract_text_from_response(resp) -> str:
     try:
         return resp.choices[0].message.content
@@ -53,15 +190,276 @@ def _extract_text_from_response(resp) -> str:
         return json.dumps(resp)
 
 
-def run_cost_optimization_agent(state: dict) -> dict:
+class _SingleFlight:
+    """Coalesce identical concurrent calls: the first caller runs, the rest wait on its result.
+
+    Shared by every thread in the process, so Streamlit sessions running the
+    same prompt at the same moment issue one provider request between them.
+    A leader's exception is re-raised in each follower.
     """
-    Role: Cost Optimization Agent
-    Task: Suggest specific savings on the BOM.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key: str, fn):
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return fut.result()
+        try:
+            value = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key: str, coro_fn):
+        """Async counterpart of do(); shares the same in-flight table, so sync and async callers coalesce."""
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+                self._stats["leaders"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not leader:
+            return await asyncio.wrap_future(fut)
+        try:
+            value = await coro_fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out["in_flight"] = len(self._calls)
+        total = out["leaders"] + out["coalesced"]
+        out["coalesced_rate"] = out["coalesced"] / total if total else 0.0
+        return out
+
+
+_inflight = _SingleFlight()
+
+
+def singleflight_stats() -> dict:
+    """How many provider calls were issued (leaders) vs. served by an identical in-flight call."""
+    return _inflight.stats()
+
+
+def _request_kwargs(prompt, model, temperature, json_mode, timeout, max_tokens) -> dict:
+    kwargs = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+    return kwargs
+
+
+def _store_reply(key: str, text: str, model: str, json_mode: bool) -> None:
+    # JSON-mode replies are only cached if they parse, so a malformed reply is
+    # retried on the next call instead of being replayed.
+    if not text:
+        return
+    if json_mode:
+        try:
+            json.loads(text)
+        except Exception:
+            return
+    llm_cache.put(key, text, model=model)
+
+
+def _chat_completion(
+    prompt: str,
+    model: str,
+    temperature=None,
+    json_mode: bool = False,
+    timeout=None,
+    max_tokens=None,
+    use_cache: bool = True,
+    cache_if=None,
+    agent=None,
+) -> str:
+    """Single-message chat completion, served from the persistent cache when possible.
+
+    ``cache_if(text)`` can veto caching a particular reply. Every call is
+    recorded in llm_metrics under ``agent``.
     """
     _ensure_openai()
-    
+    timer = llm_metrics.CallTimer(model, agent)
+    key = llm_cache.cache_key(model, prompt, temperature, json_mode=json_mode, max_tokens=max_tokens)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            timer.done("hit")
+            return cached
+    kwargs = _request_kwargs(prompt, model, temperature, json_mode, timeout, max_tokens)
+    cache_status = "miss" if use_cache else "bypass"
+    led = []
+
+    def _call() -> str:
+        led.append(True)
+        try:
+            raw, provider, timer.model, retries = _get_pool().call(kwargs)
+            resp = raw.parse()
+        except Exception as e:
+            timer.failed(e, cache_status)
+            raise
+        text = _extract_text_from_response(resp)
+        timer.done(cache_status, usage=getattr(resp, "usage", None), retries=retries,
+                   provider=provider)
+        if use_cache and (cache_if is None or cache_if(text)):
+            _store_reply(key, text, model, json_mode)
+        return text
+
+    try:
+        text = _inflight.do(key, _call)
+    except Exception as e:
+        if not led:
+            timer.failed(e, "coalesced")
+        raise
+    if not led:
+        timer.done("coalesced")
+    return text
+
+
+async def _achat_completion(
+    prompt: str,
+    model: str,
+    temperature=None,
+    json_mode: bool = False,
+    timeout=None,
+    max_tokens=None,
+    use_cache: bool = True,
+    cache_if=None,
+    agent=None,
+) -> str:
+    """Async _chat_completion over the pooled AsyncOpenAI client (same cache, coalescing and metrics)."""
+    _ensure_openai()
+    timer = llm_metrics.CallTimer(model, agent)
+    key = llm_cache.cache_key(model, prompt, temperature, json_mode=json_mode, max_tokens=max_tokens)
+    if use_cache:
+        # SQLite I/O (and any busy_timeout wait) runs off the shared event loop.
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            timer.done("hit")
+            return cached
+    kwargs = _request_kwargs(prompt, model, temperature, json_mode, timeout, max_tokens)
+    cache_status = "miss" if use_cache else "bypass"
+    led = []
+
+    async def _call() -> str:
+        led.append(True)
+        try:
+            raw, provider, timer.model, retries = await _get_pool().acall(kwargs)
+            resp = raw.parse()
+        except Exception as e:
+            timer.failed(e, cache_status)
+            raise
+        text = _extract_text_from_response(resp)
+        timer.done(cache_status, usage=getattr(resp, "usage", None), retries=retries,
+                   provider=provider)
+        if use_cache and (cache_if is None or cache_if(text)):
+            await asyncio.to_thread(_store_reply, key, text, model, json_mode)
+        return text
+
+    try:
+        text = await _inflight.ado(key, _call)
+    except Exception as e:
+        if not led:
+            timer.failed(e, "coalesced")
+        raise
+    if not led:
+        timer.done("coalesced")
+    return text
+
+
+async def _astream_completion(
+    prompt: str,
+    model: str,
+    temperature=None,
+    timeout=None,
+    max_tokens=None,
+    use_cache: bool = True,
+    agent=None,
+):
+    """Async generator of text chunks for a single-message completion.
+
+    Shares the cache key with _chat_completion, so a cached reply is yielded
+    in one chunk and a streamed reply is cached for later non-streamed
+    calls. Streams are not coalesced.
+    """
+    _ensure_openai()
+    timer = llm_metrics.CallTimer(model, agent)
+    key = llm_cache.cache_key(model, prompt, temperature, json_mode=False, max_tokens=max_tokens)
+    if use_cache:
+        # SQLite I/O (and any busy_timeout wait) runs off the shared event loop.
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            timer.done("hit")
+            yield cached
+            return
+    kwargs = _request_kwargs(prompt, model, temperature, False, timeout, max_tokens)
+    kwargs["stream"] = True
+    cache_status = "miss" if use_cache else "bypass"
+    parts, usage, provider, retries = [], None, None, 0
+    try:
+        raw, provider, timer.model, retries = await _get_pool().acall(kwargs)
+        async for chunk in raw.parse():
+            usage = getattr(chunk, "usage", None) or usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        timer.failed(e, cache_status)
+        raise
+    text = "".join(parts)
+    timer.done(cache_status, usage=usage, retries=retries, provider=provider)
+    if use_cache:
+        await asyncio.to_thread(_store_reply, key, text, model, False)
+
+
+def _parse_json_reply(text: str) -> dict:
+    try:
+        return json.loads(text)
+    except Exception:
+        # If model didn't return pure JSON, attempt to extract JSON blob
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1:
+            return json.loads(text[start:end+1])
+        raise
+
+
+def _cost_optimization_prompt(state: dict) -> str:
     # Use INR context (India) and ground in available state.
-    prompt = f"""
+    return f"""
     You are the Cost Optimization Agent for an India FTTP build.
     Provide ONE specific, actionable optimization that could reduce cost or time-to-build.
 
@@ -88,27 +486,41 @@ def run_cost_optimization_agent(state: dict) -> dict:
       "optimization": "One concise recommendation (1–2 sentences)"
     }}
     """
-    
-    try:
-        resp = openai_client.chat.completions.create(
-            model=_get_model_name("gpt-4o"), 
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.3
-        )
-        return json.loads(_extract_text_from_response(resp))
-    except:
-        return {"validation": "System Error", "optimization": "Standard verification required."}
 
 
-def run_risk_agent(state: dict) -> dict:
+_COST_OPTIMIZATION_FALLBACK = {"validation": "System Error", "optimization": "Standard verification required."}
+
+
+def _fallback(placeholder: dict, exc: BaseException) -> dict:
+    # "degraded" marks a placeholder reply so callers that must not accept one (batch runs) can tell.
+    return {**placeholder, "degraded": str(exc) or type(exc).__name__}
+
+
+def run_cost_optimization_agent(state: dict) -> dict:
     """
-    Role: Risk Agent
-    Task: Identify top delivery risk.
+    Role: Cost Optimization Agent
+    Task: Suggest specific savings on the BOM.
     """
     _ensure_openai()
     
-    prompt = f"""
+    try:
+        text = _chat_completion(_cost_optimization_prompt(state), _get_model_name("gpt-4o"), temperature=0.3, json_mode=True, agent="cost_optimization")
+        return json.loads(text)
+    except Exception as e:
+        return _fallback(_COST_OPTIMIZATION_FALLBACK, e)
+
+
+async def arun_cost_optimization_agent(state: dict) -> dict:
+    _ensure_openai()
+    try:
+        text = await _achat_completion(_cost_optimization_prompt(state), _get_model_name("gpt-4o"), temperature=0.3, json_mode=True, agent="cost_optimization")
+        return json.loads(text)
+    except Exception as e:
+        return _fallback(_COST_OPTIMIZATION_FALLBACK, e)
+
+
+def _risk_prompt(state: dict) -> str:
+    return f"""
     You are the Risk Agent (Critical Infrastructure).
     Assess:
     - Location: {state['location_type']}
@@ -123,17 +535,32 @@ def run_risk_agent(state: dict) -> dict:
         "mitigation": "Specific Action"
     }}
     """
+
+
+_RISK_FALLBACK = {"top_risk": "Standard Risk", "mitigation": "Standard Protocols"}
+
+
+def run_risk_agent(state: dict) -> dict:
+    """
+    Role: Risk Agent
+    Task: Identify top delivery risk.
+    """
+    _ensure_openai()
     
     try:
-        resp = openai_client.chat.completions.create(
-            model=_get_model_name("gpt-4o"), 
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.3
-        )
-        return json.loads(_extract_text_from_response(resp))
-    except:
-        return {"top_risk": "Standard Risk", "mitigation": "Standard Protocols"}
+        text = _chat_completion(_risk_prompt(state), _get_model_name("gpt-4o"), temperature=0.3, json_mode=True, agent="risk_agent")
+        return json.loads(text)
+    except Exception as e:
+        return _fallback(_RISK_FALLBACK, e)
+
+
+async def arun_risk_agent(state: dict) -> dict:
+    _ensure_openai()
+    try:
+        text = await _achat_completion(_risk_prompt(state), _get_model_name("gpt-4o"), temperature=0.3, json_mode=True, agent="risk_agent")
+        return json.loads(text)
+    except Exception as e:
+        return _fallback(_RISK_FALLBACK, e)
 
 
 def _get_model_name(requested_model: str) -> str:
@@ -153,13 +580,13 @@ def call_llm(prompt: str, mode: str = "fast", temperature: float = 0.4, timeout:
     requested_model = "gpt-4o-mini" if mode == "fast" else "gpt-4o"
     model = _get_model_name(requested_model)
 
-    resp = openai_client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        timeout=timeout,
-    )
-    return _extract_text_from_response(resp)
+    return _chat_completion(prompt, model, temperature=temperature, timeout=timeout, agent="call_llm")
+
+
+async def acall_llm(prompt: str, mode: str = "fast", temperature: float = 0.4, timeout: int = 30) -> str:
+    _ensure_openai()
+    model = _get_model_name("gpt-4o-mini" if mode == "fast" else "gpt-4o")
+    return await _achat_completion(prompt, model, temperature=temperature, timeout=timeout, agent="call_llm")
 
 
 def call_llm_json(prompt: str, timeout: int = 30) -> dict:
@@ -170,29 +597,18 @@ def call_llm_json(prompt: str, timeout: int = 30) -> dict:
     _ensure_openai()
     model = _get_model_name("gpt-4o")
     
-    resp = openai_client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"},
-        timeout=timeout,
-    )
-    text = _extract_text_from_response(resp)
-    try:
-        return json.loads(text)
-    except Exception:
-        # If model didn't return pure JSON, attempt to extract JSON blob
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1:
-            try:
-                return json.loads(text[start:end+1])
-            except Exception:
-                pass
-        raise
+    text = _chat_completion(prompt, model, json_mode=True, timeout=timeout, agent="call_llm_json")
+    return _parse_json_reply(text)
+
+
+async def acall_llm_json(prompt: str, timeout: int = 30) -> dict:
+    _ensure_openai()
+    text = await _achat_completion(prompt, _get_model_name("gpt-4o"), json_mode=True, timeout=timeout, agent="call_llm_json")
+    return _parse_json_reply(text)
 
 
-@lru_cache(maxsize=128)
 def cached_llm(prompt: str, mode: str = "fast") -> str:
+    # call_llm is backed by the persistent llm_cache; kept for existing callers.
     return call_llm(prompt, mode=mode)
 
 
@@ -202,57 +618,53 @@ def safe_llm(prompt: str, mode: str = "fast") -> str:
     return call_llm(prompt, mode=mode)
 
 
-def llm_validate(prompt: str, model: str = "openai") -> dict:
-    """
-    Validate FTTP outputs using OpenAI.
-    Returns a dict with status and optional issue.
-    """
-    _ensure_openai()
-    
-    validation_prompt = f"""
+def _validation_prompt(prompt: str) -> str:
+    return f"""
     Validate this FTTP output.
     Return JSON ONLY with keys: status (VALID or INVALID), issue (short explanation if invalid)
     
     {prompt}
     """
-    
 
-    
-    model_name = _get_model_name("gpt-4o-mini")
 
-    resp = openai_client.chat.completions.create(
-        model=model_name,
-        messages=[{"role": "user", "content": validation_prompt}],
-        response_format={"type": "json_object"},
-        temperature=0.2,
-        timeout=30,
-    )
-    
-    text = _extract_text_from_response(resp)
+def _valid_verdict(text: str) -> bool:
+    # Only a parsed VALID verdict is cached: an INVALID one triggers a retry in execute_agent,
+    # and replaying it from cache would make every retry (and the site, until the TTL) fail the same way.
     try:
-        result = json.loads(text)
-        return result
+        return str(_parse_json_reply(text).get("status", "")).strip().upper() == "VALID"
     except Exception:
-        # Try to extract JSON from text
-        start = text.find("{")
-        end = text.rfind("}")
-        if start != -1 and end != -1:
-            try:
-                return json.loads(text[start:end+1])
-            except Exception:
-                pass
-        return {"status": "VALID", "issue": "parse_error"}
+        return False
+
 
+def _parse_validation(text: str) -> dict:
+    try:
+        return _parse_json_reply(text)
+    except Exception:
+        return {"status": "VALID", "issue": "parse_error", "degraded": "unparseable validation reply"}
 
 
-def run_strategy_agent(state: dict) -> str:
+def llm_validate(prompt: str, model: str = "openai") -> dict:
     """
-    Role: Strategic Planner
-    Task: Align build with corporate goals (5M premises, TTM).
+    Validate FTTP outputs using OpenAI.
+    Returns a dict with status and optional issue.
     """
     _ensure_openai()
     
-    prompt = f"""
+    model_name = _get_model_name("gpt-4o-mini")
+
+    text = _chat_completion(_validation_prompt(prompt), model_name, temperature=0.2, json_mode=True, timeout=30, cache_if=_valid_verdict, agent="validation")
+    return _parse_validation(text)
+
+
+async def allm_validate(prompt: str, model: str = "openai") -> dict:
+    _ensure_openai()
+    text = await _achat_completion(_validation_prompt(prompt), _get_model_name("gpt-4o-mini"), temperature=0.2, json_mode=True, timeout=30, cache_if=_valid_verdict, agent="validation")
+    return _parse_validation(text)
+
+
+
+def _strategy_prompt(state: dict) -> str:
+    return f"""
     You are the Strategic Planner for a UK Telecom Provider.
     Goal: Deploy fiber to 5M premises. 
     Challenge: Reduce manual errors, improve Time to Market (TTM).
@@ -272,25 +684,24 @@ def run_strategy_agent(state: dict) -> str:
     Keep it professional and directive.
     """
 
-    resp = openai_client.chat.completions.create(
-        model=_get_model_name("gpt-4o"), 
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.5,
-        max_tokens=150
-    )
-    
-    return _extract_text_from_response(resp)
 
+def run_strategy_agent(state: dict) -> str:
+    """
+    Role: Strategic Planner
+    Task: Align build with corporate goals (5M premises, TTM).
+    """
+    _ensure_openai()
 
-def run_build_method_agent(state: dict) -> dict:
-    """Role: Build Method Decision Agent.
+    return _chat_completion(_strategy_prompt(state), _get_model_name("gpt-4o"), temperature=0.5, max_tokens=150, agent="strategy")
 
-    Decides *how* to build (underground/overhead/hybrid) and flags if a survey is needed.
-    Returns structured JSON so downstream costing and reporting are deterministic.
-    """
+
+async def arun_strategy_agent(state: dict) -> str:
     _ensure_openai()
+    return await _achat_completion(_strategy_prompt(state), _get_model_name("gpt-4o"), temperature=0.5, max_tokens=150, agent="strategy")
+
 
-    prompt = f"""
+def _build_method_prompt(state: dict) -> str:
+    return f"""
     You are the Build Method Decision Agent for a UK FTTP network build.
 
     Inputs:
@@ -312,14 +723,226 @@ def run_build_method_agent(state: dict) -> dict:
     }}
     """
 
-    resp = openai_client.chat.completions.create(
-        model=_get_model_name("gpt-4o"),
-        messages=[{"role": "user", "content": prompt}],
-        response_format={"type": "json_object"},
-        temperature=0.2,
-        timeout=30,
-    )
-    return json.loads(_extract_text_from_response(resp))
+
+def run_build_method_agent(state: dict) -> dict:
+    """Role: Build Method Decision Agent.
+
+    Decides *how* to build (underground/overhead/hybrid) and flags if a survey is needed.
+    Returns structured JSON so downstream costing and reporting are deterministic.
+    """
+    _ensure_openai()
+
+    text = _chat_completion(_build_method_prompt(state), _get_model_name("gpt-4o"), temperature=0.2, json_mode=True, timeout=30, agent="build_method")
+    return json.loads(text)
+
+
+async def arun_build_method_agent(state: dict) -> dict:
+    _ensure_openai()
+    text = await _achat_completion(_build_method_prompt(state), _get_model_name("gpt-4o"), temperature=0.2, json_mode=True, timeout=30, agent="build_method")
+    return json.loads(text)
+
+
+async def arun_agents(state: dict, agents=("risk", "cost_optimization", "strategy")) -> dict:
+    """Run several agents concurrently on one event loop.
+
+    Returns {agent: result}; an agent that raises is returned as its
+    exception so callers can apply their own fallbacks.
+    """
+    table = {
+        "build_method": arun_build_method_agent,
+        "risk": arun_risk_agent,
+        "cost_optimization": arun_cost_optimization_agent,
+        "strategy": arun_strategy_agent,
+    }
+    names = list(agents)
+    results = await asyncio.gather(*(table[n](state) for n in names), return_exceptions=True)
+    return dict(zip(names, results))
+
+
+def run_agents(state: dict, agents=("risk", "cost_optimization", "strategy"), timeout=None) -> dict:
+    """Sync facade for arun_agents (runs on the shared background loop)."""
+    return run_sync(arun_agents(state, agents), timeout=timeout)
+
+
+def astream_strategy_agent(state: dict):
+    """run_strategy_agent as an async generator of text chunks."""
+    return _astream_completion(_strategy_prompt(state), _get_model_name("gpt-4o"), temperature=0.5, max_tokens=150, agent="strategy")
+
+
+_STREAMED_AGENTS = {"strategy": astream_strategy_agent}
+
+
+def stream_agents(state: dict, agents=("risk", "cost_optimization", "strategy"), timeout=None):
+    """Run agents concurrently and yield ``(agent, kind, value)`` events as output arrives.
+
+    Narrative agents (strategy) stream: ``(agent, "chunk", text)`` per
+    token batch, then ``(agent, "done", full_text)``. Structured agents
+    (risk, cost_optimization) yield one ``(agent, "done", result)``. A
+    failed agent yields ``(agent, "error", exception)``; agents still
+    running after ``timeout`` seconds (default LLM_STREAM_TIMEOUT_S) yield
+    ``(agent, "error", TimeoutError)``. Closing or abandoning the generator
+    cancels the agents still in flight.
+    """
+    import queue
+
+    events = queue.Queue()
+    names = list(agents)
+    table = {
+        "build_method": arun_build_method_agent,
+        "risk": arun_risk_agent,
+        "cost_optimization": arun_cost_optimization_agent,
+        "strategy": arun_strategy_agent,
+    }
+
+    async def _one(name):
+        try:
+            if name in _STREAMED_AGENTS:
+                parts = []
+                async for piece in _STREAMED_AGENTS[name](state):
+                    parts.append(piece)
+                    events.put((name, "chunk", piece))
+                events.put((name, "done", "".join(parts)))
+            else:
+                events.put((name, "done", await table[name](state)))
+        except Exception as e:
+            events.put((name, "error", e))
+
+    async def _all():
+        await asyncio.gather(*(_one(n) for n in names))
+
+    deadline = time.monotonic() + (LLM_STREAM_TIMEOUT_S if timeout is None else timeout)
+
+    def _drain():
+        pending = set(names)
+        try:
+            while pending:
+                try:
+                    event = events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    for name in names:
+                        if name in pending:
+                            yield name, "error", TimeoutError(f"Agent '{name}' did not finish in time")
+                    return
+                if event[1] != "chunk":
+                    pending.discard(event[0])
+                yield event
+            future.result(timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            # No-op once the agents have finished; otherwise stops them spending LLM budget.
+            future.cancel()
+
+    # Submitted before returning, so the caller's llm_context applies to the agents.
+    _ensure_openai()
+    future = submit_async(_all())
+    return _drain()
+
+
+COMBINED_SECTIONS = ("risk", "cost_optimization", "validation", "strategy")
+
+
+def _combined_prompt(state: dict) -> str:
+    providers = [p.get('name') for p in (state.get('nearby_providers') or []) if isinstance(p, dict) and p.get('name')][:3]
+    return f"""
+    You are a panel of four FTTP planning agents reviewing ONE build assessment.
+    Answer every section below from the same facts; do not invent new costs.
+
+    Assessment:
+    - Location type: {state.get('build_type', state.get('location_type'))}
+    - Terrain: {state.get('terrain', state.get('terrain_type'))}
+    - Traffic mgmt: {state.get('traffic', 'Standard')}
+    - Build method: {state.get('build_method', 'Hybrid')}
+    - Distance (m): {state.get('distance')}  Premises: {state.get('premises')}
+    - BOM (₹): civils {float(state.get('trench_civil_cost', 0) or 0):,.0f}, fibre & materials {float(state.get('fibre_material_cost', 0) or 0):,.0f}, labour {float(state.get('labour_cost', 0) or 0):,.0f}, total {float(state.get('base_cost', 0) or 0):,.0f}
+    - Final Cost: {state.get('final_cost')}
+    - Risk Multiplier: {state.get('risk_multiplier')}
+    - Confidence Score: {state.get('confidence_score')}
+    - Deployment Days: {state.get('simulation').total_days if state.get('simulation') else 'N/A'}
+    - Nearby operators: {providers}
+
+    Sections:
+    - risk: the single biggest delivery risk and a mitigation.
+    - cost_optimization: ONE practical optimization for Indian right-of-way and street works.
+    - validation: is this output internally consistent? VALID or INVALID.
+    - strategy: a 2-sentence Executive Strategy Note on alignment with the 5M premises goal and any Time to Market opportunity or risk.
+
+    Return JSON ONLY:
+    {{
+      "risk": {{"top_risk": "Specific Risk Name", "mitigation": "Specific Action"}},
+      "cost_optimization": {{"validation": "Checked", "optimization": "One concise recommendation (1–2 sentences)"}},
+      "validation": {{"status": "VALID or INVALID", "issue": "short explanation if invalid"}},
+      "strategy": "Two professional, directive sentences"
+    }}
+    """
+
+
+def _nonempty(value) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _combined_sections(data) -> dict:
+    """Keep only the sections that are well-formed; the rest fall back to their own agent."""
+    out = {}
+    if not isinstance(data, dict):
+        return out
+    risk = data.get("risk")
+    if isinstance(risk, dict) and _nonempty(risk.get("top_risk")) and _nonempty(risk.get("mitigation")):
+        out["risk"] = {"top_risk": risk["top_risk"].strip(), "mitigation": risk["mitigation"].strip()}
+    opt = data.get("cost_optimization")
+    if isinstance(opt, dict) and _nonempty(opt.get("optimization")):
+        out["cost_optimization"] = {"validation": str(opt.get("validation") or "Checked"), "optimization": opt["optimization"].strip()}
+    val = data.get("validation")
+    if isinstance(val, dict) and str(val.get("status", "")).strip().upper() in {"VALID", "INVALID"}:
+        out["validation"] = {"status": str(val["status"]).strip().upper(), "issue": str(val.get("issue") or "")}
+    if _nonempty(data.get("strategy")):
+        out["strategy"] = data["strategy"].strip()
+    return out
+
+
+def _combined_cacheable(text: str) -> bool:
+    try:
+        data = _combined_sections(_parse_json_reply(text))
+    except Exception:
+        return False
+    # Cache only complete, validated replies.
+    return len(data) == len(COMBINED_SECTIONS) and data["validation"]["status"] == "VALID"
+
+
+async def arun_combined_agents(state: dict, validation_prompt: str, sections=COMBINED_SECTIONS) -> dict:
+    """One structured request for risk, cost optimization, validation and strategy.
+
+    Each section is validated on its own; any section that is missing or
+    malformed is fetched with its individual agent call (concurrently).
+    Returns {section: result or exception} plus ``_sources`` mapping each
+    section to "combined" or "fallback".
+    """
+    wanted = list(sections)
+    try:
+        text = await _achat_completion(
+            _combined_prompt(state), _get_model_name("gpt-4o"), temperature=0.3,
+            json_mode=True, timeout=45, cache_if=_combined_cacheable, agent="combined",
+        )
+        found = _combined_sections(_parse_json_reply(text))
+    except Exception:
+        found = {}
+
+    fallbacks = {
+        "risk": lambda: arun_risk_agent(state),
+        "cost_optimization": lambda: arun_cost_optimization_agent(state),
+        "validation": lambda: allm_validate(validation_prompt),
+        "strategy": lambda: arun_strategy_agent(state),
+    }
+    missing = [name for name in wanted if name not in found]
+    results = await asyncio.gather(*(fallbacks[name]() for name in missing), return_exceptions=True)
+
+    out = {name: found[name] for name in wanted if name in found}
+    out.update(dict(zip(missing, results)))
+    out["_sources"] = {name: ("fallback" if name in missing else "combined") for name in wanted}
+    return out
+
+
+def run_combined_agents(state: dict, validation_prompt: str, sections=COMBINED_SECTIONS, timeout=None) -> dict:
+    """Sync facade for arun_combined_agents."""
+    return run_sync(arun_combined_agents(state, validation_prompt, sections), timeout=timeout)
 
 
 # Alias for backward compatibility
@@ -0,0 +1,212 @@
+"""Per-call LLM accounting.
+
+llm_engine records every chat completion here: request_id, agent, model,
+provider, latency, prompt/completion tokens, retries taken by the provider
+pool, cache status (hit / miss / coalesced / bypass), outcome and estimated
+cost. Records are kept in a small in-process ring buffer and flushed in the
+background to audit_store (raw calls plus per-day rollups with latency
+histograms), so a slow or absent Mongo never adds latency to an agent call.
+
+request_id and agent are taken from context variables set with
+``llm_context(...)``; execute_agent sets the request id for the whole run.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+LLM_METRICS_ENABLED = os.getenv("LLM_METRICS_ENABLED", "1").strip() == "1"
+LLM_METRICS_FLUSH_S = float(os.getenv("LLM_METRICS_FLUSH_S", "5"))
+LLM_METRICS_BATCH = int(os.getenv("LLM_METRICS_BATCH", "200"))
+RECENT_CALLS = 2000
+
+# Upper bounds (ms) of the latency histogram buckets; slower calls land in "gt_<last>".
+LATENCY_BUCKETS_MS = [250, 500, 1000, 2000, 4000, 8000, 16000, 30000]
+
+# USD per 1M (prompt, completion) tokens. Override with LLM_PRICES_JSON='{"model": [in, out]}'.
+MODEL_PRICES_PER_1M: Dict[str, List[float]] = {
+    "llama-3.3-70b-versatile": [0.59, 0.79],
+    "gpt-4o": [2.50, 10.00],
+    "gpt-4o-mini": [0.15, 0.60],
+}
+try:
+    MODEL_PRICES_PER_1M.update(json.loads(os.getenv("LLM_PRICES_JSON", "{}")))
+except Exception as e:
+    print(f"Ignoring LLM_PRICES_JSON: {e}")
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("llm_request_id", default=None)
+_agent: contextvars.ContextVar = contextvars.ContextVar("llm_agent", default=None)
+
+_lock = threading.Lock()
+_recent: deque = deque(maxlen=RECENT_CALLS)
+_pending: List[Dict[str, Any]] = []
+_flusher: Optional[threading.Thread] = None
+_wake = threading.Event()
+
+
+@contextmanager
+def llm_context(request_id: Optional[str] = None, agent: Optional[str] = None):
+    """Attribute LLM calls made inside the block to ``request_id`` / ``agent``."""
+    tokens = []
+    if request_id is not None:
+        tokens.append((_request_id, _request_id.set(request_id)))
+    if agent is not None:
+        tokens.append((_agent, _agent.set(agent)))
+    try:
+        yield
+    finally:
+        for var, tok in reversed(tokens):
+            var.reset(tok)
+
+
+def latency_bucket(latency_ms: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if latency_ms <= bound:
+            return f"le_{bound}"
+    return f"gt_{LATENCY_BUCKETS_MS[-1]}"
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price = MODEL_PRICES_PER_1M.get(model)
+    if not price:
+        return 0.0
+    return (prompt_tokens * float(price[0]) + completion_tokens * float(price[1])) / 1_000_000
+
+
+def _usage(usage: Any) -> Dict[str, int]:
+    if usage is None:
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    get = usage.get if isinstance(usage, dict) else lambda k, d=0: getattr(usage, k, d)
+    prompt = int(get("prompt_tokens", 0) or 0)
+    completion = int(get("completion_tokens", 0) or 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": int(get("total_tokens", 0) or prompt + completion)}
+
+
+def record_call(
+    model: str,
+    latency_ms: float,
+    cache: str,
+    usage: Any = None,
+    retries: int = 0,
+    status: str = "ok",
+    error: Optional[str] = None,
+    agent: Optional[str] = None,
+    provider: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Record one call. ``cache`` is hit, miss, coalesced or bypass."""
+    if not LLM_METRICS_ENABLED:
+        return None
+    tokens = _usage(usage)
+    now = datetime.now()
+    rec = {
+        "ts": now.isoformat(),
+        "date": now.date().isoformat(),
+        "request_id": _request_id.get(),
+        "agent": agent or _agent.get() or "unknown",
+        "model": model,
+        "provider": provider,
+        "latency_ms": round(float(latency_ms), 2),
+        "latency_bucket": latency_bucket(latency_ms),
+        **tokens,
+        "retries": int(retries or 0),
+        "cache": cache,
+        "status": status,
+        "error": error,
+        # Only calls that reached the provider cost money.
+        "cost_usd": estimate_cost(model, tokens["prompt_tokens"], tokens["completion_tokens"]) if cache in ("miss", "bypass") else 0.0,
+    }
+    with _lock:
+        _recent.append(rec)
+        _pending.append(rec)
+        backlog = len(_pending)
+    _ensure_flusher()
+    if backlog >= LLM_METRICS_BATCH:
+        _wake.set()
+    return rec
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is None:
+        with _lock:
+            if _flusher is None:
+                _flusher = threading.Thread(target=_flush_loop, name="llm-metrics", daemon=True)
+                _flusher.start()
+
+
+def _flush_loop() -> None:
+    while True:
+        _wake.wait(LLM_METRICS_FLUSH_S)
+        _wake.clear()
+        flush()
+
+
+def flush() -> int:
+    """Write pending records to audit_store now; returns how many were written."""
+    with _lock:
+        batch = list(_pending)
+        _pending.clear()
+    if not batch:
+        return 0
+    try:
+        from audit_store import record_llm_calls
+        return record_llm_calls(batch)
+    except Exception as e:
+        print(f"LLM metrics flush failed: {e}")
+        return 0
+
+
+def recent_calls(limit: int = 200) -> List[Dict[str, Any]]:
+    with _lock:
+        return list(_recent)[-limit:]
+
+
+def usage_snapshot() -> Dict[str, Any]:
+    """In-process rollup of the recent-call buffer (used when audit_store has no data)."""
+    calls = recent_calls(RECENT_CALLS)
+    by_agent: Dict[str, Dict[str, Any]] = {}
+    hist: Dict[str, int] = {}
+    for c in calls:
+        a = by_agent.setdefault(c["agent"], {"calls": 0, "errors": 0, "cache_hits": 0, "latency_ms": [],
+                                             "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0})
+        a["calls"] += 1
+        a["errors"] += c["status"] != "ok"
+        a["cache_hits"] += c["cache"] in ("hit", "coalesced")
+        a["latency_ms"].append(c["latency_ms"])
+        a["prompt_tokens"] += c["prompt_tokens"]
+        a["completion_tokens"] += c["completion_tokens"]
+        a["cost_usd"] += c["cost_usd"]
+        hist[c["latency_bucket"]] = hist.get(c["latency_bucket"], 0) + 1
+    for a in by_agent.values():
+        lat = sorted(a.pop("latency_ms"))
+        a["avg_latency_ms"] = sum(lat) / len(lat) if lat else 0.0
+        a["p95_latency_ms"] = lat[min(len(lat) - 1, int(0.95 * len(lat)))] if lat else 0.0
+    return {"calls": len(calls), "by_agent": by_agent, "latency_hist": hist}
+
+
+class CallTimer:
+    """Small helper for llm_engine: time a call and record it once."""
+
+    def __init__(self, model: str, agent: Optional[str]):
+        self.model = model
+        self.agent = agent
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000.0
+
+    def done(self, cache: str, usage: Any = None, retries: int = 0, provider: Optional[str] = None) -> None:
+        record_call(self.model, self.elapsed_ms(), cache, usage=usage, retries=retries, agent=self.agent,
+                    provider=provider)
+
+    def failed(self, error: BaseException, cache: str = "miss") -> None:
+        record_call(self.model, self.elapsed_ms(), cache, status="error",
+                    error=f"{type(error).__name__}: {error}"[:300], agent=self.agent)
@@ -0,0 +1,344 @@
+"""Provider pool for llm_engine: health tracking, circuit breaking and hedging.
+
+Providers are tried in priority order (Groq first when configured, then
+OpenAI). Each provider keeps a rolling latency window and a circuit breaker:
+LLM_CB_FAILURES provider-side errors (timeouts, connection errors, 429, 5xx)
+within LLM_CB_WINDOW_S open the circuit for LLM_CB_COOLDOWN_S, after which a
+single trial call decides whether it closes again.
+
+When the primary has not answered within its recent p95 latency, a hedged
+duplicate goes to the next healthy provider and whichever answers first
+wins. A primary that fails fast fails over immediately. With one provider
+configured, an open circuit fails fast instead of waiting out the timeout.
+
+Retries happen here rather than in the OpenAI SDK (whose clients are built
+with max_retries=0): each of the LLM_MAX_RETRIES retries of a provider-side
+error draws from the rate limiter again, and a 429 waits out the limiter's
+cool-down instead of the SDK's own backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+LLM_CB_FAILURES = int(os.getenv("LLM_CB_FAILURES", "5"))
+LLM_CB_WINDOW_S = float(os.getenv("LLM_CB_WINDOW_S", "30"))
+LLM_CB_COOLDOWN_S = float(os.getenv("LLM_CB_COOLDOWN_S", "30"))
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "1").strip() == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY_S = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_S", "8"))
+LLM_HEDGE_MIN_DELAY_S = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "0.5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_S = 0.5
+LLM_RETRY_CAP_S = 8.0
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-provider")
+    return _executor
+
+
+class ProviderUnavailable(RuntimeError):
+    pass
+
+
+def is_provider_fault(exc: BaseException) -> bool:
+    """Errors that say the provider is unhealthy (vs. a bad request that would fail anywhere)."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        return True  # timeouts, connection errors
+    return status == 429 or status >= 500
+
+
+def _retry_delay(attempt: int, exc: BaseException) -> float:
+    # A 429 already blocks the limiter until Retry-After; other errors back off with full jitter.
+    if getattr(exc, "status_code", None) == 429:
+        return 0.0
+    return random.uniform(0, min(LLM_RETRY_CAP_S, LLM_RETRY_BASE_S * (2 ** attempt)))
+
+
+class ProviderHealth:
+    """Rolling latency window plus a closed / open / half-open circuit breaker."""
+
+    def __init__(self):
+        self.latencies_ms: deque = deque(maxlen=200)
+        self.failures: deque = deque()
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trips = 0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= LLM_CB_COOLDOWN_S:
+                self.state = "half_open"
+                self.trial_in_flight = False
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def success(self, latency_ms: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.latencies_ms.append(latency_ms)
+            if self.state != "closed":
+                self.state = "closed"
+                self.failures.clear()
+            self.trial_in_flight = False
+
+    def failure(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self.calls += 1
+            self.errors += 1
+            self.failures.append(now)
+            while self.failures and now - self.failures[0] > LLM_CB_WINDOW_S:
+                self.failures.popleft()
+            if self.state == "half_open" or (self.state == "closed" and len(self.failures) >= LLM_CB_FAILURES):
+                self.state = "open"
+                self.opened_at = now
+                self.trips += 1
+            self.trial_in_flight = False
+
+    def release(self) -> None:
+        """A call ended without a verdict (e.g. a cancelled hedge)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def p95_ms(self) -> Optional[float]:
+        with self._lock:
+            lat = sorted(self.latencies_ms)
+        if len(lat) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return lat[min(len(lat) - 1, int(0.95 * len(lat)))]
+
+    def hedge_delay_s(self) -> float:
+        p95 = self.p95_ms()
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_DELAY_S
+        return max(LLM_HEDGE_MIN_DELAY_S, p95 / 1000.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95_ms()
+        with self._lock:
+            return {"state": self.state, "calls": self.calls, "errors": self.errors, "trips": self.trips,
+                    "recent_failures": len(self.failures), "p95_ms": p95}
+
+
+class Provider:
+    """One OpenAI-compatible endpoint. ``get_client`` returns its sync client."""
+
+    def __init__(self, name: str, get_client: Callable[[], Any], model_map: Optional[Dict[str, str]] = None,
+                 default_model: Optional[str] = None):
+        self.name = name
+        self.get_client = get_client
+        self.model_map = model_map or {}
+        self.default_model = default_model
+        self.health = ProviderHealth()
+
+    def model_for(self, model: str) -> str:
+        if model in self.model_map:
+            return self.model_map[model]
+        if self.default_model and model not in self.model_map.values() and not model.startswith("gpt-"):
+            return self.default_model
+        return model
+
+
+Attempt = Tuple[Any, str, str, int]  # (raw response, provider name, model used, retries taken)
+
+
+class ProviderPool:
+    def __init__(self, providers: List[Provider], async_client: Callable[[Provider], Any], limiter: Any = None):
+        self.providers = providers
+        self.async_client = async_client
+        self.limiter = limiter
+        self._lock = threading.Lock()
+        self._stats = {"hedges": 0, "hedge_wins": 0, "failovers": 0, "rejected": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _available(self) -> List[Provider]:
+        return [p for p in self.providers if p.health.allow()]
+
+    def _rate_limited(self, model: str, e: BaseException) -> None:
+        if self.limiter is not None and getattr(e, "status_code", None) == 429:
+            from llm_ratelimit import retry_after_s
+            self.limiter.cool_down(model, retry_after_s(e))
+
+    def _settle(self, model: str, estimate: int, raw: Any, kwargs: Dict[str, Any]) -> None:
+        if self.limiter is None or kwargs.get("stream"):
+            return
+        try:
+            usage = getattr(raw.parse(), "usage", None)
+        except Exception:
+            return
+        self.limiter.settle(model, estimate, getattr(usage, "total_tokens", None))
+
+    def _retry(self, provider: Provider, e: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying ``provider`` after ``e``, or None to give up."""
+        if attempt >= LLM_MAX_RETRIES or not is_provider_fault(e) or not provider.health.allow():
+            return None
+        return _retry_delay(attempt, e)
+
+    def _attempt(self, provider: Provider, kwargs: Dict[str, Any]) -> Attempt:
+        model = provider.model_for(kwargs["model"])
+        attempt = 0
+        while True:
+            estimate = 0
+            if self.limiter is not None:
+                from llm_ratelimit import estimate_tokens
+                estimate = estimate_tokens(kwargs)
+                self.limiter.acquire(model, estimate)
+            started = time.perf_counter()
+            try:
+                raw = provider.get_client().chat.completions.with_raw_response.create(**{**kwargs, "model": model})
+            except Exception as e:
+                provider.health.failure() if is_provider_fault(e) else provider.health.release()
+                self._rate_limited(model, e)
+                delay = self._retry(provider, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            provider.health.success((time.perf_counter() - started) * 1000.0)
+            self._settle(model, estimate, raw, kwargs)
+            return raw, provider.name, model, attempt
+
+    async def _aattempt(self, provider: Provider, kwargs: Dict[str, Any]) -> Attempt:
+        model = provider.model_for(kwargs["model"])
+        attempt = 0
+        while True:
+            estimate = 0
+            if self.limiter is not None:
+                from llm_ratelimit import estimate_tokens
+                estimate = estimate_tokens(kwargs)
+                await self.limiter.aacquire(model, estimate)
+            started = time.perf_counter()
+            try:
+                raw = await self.async_client(provider).chat.completions.with_raw_response.create(**{**kwargs, "model": model})
+            except asyncio.CancelledError:
+                provider.health.release()
+                raise
+            except Exception as e:
+                provider.health.failure() if is_provider_fault(e) else provider.health.release()
+                # settle/cool_down write the SQLite buckets when that backend is on; not on the loop.
+                await asyncio.to_thread(self._rate_limited, model, e)
+                delay = self._retry(provider, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            provider.health.success((time.perf_counter() - started) * 1000.0)
+            await asyncio.to_thread(self._settle, model, estimate, raw, kwargs)
+            return raw, provider.name, model, attempt
+
+    def call(self, kwargs: Dict[str, Any]) -> Attempt:
+        """Sync completion with failover/hedging. Returns (raw, provider, model, retries)."""
+        order = self._available()
+        if not order:
+            self._count("rejected")
+            raise ProviderUnavailable("All LLM providers are unavailable (circuit open)")
+        if len(order) == 1:
+            return self._attempt(order[0], kwargs)
+
+        primary, secondary = order[0], order[1]
+        ex = _get_executor()
+        first = ex.submit(contextvars.copy_context().run, self._attempt, primary, kwargs)
+        done, _ = wait([first], timeout=primary.health.hedge_delay_s() if LLM_HEDGING_ENABLED else None)
+        if first in done:
+            if first.exception() is None:
+                secondary.health.release()
+                return first.result()
+            if not is_provider_fault(first.exception()):
+                secondary.health.release()
+                raise first.exception()
+            self._count("failovers")
+            pending = set()
+        else:
+            self._count("hedges")
+            pending = {first}
+        second = ex.submit(contextvars.copy_context().run, self._attempt, secondary, kwargs)
+        pending.add(second)
+        error: Optional[BaseException] = first.exception() if first.done() else None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is second and first in pending:
+                        self._count("hedge_wins")
+                    # A slow loser keeps running in the background; it still updates health.
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+    async def acall(self, kwargs: Dict[str, Any]) -> Attempt:
+        """Async completion with failover/hedging; the losing request is cancelled."""
+        order = self._available()
+        if not order:
+            self._count("rejected")
+            raise ProviderUnavailable("All LLM providers are unavailable (circuit open)")
+        if len(order) == 1:
+            return await self._aattempt(order[0], kwargs)
+
+        primary, secondary = order[0], order[1]
+        first = asyncio.ensure_future(self._aattempt(primary, kwargs))
+        done, _ = await asyncio.wait({first}, timeout=primary.health.hedge_delay_s() if LLM_HEDGING_ENABLED else None)
+        if first in done:
+            if first.exception() is None:
+                secondary.health.release()
+                return first.result()
+            if not is_provider_fault(first.exception()):
+                secondary.health.release()
+                raise first.exception()
+            self._count("failovers")
+            pending = set()
+        else:
+            self._count("hedges")
+            pending = {first}
+        second = asyncio.ensure_future(self._aattempt(secondary, kwargs))
+        pending.add(second)
+        error: Optional[BaseException] = first.exception() if first.done() else None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second and first in pending:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out["providers"] = {p.name: p.health.snapshot() for p in self.providers}
+        return out
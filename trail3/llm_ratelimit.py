@@ -0,0 +1,316 @@
+"""Process-wide (optionally cross-process) rate limiter for outbound LLM calls.
+
+Every provider request from llm_engine draws from a pair of token buckets
+per model: requests per minute and tokens per minute. Callers that would
+exceed the budget wait for the refill instead of sending a request that
+comes back 429.
+
+Interactive calls (the default) have priority over batch traffic:
+batch callers may not dip into the last LLM_INTERACTIVE_RESERVE fraction
+of either bucket, and in-process they also wait while any interactive
+caller is queued. batch_runner marks its sites with ``priority("batch")``.
+
+LLM_RATE_LIMIT_BACKEND=sqlite keeps the buckets in the llm_cache SQLite
+file, so several Streamlit workers and batch jobs share one budget.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+LLM_RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "1").strip() == "1"
+LLM_RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "memory").strip().lower()
+# Defaults match Groq's free tier for llama-3.3-70b-versatile; override per model with
+# LLM_RATE_LIMITS_JSON='{"gpt-4o-mini": [500, 200000]}'.
+DEFAULT_RPM = float(os.getenv("LLM_RPM", "30"))
+DEFAULT_TPM = float(os.getenv("LLM_TPM", "12000"))
+LLM_INTERACTIVE_RESERVE = float(os.getenv("LLM_INTERACTIVE_RESERVE", "0.2"))
+LLM_RATE_MAX_WAIT_S = float(os.getenv("LLM_RATE_MAX_WAIT_S", "120"))
+# Completion tokens assumed when a request sets no max_tokens.
+DEFAULT_COMPLETION_TOKENS = 400
+
+MODEL_LIMITS: Dict[str, Tuple[float, float]] = {}
+try:
+    MODEL_LIMITS.update({k: (float(v[0]), float(v[1])) for k, v in json.loads(os.getenv("LLM_RATE_LIMITS_JSON", "{}")).items()})
+except Exception as e:
+    print(f"Ignoring LLM_RATE_LIMITS_JSON: {e}")
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+class RateLimitTimeout(RuntimeError):
+    """The call waited LLM_RATE_MAX_WAIT_S without getting budget."""
+
+
+@contextmanager
+def priority(level: str):
+    """Run the block's LLM calls at ``"interactive"`` or ``"batch"`` priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def limits_for(model: str) -> Tuple[float, float]:
+    return MODEL_LIMITS.get(model, (DEFAULT_RPM, DEFAULT_TPM))
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Rough prompt + completion tokens for a chat request (about 4 characters per token)."""
+    chars = sum(len(str(m.get("content", ""))) for m in kwargs.get("messages") or [])
+    return chars // 4 + int(kwargs.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+class _MemoryBuckets:
+    def __init__(self):
+        self._state: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def take(self, model: str, requests: float, tokens: float, floor: float, now: float) -> float:
+        """Take budget if it leaves both buckets above ``floor`` (a fraction); else seconds to wait."""
+        rpm, tpm = limits_for(model)
+        with self._lock:
+            st = self._state.setdefault(model, [rpm, tpm, now, 0.0])
+            return _take(st, rpm, tpm, requests, tokens, floor, now)
+
+    def adjust(self, model: str, tokens: float, now: float) -> None:
+        rpm, tpm = limits_for(model)
+        with self._lock:
+            st = self._state.setdefault(model, [rpm, tpm, now, 0.0])
+            st[1] = min(tpm, st[1] - tokens)
+
+    def block(self, model: str, until: float, now: float) -> None:
+        rpm, tpm = limits_for(model)
+        with self._lock:
+            st = self._state.setdefault(model, [rpm, tpm, now, 0.0])
+            st[3] = max(st[3], until)
+
+
+def _take(st: list, rpm: float, tpm: float, requests: float, tokens: float, floor: float, now: float) -> float:
+    # st = [requests left, tokens left, last refill, blocked until]
+    elapsed = max(0.0, now - st[2])
+    st[0] = min(rpm, st[0] + elapsed * rpm / 60.0)
+    st[1] = min(tpm, st[1] + elapsed * tpm / 60.0)
+    st[2] = now
+    if st[3] > now:
+        return st[3] - now
+    # A single request can never need more than a full bucket.
+    requests = min(requests, rpm * (1 - floor))
+    tokens = min(tokens, tpm * (1 - floor))
+    need_r = requests + floor * rpm - st[0]
+    need_t = tokens + floor * tpm - st[1]
+    if need_r <= 0 and need_t <= 0:
+        st[0] -= requests
+        st[1] -= tokens
+        return 0.0
+    return max(need_r * 60.0 / rpm if rpm > 0 else 0.0, need_t * 60.0 / tpm if tpm > 0 else 0.0, 0.01)
+
+
+class _SqliteBuckets:
+    """Bucket state in the llm_cache database, updated under BEGIN IMMEDIATE."""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS llm_rate_buckets (
+        model TEXT PRIMARY KEY,
+        requests REAL NOT NULL,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        blocked_until REAL NOT NULL DEFAULT 0
+    );
+    """
+
+    def __init__(self):
+        self._ready = set()
+
+    def _conn(self) -> sqlite3.Connection:
+        from llm_cache import connect
+
+        conn = connect()
+        db = conn.execute("PRAGMA database_list").fetchone()[2]
+        if db not in self._ready:
+            conn.executescript(self._SCHEMA)
+            self._ready.add(db)
+        return conn
+
+    def _update(self, model: str, fn, now: float):
+        rpm, tpm = limits_for(model)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, blocked_until FROM llm_rate_buckets WHERE model = ?", (model,)
+            ).fetchone()
+            st = list(row) if row else [rpm, tpm, now, 0.0]
+            out = fn(st, rpm, tpm)
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_rate_buckets(model, requests, tokens, updated_at, blocked_until) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (model, *st),
+            )
+            conn.execute("COMMIT")
+            return out
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, model: str, requests: float, tokens: float, floor: float, now: float) -> float:
+        return self._update(model, lambda st, rpm, tpm: _take(st, rpm, tpm, requests, tokens, floor, now), now)
+
+    def adjust(self, model: str, tokens: float, now: float) -> None:
+        def _fn(st, rpm, tpm):
+            st[1] = min(tpm, st[1] - tokens)
+        self._update(model, _fn, now)
+
+    def block(self, model: str, until: float, now: float) -> None:
+        def _fn(st, rpm, tpm):
+            st[3] = max(st[3], until)
+        self._update(model, _fn, now)
+
+
+class RateLimiter:
+    """Per-model request/token buckets with interactive-over-batch priority."""
+
+    def __init__(self, backend: str = LLM_RATE_LIMIT_BACKEND):
+        self.backend = backend
+        self._buckets = _SqliteBuckets() if backend == "sqlite" else _MemoryBuckets()
+        # Wall-clock time for the shared backend, so every process agrees on refill times.
+        self._clock = time.time if backend == "sqlite" else time.monotonic
+        # Guards only the waiting count and stats; the buckets do their own locking (or SQLite
+        # transactions), so no thread holds this across bucket I/O.
+        self._lock = threading.Lock()
+        self._interactive_waiting = 0
+        self._stats = {"granted": 0, "waited": 0, "wait_s": 0.0, "batch_deferred": 0, "timeouts": 0, "cool_downs": 0}
+
+    def _try(self, model: str, tokens: float, level: str) -> float:
+        with self._lock:
+            if level == "batch" and self._interactive_waiting:
+                self._stats["batch_deferred"] += 1
+                return 0.05
+        floor = LLM_INTERACTIVE_RESERVE if level == "batch" else 0.0
+        try:
+            return self._buckets.take(model, 1.0, float(tokens), floor, self._clock())
+        except sqlite3.Error as e:
+            print(f"LLM rate limiter unavailable, not limiting: {e}")
+            return 0.0
+
+    async def _atry(self, model: str, tokens: float, level: str) -> float:
+        # The SQLite backend's BEGIN IMMEDIATE can wait on other processes; keep it off the loop.
+        if self.backend == "sqlite":
+            return await asyncio.to_thread(self._try, model, tokens, level)
+        return self._try(model, tokens, level)
+
+    def _waiting(self, level: str, delta: int) -> None:
+        if level != "batch":
+            with self._lock:
+                self._interactive_waiting += delta
+
+    def _done(self, waited: float) -> float:
+        with self._lock:
+            self._stats["granted"] += 1
+            if waited > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_s"] += waited
+        return waited
+
+    def _timeout(self, model: str, waited: float):
+        with self._lock:
+            self._stats["timeouts"] += 1
+        return RateLimitTimeout(f"No LLM budget for {model} after {waited:.1f}s")
+
+    def acquire(self, model: str, tokens: float, level: Optional[str] = None) -> float:
+        """Block until the call fits the model's budget; returns seconds waited."""
+        if not LLM_RATE_LIMIT_ENABLED:
+            return 0.0
+        level = level or current_priority()
+        waited = 0.0
+        delay = self._try(model, tokens, level)
+        if delay <= 0:
+            return self._done(0.0)
+        self._waiting(level, 1)
+        try:
+            while delay > 0:
+                if waited >= LLM_RATE_MAX_WAIT_S:
+                    raise self._timeout(model, waited)
+                step = min(delay, 1.0)
+                time.sleep(step)
+                waited += step
+                delay = self._try(model, tokens, level)
+        finally:
+            self._waiting(level, -1)
+        return self._done(waited)
+
+    async def aacquire(self, model: str, tokens: float, level: Optional[str] = None) -> float:
+        """acquire() for the event loop: waits with asyncio.sleep."""
+        if not LLM_RATE_LIMIT_ENABLED:
+            return 0.0
+        level = level or current_priority()
+        waited = 0.0
+        delay = await self._atry(model, tokens, level)
+        if delay <= 0:
+            return self._done(0.0)
+        self._waiting(level, 1)
+        try:
+            while delay > 0:
+                if waited >= LLM_RATE_MAX_WAIT_S:
+                    raise self._timeout(model, waited)
+                step = min(delay, 1.0)
+                await asyncio.sleep(step)
+                waited += step
+                delay = await self._atry(model, tokens, level)
+        finally:
+            self._waiting(level, -1)
+        return self._done(waited)
+
+    def settle(self, model: str, estimated: float, actual: Optional[float]) -> None:
+        """Correct the token bucket once the provider reports real usage."""
+        if not LLM_RATE_LIMIT_ENABLED or not actual:
+            return
+        try:
+            self._buckets.adjust(model, float(actual) - float(estimated), self._clock())
+        except sqlite3.Error:
+            pass
+
+    def cool_down(self, model: str, seconds: float) -> None:
+        """Hold all callers for ``model`` back after the provider answered 429."""
+        if not LLM_RATE_LIMIT_ENABLED:
+            return
+        try:
+            now = self._clock()
+            self._buckets.block(model, now + seconds, now)
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._stats["cool_downs"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["interactive_waiting"] = self._interactive_waiting
+        out["backend"] = self.backend
+        out["enabled"] = LLM_RATE_LIMIT_ENABLED
+        return out
+
+
+def retry_after_s(exc: BaseException, default: float = 5.0) -> float:
+    """Seconds to back off after a 429, from the Retry-After header when present."""
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except Exception:
+        return default
+
+
+limiter = RateLimiter()
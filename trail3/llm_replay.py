@@ -0,0 +1,543 @@
+"""Record real LLM traffic and replay it through a local OpenAI-compatible stand-in.
+
+Recording wraps llm_engine's HTTP transports, so every chat completion the
+agents make (sync or async, any provider) is appended to a gzip JSON-lines
+fixture with its request body, response and measured latency. API keys and
+headers are never written.
+
+Replay answers the same requests without a network or API key, either
+in-process (an httpx transport installed into llm_engine) or as a localhost
+HTTP server speaking ``POST /v1/chat/completions``. Latency follows the
+recorded timings or a configured distribution, errors and timeouts can be
+injected at a fixed rate, and a seeded RNG keeps runs reproducible.
+
+Usage:
+    python llm_replay.py record sites.csv --out fixtures/llm_fixture.jsonl.gz
+    python llm_replay.py bench sites.csv --fixture fixtures/llm_fixture.jsonl.gz --concurrency 8
+    python llm_replay.py bench sites.csv --fixture f.jsonl.gz --latency lognormal:900:0.5 --error-rate 0.05
+    python llm_replay.py serve --fixture fixtures/llm_fixture.jsonl.gz --port 8765
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+REPLAY_BASE_URL = "http://llm-replay.local/v1"
+# Request fields that decide the reply; model is left out so a fixture
+# recorded on Groq also answers requests mapped to another provider.
+_KEY_FIELDS = ("messages", "response_format", "temperature", "max_tokens")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _body_key(body: Dict[str, Any]) -> str:
+    payload = json.dumps({k: body.get(k) for k in _KEY_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _template_key(body: Dict[str, Any]) -> str:
+    """Key with numbers masked, so a site with other distances/premises still matches."""
+    prompt = " ".join(str(m.get("content", "")) for m in body.get("messages") or [])
+    masked = _NUMBER.sub("#", " ".join(prompt.split()))
+    return hashlib.sha256(f"{bool(body.get('response_format'))}|{masked}".encode("utf-8")).hexdigest()
+
+
+# --------------------------------------------------------------------------
+# Recording
+# --------------------------------------------------------------------------
+
+class Recorder:
+    """Appends request/response pairs to a gzip JSON-lines fixture."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._fh = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def record(self, request: httpx.Request, response: httpx.Response, latency_ms: float) -> None:
+        if not request.url.path.endswith("/chat/completions"):
+            return
+        try:
+            body = json.loads(request.content or b"{}")
+            reply = json.loads(response.content or b"null")
+        except ValueError:
+            return  # streamed or non-JSON replies are not recorded
+        entry = {
+            "key": _body_key(body),
+            "template": _template_key(body),
+            "request": body,
+            "status": response.status_code,
+            "response": reply,
+            "latency_ms": round(latency_ms, 2),
+            "host": request.url.host,
+        }
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            if self._fh is None:
+                return
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, recorder: Recorder, inner: Optional[httpx.BaseTransport] = None):
+        self.recorder = recorder
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        response.read()
+        self.recorder.record(request, response, (time.perf_counter() - started) * 1000.0)
+        return response
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, recorder: Recorder, inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.recorder = recorder
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        self.recorder.record(request, response, (time.perf_counter() - started) * 1000.0)
+        return response
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def _reset_async_clients(llm_engine) -> None:
+    # Async clients are created lazily per loop; drop them so the next call picks up the new transport.
+    llm_engine._async_clients.clear()
+
+
+def start_recording(path: str) -> Recorder:
+    """Record every chat completion llm_engine makes from now on into ``path``."""
+    import llm_engine
+
+    llm_engine._ensure_openai()
+    recorder = Recorder(path)
+    llm_engine.openai_client = llm_engine.openai_client.copy(
+        http_client=httpx.Client(transport=RecordingTransport(recorder), timeout=llm_engine.LLM_HTTP_TIMEOUT_S)
+    )
+    if llm_engine.openai_fallback_client is not None:
+        llm_engine.openai_fallback_client = llm_engine.openai_fallback_client.copy(
+            http_client=httpx.Client(transport=RecordingTransport(recorder), timeout=llm_engine.LLM_HTTP_TIMEOUT_S)
+        )
+    limits = httpx.Limits(
+        max_connections=llm_engine.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=llm_engine.LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=llm_engine.LLM_HTTP_KEEPALIVE_EXPIRY_S,
+    )
+    llm_engine.async_transport_factory = lambda: AsyncRecordingTransport(recorder, httpx.AsyncHTTPTransport(limits=limits))
+    _reset_async_clients(llm_engine)
+    return recorder
+
+
+def load_fixture(path: str) -> List[Dict[str, Any]]:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+# --------------------------------------------------------------------------
+# Replay
+# --------------------------------------------------------------------------
+
+def _parse_latency(spec: str) -> Tuple[str, List[float]]:
+    name, _, rest = str(spec or "recorded").partition(":")
+    params = [float(x) for x in rest.split(":") if x.strip()]
+    if name not in ("recorded", "none", "fixed", "uniform", "lognormal"):
+        raise ValueError(f"Unknown latency spec {spec!r} (recorded, none, fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA)")
+    return name, params
+
+
+class StandIn:
+    """Replays fixture entries for OpenAI-style chat completion bodies.
+
+    Lookup order: exact request match, then the same prompt with numbers
+    masked, then (``miss="cycle"``) any recorded reply of the same kind
+    (JSON or text) in round-robin order; ``miss="error"`` returns 404.
+    """
+
+    def __init__(
+        self,
+        entries: Iterable[Dict[str, Any]],
+        latency: str = "recorded",
+        latency_scale: float = 1.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        timeout_rate: float = 0.0,
+        miss: str = "cycle",
+        seed: Optional[int] = 0,
+    ):
+        self.entries = [e for e in entries if int(e.get("status", 200)) == 200]
+        self.latency = _parse_latency(latency)
+        self.latency_scale = float(latency_scale)
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.timeout_rate = float(timeout_rate)
+        self.miss = miss
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._exact: Dict[str, List[Dict[str, Any]]] = {}
+        self._template: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_kind: Dict[bool, List[Dict[str, Any]]] = {True: [], False: []}
+        self._next: Dict[Any, int] = {}
+        self.stats = {"requests": 0, "exact": 0, "template": 0, "cycled": 0, "missed": 0, "errors": 0, "timeouts": 0}
+        for e in self.entries:
+            self._exact.setdefault(e["key"], []).append(e)
+            self._template.setdefault(e.get("template") or _template_key(e["request"]), []).append(e)
+            self._by_kind[bool(e["request"].get("response_format"))].append(e)
+
+    @classmethod
+    def from_fixture(cls, path: str, **options: Any) -> "StandIn":
+        return cls(load_fixture(path), **options)
+
+    def _pick(self, group_key: Any, group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        i = self._next.get(group_key, 0)
+        self._next[group_key] = i + 1
+        return group[i % len(group)]
+
+    def _delay_s(self, entry: Optional[Dict[str, Any]]) -> float:
+        name, p = self.latency
+        if name == "none":
+            ms = 0.0
+        elif name == "fixed":
+            ms = p[0]
+        elif name == "uniform":
+            ms = self._rng.uniform(p[0], p[1])
+        elif name == "lognormal":
+            ms = p[0] * math.exp(self._rng.gauss(0.0, p[1] if len(p) > 1 else 0.5))
+        else:
+            ms = float((entry or {}).get("latency_ms", 0.0))
+        return max(0.0, ms * self.latency_scale / 1000.0)
+
+    def respond(self, body: Dict[str, Any]) -> Tuple[int, Any, float]:
+        """(status, JSON body or ``"timeout"``, delay in seconds) for one request."""
+        with self._lock:
+            self.stats["requests"] += 1
+            roll = self._rng.random()
+            key, template = _body_key(body), _template_key(body)
+            kind = bool(body.get("response_format"))
+            entry = None
+            if key in self._exact:
+                entry = self._pick(("exact", key), self._exact[key])
+                self.stats["exact"] += 1
+            elif template in self._template:
+                entry = self._pick(("template", template), self._template[template])
+                self.stats["template"] += 1
+            elif self.miss == "cycle" and (self._by_kind[kind] or self._by_kind[not kind]):
+                group = self._by_kind[kind] or self._by_kind[not kind]
+                entry = self._pick(("kind", kind), group)
+                self.stats["cycled"] += 1
+            delay = self._delay_s(entry)
+            if roll < self.timeout_rate:
+                self.stats["timeouts"] += 1
+                return 0, "timeout", delay
+            if roll < self.timeout_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return self.error_status, {"error": {"message": "injected error", "type": "replay_error"}}, delay
+            if entry is None:
+                self.stats["missed"] += 1
+                return 404, {"error": {"message": "no recorded response for this request", "type": "replay_miss"}}, delay
+        reply = dict(entry["response"])
+        reply["model"] = body.get("model", reply.get("model"))
+        return 200, reply, delay
+
+    def _http_response(self, request: httpx.Request, status: int, payload: Any, body: Dict[str, Any]) -> httpx.Response:
+        if status == 200 and body.get("stream"):
+            return httpx.Response(200, content=_sse_bytes(payload), headers={"content-type": "text/event-stream"}, request=request)
+        return httpx.Response(status, json=payload, request=request)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "not found"}}, request=request)
+        body = json.loads(request.content or b"{}")
+        status, payload, delay = self.respond(body)
+        time.sleep(delay)
+        if payload == "timeout":
+            raise httpx.ReadTimeout("injected timeout", request=request)
+        return self._http_response(request, status, payload, body)
+
+    async def ahandle(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "not found"}}, request=request)
+        body = json.loads(request.content or b"{}")
+        status, payload, delay = self.respond(body)
+        await asyncio.sleep(delay)
+        if payload == "timeout":
+            raise httpx.ReadTimeout("injected timeout", request=request)
+        return self._http_response(request, status, payload, body)
+
+
+def _sse_bytes(reply: Dict[str, Any]) -> bytes:
+    """A recorded (non-streamed) reply re-chunked as server-sent events."""
+    text = ((reply.get("choices") or [{}])[0].get("message") or {}).get("content") or ""
+    base = {"id": reply.get("id", "replay"), "object": "chat.completion.chunk", "created": reply.get("created", 0),
+            "model": reply.get("model")}
+    out = []
+    for piece in re.findall(r"\S+\s*|\s+", text):
+        out.append({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+    out.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    return b"".join(f"data: {json.dumps(c)}\n\n".encode("utf-8") for c in out) + b"data: [DONE]\n\n"
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, stand_in: StandIn):
+        self.stand_in = stand_in
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.stand_in.handle(request)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, stand_in: StandIn):
+        self.stand_in = stand_in
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.stand_in.ahandle(request)
+
+
+def install(stand_in: StandIn, max_retries: int = 2) -> StandIn:
+    """Point llm_engine at the in-process stand-in (single provider, no network)."""
+    import llm_engine
+    import llm_providers
+    from openai import OpenAI
+
+    # Retries go through ProviderPool (and the rate limiter), as with the live clients.
+    llm_providers.LLM_MAX_RETRIES = max_retries
+    llm_engine.openai_client = OpenAI(
+        api_key="replay", base_url=REPLAY_BASE_URL, max_retries=0,
+        http_client=httpx.Client(transport=ReplayTransport(stand_in)),
+    )
+    llm_engine.openai_fallback_client = None
+    llm_engine._pool = None
+    llm_engine.async_transport_factory = lambda: AsyncReplayTransport(stand_in)
+    _reset_async_clients(llm_engine)
+    return stand_in
+
+
+def serve(stand_in: StandIn, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Start the stand-in as a localhost HTTP server on a daemon thread.
+
+    Point any OpenAI-compatible client at ``http://host:port/v1`` (for the
+    app: ``GROQ_API_BASE=http://127.0.0.1:8765/v1 GROQ_API_KEY=replay``).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, json.dumps({"object": "list", "data": [{"id": "replay", "object": "model"}]}).encode())
+            else:
+                self._send(404, b'{"error": {"message": "not found"}}')
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, b'{"error": {"message": "not found"}}')
+                return
+            body = json.loads(raw or b"{}")
+            status, payload, delay = stand_in.respond(body)
+            time.sleep(delay)
+            if payload == "timeout":
+                self.close_connection = True
+                return  # drop the request without a reply; the client times out
+            if status == 200 and body.get("stream"):
+                self._send(200, _sse_bytes(payload), "text/event-stream")
+            else:
+                self._send(status, json.dumps(payload).encode("utf-8"))
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-replay-http", daemon=True).start()
+    return server
+
+
+# --------------------------------------------------------------------------
+# Record / bench drivers
+# --------------------------------------------------------------------------
+
+def _disable_caches() -> None:
+    # Recording and benchmarking should exercise the provider path on every call.
+    import decision_cache
+    import llm_cache
+
+    llm_cache.LLM_CACHE_ENABLED = False
+    decision_cache.DECISION_CACHE_ENABLED = False
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench(sites: Iterable[Dict[str, Any]], mode: str = "agentic", concurrency: int = 4) -> Dict[str, Any]:
+    """Run execute_agent over ``sites`` and report throughput and per-site latency.
+
+    A site counts as failed if execute_agent raised or any stage fell back to
+    its placeholder (``degraded_stages``); ``degraded`` breaks the latter down
+    by stage.
+    """
+    from batch_runner import _site_state
+    from graph import execute_agent
+
+    def _one(site: Dict[str, Any]) -> Tuple[float, Optional[str], Dict[str, str]]:
+        started = time.perf_counter()
+        degraded: Dict[str, str] = {}
+        try:
+            result = execute_agent(_site_state(site), mode=mode)
+            degraded = dict(result.get("degraded_stages") or {})
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return (time.perf_counter() - started) * 1000.0, error, degraded
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency)), thread_name_prefix="replay-bench") as pool:
+        results = list(pool.map(_one, sites))
+    elapsed = time.perf_counter() - started
+    latencies = [ms for ms, _, _ in results]
+    by_stage: Dict[str, int] = {}
+    for _, _, degraded in results:
+        for stage in degraded:
+            by_stage[stage] = by_stage.get(stage, 0) + 1
+    return {
+        "sites": len(results),
+        "failed": sum(1 for _, err, degraded in results if err or degraded),
+        "errors": sum(1 for _, err, _ in results if err),
+        "degraded": dict(sorted(by_stage.items())),
+        "mode": mode,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "sites_per_min": round(len(results) / elapsed * 60.0, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 0.50), 1),
+            "p95": round(_percentile(latencies, 0.95), 1),
+            "p99": round(_percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Record LLM traffic or replay it offline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Run the live pipeline over sites and record every LLM call")
+    rec.add_argument("input", help="Site list (.csv or .parquet)")
+    rec.add_argument("--out", required=True, help="Fixture file to append to (.jsonl.gz)")
+    rec.add_argument("--mode", choices=["agentic", "combined"], default="agentic")
+    rec.add_argument("--concurrency", type=int, default=1)
+
+    def _replay_args(p):
+        p.add_argument("--fixture", required=True)
+        p.add_argument("--latency", default="recorded", help="recorded | none | fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+        p.add_argument("--latency-scale", type=float, default=1.0)
+        p.add_argument("--error-rate", type=float, default=0.0)
+        p.add_argument("--error-status", type=int, default=503)
+        p.add_argument("--timeout-rate", type=float, default=0.0)
+        p.add_argument("--miss", choices=["cycle", "error"], default="cycle")
+        p.add_argument("--seed", type=int, default=0)
+
+    b = sub.add_parser("bench", help="Benchmark execute_agent against the in-process stand-in")
+    b.add_argument("input", help="Site list (.csv or .parquet)")
+    b.add_argument("--mode", choices=["agentic", "combined", "deterministic"], default="agentic")
+    b.add_argument("--concurrency", type=int, default=4)
+    b.add_argument("--max-retries", type=int, default=2, help="Retries per call (LLM_MAX_RETRIES)")
+    b.add_argument("--use-cache", action="store_true", help="Keep the LLM and decision caches on")
+    b.add_argument("--rate-limit", action="store_true", help="Keep the shared LLM rate limiter on")
+    _replay_args(b)
+
+    srv = sub.add_parser("serve", help="Serve the stand-in over localhost HTTP")
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8765)
+    _replay_args(srv)
+
+    args = parser.parse_args(argv)
+    from batch_runner import iter_sites
+
+    if args.command == "record":
+        _disable_caches()
+        recorder = start_recording(args.out)
+        summary = bench(iter_sites(args.input), mode=args.mode, concurrency=args.concurrency)
+        recorder.close()
+        summary["recorded_calls"] = recorder.count
+        summary["fixture"] = args.out
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    stand_in = StandIn.from_fixture(
+        args.fixture, latency=args.latency, latency_scale=args.latency_scale, error_rate=args.error_rate,
+        error_status=args.error_status, timeout_rate=args.timeout_rate, miss=args.miss, seed=args.seed,
+    )
+    if args.command == "serve":
+        server = serve(stand_in, args.host, args.port)
+        print(f"Replaying {len(stand_in.entries)} recorded calls on http://{args.host}:{server.server_port}/v1 (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+
+    import llm_metrics
+    import llm_ratelimit
+
+    if not args.use_cache:
+        _disable_caches()
+    # The stand-in has no quota; pacing would only measure the configured RPM.
+    llm_ratelimit.LLM_RATE_LIMIT_ENABLED = args.rate_limit
+    # Replayed calls are not real spend; keep them out of the usage dashboard.
+    llm_metrics.LLM_METRICS_ENABLED = False
+    install(stand_in, max_retries=args.max_retries)
+    summary = bench(iter_sites(args.input), mode=args.mode, concurrency=args.concurrency)
+    summary["stand_in"] = dict(stand_in.stats)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -42,11 +42,15 @@
 
 import json
 import os
+import threading
 from datetime import datetime
 
 MEMORY_FILE = "memory_store.json"
 MAX_RECORDS = 100
 
+# execute_agent can run on several threads (batch_runner); serialize the file rewrite.
+_memory_lock = threading.Lock()
+
 
 def store_memory(state):
 
@@ -70,20 +74,21 @@ def store_memory(state):
         "risk_level": "High" if state["risk_multiplier"] > 1.5 else "Medium" if state["risk_multiplier"] > 1.3 else "Low"
     }
 
-    if os.path.exists(MEMORY_FILE):
-        with open(MEMORY_FILE, "r") as f:
-            data = json.load(f)
-    else:
-        data = []
+    with _memory_lock:
+        if os.path.exists(MEMORY_FILE):
+            with open(MEMORY_FILE, "r") as f:
+                data = json.load(f)
+        else:
+            data = []
 
-    data.append(record)
+        data.append(record)
 
-    # Rolling window pruning
-    if len(data) > MAX_RECORDS:
-        data = data[-MAX_RECORDS:]
+        # Rolling window pruning
+        if len(data) > MAX_RECORDS:
+            data = data[-MAX_RECORDS:]
 
-    with open(MEMORY_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+        with open(MEMORY_FILE, "w") as f:
+            json.dump(data, f, indent=4)
 
     state["history"] = data
     return state
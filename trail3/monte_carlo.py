@@ -0,0 +1,172 @@
+"""Monte Carlo cost uncertainty.
+
+Samples unit costs, uplifts, labour productivity and build-method trench
+multipliers from the distributions declared under ``uncertainty`` in
+cost_catalog.json and evaluates every draw in one vectorized pass.
+
+Each distribution is a multiplicative factor around the catalog point
+value (1.0 = point estimate). Supported specs:
+    {"dist": "triangular", "low": .., "mode": .., "high": ..}
+    {"dist": "uniform", "low": .., "high": ..}
+    {"dist": "normal", "mean": 1.0, "sd": ..}          (truncated at 1%)
+    {"dist": "lognormal", "sigma": ..}                 (median 1.0)
+Anything missing is held at the point value.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from cost_catalog import get_compiled_catalog
+from cost_engine import LABOUR_PRODUCTIVITY_M_PER_DAY, TRENCH_MULTIPLIERS, compute_cost_batch
+from risk_engine import compute_risk_batch
+
+DEFAULT_DRAWS = 100_000
+PERCENTILES = (10, 50, 90)
+
+
+def _sample_factor(rng: np.random.Generator, spec: Optional[Dict[str, Any]], size: int):
+    """Draw ``size`` multiplicative factors for one spec (scalar 1.0 if no spec)."""
+    if not isinstance(spec, dict):
+        return 1.0
+    dist = str(spec.get("dist", "")).lower()
+    if dist == "triangular":
+        low = float(spec.get("low", 1.0))
+        high = float(spec.get("high", 1.0))
+        mode = min(max(float(spec.get("mode", 1.0)), low), high)
+        if high <= low:
+            return low
+        return rng.triangular(low, mode, high, size)
+    if dist == "uniform":
+        return rng.uniform(float(spec.get("low", 1.0)), float(spec.get("high", 1.0)), size)
+    if dist == "normal":
+        draws = rng.normal(float(spec.get("mean", 1.0)), float(spec.get("sd", 0.0)), size)
+        return np.maximum(draws, 0.01)
+    if dist == "lognormal":
+        return rng.lognormal(0.0, float(spec.get("sigma", 0.0)), size)
+    return 1.0
+
+
+def _site_inputs(site: Dict[str, Any]) -> Dict[str, Any]:
+    from graph import heuristic_build_decision
+
+    build_method = site.get("build_method") or heuristic_build_decision(site)["build_method"]
+    return {
+        "distance": float(site.get("distance", 0) or 0),
+        "premises": float(site.get("premises", 0) or 0),
+        "build_type": str(site.get("build_type") or ""),
+        "terrain": str(site.get("terrain") or ""),
+        "traffic": str(site.get("traffic") or site.get("traffic_mgmt") or ""),
+        "build_method": str(build_method),
+        "labour_rate": float(site.get("labour_rate", 500.0) or 500.0),
+    }
+
+
+def simulate_cost_distribution(
+    site: Dict[str, Any],
+    draws: int = DEFAULT_DRAWS,
+    budget: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Run ``draws`` Monte Carlo samples of final cost for one site.
+
+    ``site`` uses the same keys as the execute_agent state (distance,
+    premises, build_type, terrain, traffic, build_method). Returns point
+    estimate, mean, std, P10/P50/P90 and, if ``budget`` is given, the
+    probability that final cost exceeds it.
+    """
+    started = time.perf_counter()
+    catalog = get_compiled_catalog()
+    spec = catalog.get("uncertainty") or {}
+    unit_specs = spec.get("unit_costs") or {}
+    uplift_specs = spec.get("uplifts") or {}
+    method_specs = spec.get("build_method_multipliers") or {}
+    rng = np.random.default_rng(seed)
+    s = _site_inputs(site)
+    n = int(draws)
+
+    fibre_rate = catalog.unit_cost("fibre_material_per_m", 8.0) * _sample_factor(rng, unit_specs.get("fibre_material_per_m"), n)
+    trench_rate = catalog.unit_cost("trench_civils_per_m", 25.0) * _sample_factor(rng, unit_specs.get("trench_civils_per_m"), n)
+    labour_rate = catalog.unit_cost("labour_rate_per_day", s["labour_rate"]) * _sample_factor(rng, unit_specs.get("labour_rate_per_day"), n)
+    equipment_rate = catalog.unit_cost("equipment_per_premise", 2000.0) * _sample_factor(rng, unit_specs.get("equipment_per_premise"), n)
+    productivity = LABOUR_PRODUCTIVITY_M_PER_DAY * _sample_factor(rng, spec.get("labour_productivity_m_per_day"), n)
+
+    location_key = s["build_type"].lower().replace("_", "-")
+    uplift = (
+        catalog.uplift("location_type", location_key, 1.0) * _sample_factor(rng, uplift_specs.get("location_type"), n)
+        * catalog.uplift("terrain_type", s["terrain"].lower(), 1.0) * _sample_factor(rng, uplift_specs.get("terrain_type"), n)
+        * catalog.uplift("traffic_management", s["traffic"].lower(), 1.0) * _sample_factor(rng, uplift_specs.get("traffic_management"), n)
+    )
+    method_key = s["build_method"].lower()
+    trench_multiplier = TRENCH_MULTIPLIERS.get(method_key, 1.00) * _sample_factor(rng, method_specs.get(method_key), n)
+
+    distance = s["distance"]
+    premises = s["premises"]
+    base_cost = (
+        distance * fibre_rate * uplift
+        + distance * trench_rate * trench_multiplier * uplift
+        + (distance / productivity) * labour_rate * uplift
+        + premises * equipment_rate
+    )
+    risk_multiplier = float(compute_risk_batch([s["build_type"].lower()], [s["terrain"].lower()])[0])
+    final_cost = np.broadcast_to(base_cost * risk_multiplier, (n,))
+
+    p10, p50, p90 = np.percentile(final_cost, PERCENTILES)
+    point = _point_estimate(s) * risk_multiplier
+
+    result: Dict[str, Any] = {
+        "draws": n,
+        "build_method": s["build_method"],
+        "catalog_version": catalog.version,
+        "risk_multiplier": risk_multiplier,
+        "point_estimate": point,
+        "mean": float(final_cost.mean()),
+        "std": float(final_cost.std()),
+        "p10": float(p10),
+        "p50": float(p50),
+        "p90": float(p90),
+        "budget": None,
+        "prob_exceed_budget": None,
+    }
+    if budget is not None and float(budget) > 0:
+        result["budget"] = float(budget)
+        result["prob_exceed_budget"] = float(np.count_nonzero(final_cost > float(budget)) / n)
+    result["elapsed_ms"] = (time.perf_counter() - started) * 1000.0
+    return result
+
+
+def _point_estimate(s: Dict[str, Any]) -> float:
+    cost = compute_cost_batch(**{k: [v] for k, v in s.items()})
+    return float(cost["base_cost"][0])
+
+
+def _site_seed(seed: int, site: Dict[str, Any]) -> int:
+    digest = hashlib.sha256(json.dumps(site, sort_keys=True, default=str).encode("utf-8")).digest()
+    words = np.frombuffer(digest, dtype=np.uint32).tolist()
+    return int(np.random.SeedSequence([int(seed), *words]).generate_state(1)[0])
+
+
+def simulate_portfolio(
+    sites: List[Dict[str, Any]],
+    draws: int = DEFAULT_DRAWS,
+    budget_key: str = "budget_preview",
+    seed: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Run simulate_cost_distribution for each site (budget read from ``budget_key``).
+
+    With a seed, each site's stream is derived from the seed and a hash of
+    the site itself, so results do not depend on portfolio order.
+    """
+    out = []
+    for site in sites:
+        site_seed = _site_seed(seed, site) if seed is not None else None
+        res = simulate_cost_distribution(site, draws=draws, budget=site.get(budget_key), seed=site_seed)
+        if site.get("site_ref") is not None:
+            res["site_ref"] = site.get("site_ref")
+        out.append(res)
+    return out
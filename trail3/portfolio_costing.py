@@ -0,0 +1,294 @@
+"""Headless portfolio costing.
+
+Streams a site list from CSV or Parquet, costs every site deterministically
+(no LLM calls) with the same calculators used by graph.execute_agent /
+graph.scenario_estimates, and writes results incrementally.
+
+Usage:
+    python portfolio_costing.py sites.csv costed.csv
+    python portfolio_costing.py sites.parquet costed_parquet/ --chunksize 50000 --workers 4
+    python portfolio_costing.py sites.csv costed.csv --resume
+
+Input columns: distance, premises, build_type, terrain, traffic and
+optionally build_method (blank rows use the heuristic build decision).
+Any other columns (site_ref, ids, ...) are passed through unchanged.
+
+CSV output is a single file; Parquet output is a directory of part files
+(one per chunk) so that runs can be resumed without rewriting earlier parts.
+Progress is checkpointed to ``<output>.checkpoint.json`` after every chunk.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import compute_cost_batch
+from risk_engine import compute_risk_batch
+from simulation_engine import simulate_network_batch
+
+DEFAULT_CHUNKSIZE = 50_000
+REQUIRED_COLUMNS = ["distance", "premises"]
+RESULT_COLUMNS = [
+    "build_method",
+    "fibre_material_cost",
+    "trench_civil_cost",
+    "labour_days",
+    "labour_cost",
+    "equipment_cost",
+    "base_cost",
+    "cost_per_premise",
+    "uplift_multiplier",
+    "risk_multiplier",
+    "final_cost",
+    "confidence_score",
+    "total_days",
+    "catalog_version",
+]
+
+
+def _is_parquet(path: str) -> bool:
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    return df[name].fillna("").astype(str)
+
+
+def cost_sites_frame(df: pd.DataFrame, catalog=None) -> pd.DataFrame:
+    """Cost a chunk of sites. Returns the input columns plus RESULT_COLUMNS.
+
+    Mirrors execute_agent's deterministic path: heuristic build method where
+    none is given, compute_cost, compute_risk, simulate_network and the final
+    aggregation (base_cost * risk_multiplier). ``catalog`` optionally pins a
+    CompiledCatalog (defaults to the active cost_catalog.json).
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Input is missing required columns: {missing}")
+
+    build_type = _text_column(df, "build_type")
+    terrain = _text_column(df, "terrain")
+    traffic = _text_column(df, "traffic")
+
+    # Same rule as graph.heuristic_build_decision, applied column-wise.
+    heuristic = np.where(
+        (terrain.str.lower() == "rocky") | (build_type.str.lower() == "rural"),
+        "Underground",
+        "Hybrid",
+    )
+    given = _text_column(df, "build_method").str.strip()
+    build_method = np.where(given != "", given, heuristic)
+
+    distance = pd.to_numeric(df["distance"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    premises = pd.to_numeric(df["premises"], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+    cost = compute_cost_batch(
+        distance=distance,
+        premises=premises,
+        build_type=build_type.to_numpy(),
+        terrain=terrain.to_numpy(),
+        traffic=traffic.to_numpy(),
+        build_method=build_method,
+        catalog=catalog,
+    )
+    risk = compute_risk_batch(build_type.str.lower().to_numpy(), terrain.str.lower().to_numpy())
+    sim = simulate_network_batch(distance, premises)
+
+    out = df.copy()
+    out["build_method"] = build_method
+    for k in ["fibre_material_cost", "trench_civil_cost", "labour_days", "labour_cost",
+              "equipment_cost", "base_cost", "cost_per_premise", "uplift_multiplier"]:
+        out[k] = cost[k]
+    out["risk_multiplier"] = risk
+    out["final_cost"] = cost["base_cost"] * risk
+    out["confidence_score"] = 1 / risk
+    out["total_days"] = sim["total_days"]
+    out["catalog_version"] = cost["catalog_version"]
+    return out
+
+
+# -----------------------------
+# Streaming I/O
+# -----------------------------
+def iter_site_chunks(path: str, chunksize: int = DEFAULT_CHUNKSIZE, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """Yield DataFrames of at most ``chunksize`` rows, skipping the first ``skip_rows``."""
+    if _is_parquet(path):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        to_skip = skip_rows
+        for batch in pf.iter_batches(batch_size=chunksize):
+            if to_skip >= batch.num_rows:
+                to_skip -= batch.num_rows
+                continue
+            df = batch.to_pandas()
+            if to_skip:
+                df = df.iloc[to_skip:]
+                to_skip = 0
+            yield df
+        return
+
+    skip = range(1, skip_rows + 1) if skip_rows else None
+    for df in pd.read_csv(path, chunksize=chunksize, skiprows=skip):
+        yield df
+
+
+class _ResultWriter:
+    def __init__(self, path: str, resume_state: Optional[Dict[str, Any]]):
+        self.path = path
+        self.parquet = _is_parquet(path) or os.path.isdir(path)
+        self.part = 0
+        if self.parquet:
+            os.makedirs(path, exist_ok=True)
+            if resume_state:
+                self.part = int(resume_state.get("chunks_done", 0))
+            else:
+                for name in os.listdir(path):
+                    if name.startswith("part-") and name.endswith(".parquet"):
+                        os.remove(os.path.join(path, name))
+        else:
+            if resume_state and os.path.exists(path):
+                # Drop anything written after the last checkpoint (partial chunk).
+                with open(path, "r+b") as f:
+                    f.truncate(int(resume_state.get("bytes_written", 0)))
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def write(self, df: pd.DataFrame) -> int:
+        """Write one chunk; returns the output byte offset after the write (CSV)."""
+        if self.parquet:
+            df.to_parquet(os.path.join(self.path, f"part-{self.part:05d}.parquet"), index=False)
+            self.part += 1
+            return 0
+        header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", encoding="utf-8", newline="") as f:
+            df.to_csv(f, index=False, header=header)
+            f.flush()
+            return f.tell()
+
+
+def _checkpoint_path(output: str) -> str:
+    return output.rstrip("/\\") + ".checkpoint.json"
+
+
+def _load_checkpoint(output: str, input_path: str) -> Optional[Dict[str, Any]]:
+    path = _checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("input") != os.path.abspath(input_path):
+        raise ValueError(f"Checkpoint {path} belongs to a different input: {data.get('input')}")
+    return data
+
+
+def _save_checkpoint(output: str, data: Dict[str, Any]) -> None:
+    path = _checkpoint_path(output)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def run_portfolio(
+    input_path: str,
+    output_path: str,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    workers: Optional[int] = None,
+    resume: bool = False,
+    progress: bool = True,
+) -> Dict[str, Any]:
+    """Cost every site in ``input_path`` and stream results to ``output_path``.
+
+    At most ``2 * workers`` chunks are in flight at once, so memory stays
+    bounded regardless of input size. Output order matches input order.
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    state = _load_checkpoint(output_path, input_path) if resume else None
+    rows_done = int(state.get("rows_done", 0)) if state else 0
+    chunks_done = int(state.get("chunks_done", 0)) if state else 0
+    bytes_written = int(state.get("bytes_written", 0)) if state else 0
+
+    writer = _ResultWriter(output_path, state)
+    chunks = iter_site_chunks(input_path, chunksize=chunksize, skip_rows=rows_done)
+    started = time.perf_counter()
+    rows_this_run = 0
+
+    def _commit(result: pd.DataFrame) -> None:
+        nonlocal rows_done, chunks_done, bytes_written, rows_this_run
+        offset = writer.write(result)
+        rows_done += len(result)
+        rows_this_run += len(result)
+        chunks_done += 1
+        bytes_written = offset or bytes_written
+        _save_checkpoint(output_path, {
+            "input": os.path.abspath(input_path),
+            "output": os.path.abspath(output_path),
+            "rows_done": rows_done,
+            "chunks_done": chunks_done,
+            "bytes_written": bytes_written,
+            "chunksize": chunksize,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        if progress:
+            elapsed = time.perf_counter() - started
+            rate = rows_this_run / elapsed if elapsed > 0 else 0.0
+            print(f"[portfolio] {rows_done:,} rows costed ({rate:,.0f} rows/s)", file=sys.stderr)
+
+    if workers == 1:
+        for df in chunks:
+            _commit(cost_sites_frame(df))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = []
+            for df in chunks:
+                pending.append(pool.submit(cost_sites_frame, df))
+                if len(pending) >= 2 * workers:
+                    _commit(pending.pop(0).result())
+            for fut in pending:
+                _commit(fut.result())
+
+    return {
+        "rows_done": rows_done,
+        "chunks_done": chunks_done,
+        "rows_this_run": rows_this_run,
+        "elapsed_s": time.perf_counter() - started,
+        "output": output_path,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Deterministic FTTP portfolio costing (no LLM).")
+    parser.add_argument("input", help="Site list (.csv or .parquet)")
+    parser.add_argument("output", help="Output .csv file or Parquet directory (.parquet / existing dir)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--resume", action="store_true", help="Continue from <output>.checkpoint.json")
+    parser.add_argument("--quiet", action="store_true", help="Suppress progress output")
+    args = parser.parse_args(argv)
+
+    summary = run_portfolio(
+        args.input,
+        args.output,
+        chunksize=args.chunksize,
+        workers=args.workers,
+        resume=args.resume,
+        progress=not args.quiet,
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Re-cost saved audit requests under two cost catalog versions.
+
+Streams every request's ``input_json`` from audit_store in batches, costs
+each batch under a baseline catalog and a candidate catalog with the
+vectorized calculators, and reports per-request and aggregate deltas.
+
+Usage:
+    python recost_audit.py --baseline cost_catalog_versions/cost_catalog_20250101_120000.json \\
+        --candidate current --report recost_deltas.csv
+    python recost_audit.py --baseline <old.json> --candidate <new.json> --write-back
+
+``current`` means the active cost_catalog.json. With --write-back each
+request gets a ``recosted_under`` field describing its candidate cost.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from audit_store import bulk_set_fields, iter_request_batches
+from cost_catalog import CompiledCatalog, load_catalog_version
+from portfolio_costing import cost_sites_frame
+
+DEFAULT_BATCH_SIZE = 5000
+SITE_FIELDS = ["distance", "premises", "build_type", "terrain", "traffic", "build_method"]
+REPORT_COLUMNS = [
+    "request_id",
+    "build_method",
+    "baseline_final_cost",
+    "candidate_final_cost",
+    "delta",
+    "delta_pct",
+]
+
+
+def _batch_frame(docs: List[Dict[str, Any]]) -> pd.DataFrame:
+    rows = []
+    for d in docs:
+        inp = d.get("input_json") or {}
+        out = d.get("output_json") or {}
+        row = {"request_id": d.get("request_id")}
+        for k in SITE_FIELDS:
+            row[k] = inp.get(k)
+        if not row["traffic"]:
+            row["traffic"] = inp.get("traffic_mgmt")
+        if not row["build_method"]:
+            row["build_method"] = out.get("build_method")
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["request_id"] + SITE_FIELDS)
+
+
+def recost_batch(docs: List[Dict[str, Any]], baseline: CompiledCatalog, candidate: CompiledCatalog) -> pd.DataFrame:
+    """Cost one batch of audit documents under both catalogs. Returns REPORT_COLUMNS."""
+    df = _batch_frame(docs)
+    df = df[pd.to_numeric(df["distance"], errors="coerce").notna()]
+    if df.empty:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    a = cost_sites_frame(df, catalog=baseline)
+    b = cost_sites_frame(df, catalog=candidate)
+    report = pd.DataFrame({
+        "request_id": a["request_id"].to_numpy(),
+        "build_method": a["build_method"].to_numpy(),
+        "baseline_final_cost": a["final_cost"].to_numpy(),
+        "candidate_final_cost": b["final_cost"].to_numpy(),
+    })
+    report["delta"] = report["candidate_final_cost"] - report["baseline_final_cost"]
+    base = report["baseline_final_cost"].where(report["baseline_final_cost"] != 0)
+    report["delta_pct"] = (report["delta"] / base * 100).fillna(0.0)
+    return report
+
+
+class _Aggregate:
+    def __init__(self):
+        self.requests = 0
+        self.baseline_total = 0.0
+        self.candidate_total = 0.0
+        self.increased = 0
+        self.decreased = 0
+        self.max_abs_delta = 0.0
+        self.max_abs_delta_request: Optional[str] = None
+        self.by_method: Dict[str, Dict[str, float]] = {}
+
+    def add(self, report: pd.DataFrame) -> None:
+        if report.empty:
+            return
+        self.requests += len(report)
+        self.baseline_total += float(report["baseline_final_cost"].sum())
+        self.candidate_total += float(report["candidate_final_cost"].sum())
+        self.increased += int((report["delta"] > 0).sum())
+        self.decreased += int((report["delta"] < 0).sum())
+        absd = report["delta"].abs()
+        i = int(absd.to_numpy().argmax())
+        if float(absd.iloc[i]) > self.max_abs_delta:
+            self.max_abs_delta = float(absd.iloc[i])
+            self.max_abs_delta_request = str(report["request_id"].iloc[i])
+        grouped = report.groupby("build_method")[["baseline_final_cost", "candidate_final_cost"]].agg(["sum", "count"])
+        for method, row in grouped.iterrows():
+            m = self.by_method.setdefault(str(method), {"requests": 0, "baseline_total": 0.0, "candidate_total": 0.0})
+            m["requests"] += int(row[("baseline_final_cost", "count")])
+            m["baseline_total"] += float(row[("baseline_final_cost", "sum")])
+            m["candidate_total"] += float(row[("candidate_final_cost", "sum")])
+
+    def summary(self) -> Dict[str, Any]:
+        delta = self.candidate_total - self.baseline_total
+        return {
+            "requests": self.requests,
+            "baseline_total": self.baseline_total,
+            "candidate_total": self.candidate_total,
+            "delta_total": delta,
+            "delta_pct": (delta / self.baseline_total * 100) if self.baseline_total else 0.0,
+            "increased": self.increased,
+            "decreased": self.decreased,
+            "unchanged": self.requests - self.increased - self.decreased,
+            "max_abs_delta": self.max_abs_delta,
+            "max_abs_delta_request": self.max_abs_delta_request,
+            "by_build_method": self.by_method,
+        }
+
+
+def _write_back_updates(report: pd.DataFrame, baseline: CompiledCatalog, candidate: CompiledCatalog) -> List:
+    now = datetime.now().isoformat()
+    return [
+        (
+            rid,
+            {
+                "recosted_under": {
+                    "catalog_version": candidate.version,
+                    "catalog_sha256": candidate.sha256,
+                    "baseline_version": baseline.version,
+                    "final_cost": float(cand),
+                    "baseline_final_cost": float(base),
+                    "delta": float(cand - base),
+                    "recosted_at": now,
+                }
+            },
+        )
+        for rid, base, cand in zip(report["request_id"], report["baseline_final_cost"], report["candidate_final_cost"])
+    ]
+
+
+def recost_audit_store(
+    baseline: str,
+    candidate: str = "current",
+    report_path: Optional[str] = None,
+    write_back: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    batches: Optional[Iterable[List[Dict[str, Any]]]] = None,
+    progress: bool = True,
+) -> Dict[str, Any]:
+    """Re-cost every audit request under ``baseline`` and ``candidate`` catalogs.
+
+    Per-request rows are appended to ``report_path`` (CSV) batch by batch;
+    the aggregate summary is returned. ``batches`` overrides the audit_store
+    stream (useful for re-costing an exported subset).
+    """
+    base_cat = load_catalog_version(baseline)
+    cand_cat = load_catalog_version(candidate)
+    if batches is None:
+        batches = iter_request_batches(
+            batch_size=batch_size,
+            projection={"_id": 0, "request_id": 1, "input_json": 1, "output_json.build_method": 1},
+        )
+
+    agg = _Aggregate()
+    written = 0
+    header = True
+    started = time.perf_counter()
+    for docs in batches:
+        report = recost_batch(docs, base_cat, cand_cat)
+        agg.add(report)
+        if report_path and not report.empty:
+            report.to_csv(report_path, mode="w" if header else "a", header=header, index=False)
+            header = False
+        if write_back and not report.empty:
+            written += bulk_set_fields(_write_back_updates(report, base_cat, cand_cat))
+        if progress:
+            rate = agg.requests / max(time.perf_counter() - started, 1e-9)
+            print(f"[recost] {agg.requests:,} requests ({rate:,.0f}/s)", file=sys.stderr)
+
+    summary = agg.summary()
+    summary.update({
+        "baseline_version": base_cat.version,
+        "candidate_version": cand_cat.version,
+        "written_back": written,
+        "elapsed_s": time.perf_counter() - started,
+        "report": report_path,
+    })
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-cost audit requests under two cost catalog versions.")
+    parser.add_argument("--baseline", required=True, help="Baseline catalog file (or 'current')")
+    parser.add_argument("--candidate", default="current", help="Candidate catalog file (default: current)")
+    parser.add_argument("--report", default=None, help="Per-request delta CSV to write")
+    parser.add_argument("--write-back", action="store_true", help="Store recosted_under on each request")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    summary = recost_audit_store(
+        args.baseline,
+        args.candidate,
+        report_path=args.report,
+        write_back=args.write_back,
+        batch_size=args.batch_size,
+        progress=not args.quiet,
+    )
+    print(json.dumps(summary, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -45,3 +45,20 @@ def compute_risk(state):
     state["expert_outputs"]["risk_multiplier"] = multiplier
 
     return state
+
+
+def compute_risk_batch(location_type, terrain_type):
+    """Vectorized compute_risk: returns the risk multiplier per site as a numpy array.
+
+    Inputs are the already-lowercased location/terrain labels (same keys as
+    the scalar path reads from state).
+    """
+    import numpy as np
+
+    location_type = np.asarray(location_type, dtype=object)
+    terrain_type = np.asarray(terrain_type, dtype=object)
+
+    multiplier = np.ones(location_type.shape[0], dtype=float)
+    multiplier += np.where(location_type == "urban", 0.3, 0.0)
+    multiplier += np.where(terrain_type == "rocky", 0.25, 0.0)
+    return multiplier
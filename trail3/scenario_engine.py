@@ -0,0 +1,116 @@
+"""Deterministic scenario grid.
+
+Evaluates every combination of build method, terrain, traffic, contractor,
+priority, distance and premises from a single compact input record, using
+the vectorized calculators. Nothing is copied from the (potentially large)
+agent state, so the grid is cheap enough to recompute on every widget change.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import compute_cost_batch
+from risk_engine import compute_risk_batch
+from simulation_engine import simulate_network_batch
+
+BUILD_METHODS = ["Underground", "Overhead", "Hybrid"]
+
+GRID_AXES = ["build_method", "terrain", "traffic", "contractor", "priority", "distance", "premises"]
+
+
+@dataclass(frozen=True)
+class ScenarioInput:
+    """The handful of fields the deterministic calculators actually read."""
+
+    distance: float
+    premises: int
+    build_type: str = "Urban"
+    terrain: str = "Normal"
+    traffic: str = ""
+    contractor: str = ""
+    priority: str = ""
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ScenarioInput":
+        return cls(
+            distance=float(state.get("distance", 0) or 0),
+            premises=int(state.get("premises", 0) or 0),
+            build_type=str(state.get("build_type") or "Urban"),
+            terrain=str(state.get("terrain") or "Normal"),
+            # The budget preview passes traffic as "traffic_mgmt"
+            traffic=str(state.get("traffic") or state.get("traffic_mgmt") or ""),
+            contractor=str(state.get("contractor") or ""),
+            priority=str(state.get("priority") or ""),
+        )
+
+
+def evaluate_grid(
+    base: ScenarioInput,
+    build_methods: Optional[Sequence[str]] = None,
+    terrains: Optional[Sequence[str]] = None,
+    traffics: Optional[Sequence[str]] = None,
+    contractors: Optional[Sequence[str]] = None,
+    priorities: Optional[Sequence[str]] = None,
+    distances: Optional[Sequence[float]] = None,
+    premises: Optional[Sequence[int]] = None,
+) -> Dict[str, np.ndarray]:
+    """Evaluate the full cartesian grid of scenarios around ``base``.
+
+    Any axis left as None is held at the base value. Returns column arrays:
+    the GRID_AXES columns followed by base_cost, cost_per_premise,
+    risk_multiplier, final_cost, confidence_score and total_days.
+
+    Contractor and priority are carried as grid dimensions for reporting;
+    the current cost and risk calculators do not price them.
+    """
+    axes = {
+        "build_method": list(build_methods) if build_methods is not None else BUILD_METHODS,
+        "terrain": list(terrains) if terrains is not None else [base.terrain],
+        "traffic": list(traffics) if traffics is not None else [base.traffic],
+        "contractor": list(contractors) if contractors is not None else [base.contractor],
+        "priority": list(priorities) if priorities is not None else [base.priority],
+        "distance": list(distances) if distances is not None else [base.distance],
+        "premises": list(premises) if premises is not None else [base.premises],
+    }
+
+    # Index grid over all axes, then gather values per axis (no per-row Python objects).
+    idx = np.meshgrid(*[np.arange(len(axes[a])) for a in GRID_AXES], indexing="ij")
+    cols: Dict[str, np.ndarray] = {}
+    for a, ix in zip(GRID_AXES, idx):
+        values = np.asarray(axes[a], dtype=float if a in {"distance", "premises"} else object)
+        cols[a] = values[ix.reshape(-1)]
+
+    n = cols["distance"].shape[0]
+    build_type = np.full(n, base.build_type, dtype=object)
+    terrain_lower = np.array([str(t).lower() for t in axes["terrain"]], dtype=object)[idx[1].reshape(-1)]
+
+    cost = compute_cost_batch(
+        distance=cols["distance"],
+        premises=cols["premises"],
+        build_type=build_type,
+        terrain=cols["terrain"],
+        traffic=cols["traffic"],
+        build_method=cols["build_method"],
+    )
+    risk = compute_risk_batch(np.full(n, base.build_type.lower(), dtype=object), terrain_lower)
+    sim = simulate_network_batch(cols["distance"], cols["premises"])
+
+    cols["base_cost"] = cost["base_cost"]
+    cols["cost_per_premise"] = cost["cost_per_premise"]
+    cols["risk_multiplier"] = risk
+    cols["final_cost"] = cost["base_cost"] * risk
+    cols["confidence_score"] = 1 / risk
+    cols["total_days"] = sim["total_days"]
+    return cols
+
+
+def scenario_grid(base: ScenarioInput, **axes: Optional[Sequence[Any]]) -> pd.DataFrame:
+    """Tidy DataFrame view of evaluate_grid (one row per scenario)."""
+    df = pd.DataFrame(evaluate_grid(base, **axes))
+    df["premises"] = df["premises"].astype(int)
+    return df
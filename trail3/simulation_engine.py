@@ -10,3 +10,16 @@ def simulate_network(distance, premises):
     equipment = int(distance / 250)
     total_days = int(distance / 80 + premises / 30)
     return SimulationResult(labour, equipment, total_days)
+
+
+def simulate_network_batch(distance, premises):
+    """Vectorized simulate_network. Returns a dict of integer numpy arrays."""
+    import numpy as np
+
+    distance = np.asarray(distance, dtype=float)
+    premises = np.asarray(premises, dtype=float)
+    return {
+        "labour_teams": np.trunc(premises / 12 + distance / 120).astype(int),
+        "equipment_units": np.trunc(distance / 250).astype(int),
+        "total_days": np.trunc(distance / 80 + premises / 30).astype(int),
+    }
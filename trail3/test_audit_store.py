@@ -0,0 +1,278 @@
+"""audit_store against an in-memory MongoDB (mongomock); no server needed.
+
+    python -m pytest test_audit_store.py
+"""
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import audit_store
+
+
+@pytest.fixture
+def store(monkeypatch):
+    col = mongomock.MongoClient()["fttp_audit_test"]["requests"]
+    col.create_index("request_id", unique=True)
+    # mongomock's bulk_write does not accept pymongo 4 UpdateOne objects.
+    monkeypatch.setattr(
+        mongomock.collection.Collection, "bulk_write",
+        lambda self, ops, ordered=True: [self.update_one(o._filter, o._doc, upsert=o._upsert) for o in ops],
+        raising=False,
+    )
+    monkeypatch.setattr(audit_store, "HAS_MONGO", True)
+    monkeypatch.setattr(audit_store, "AUDIT_BACKEND", "auto")
+    monkeypatch.setattr(audit_store, "_collection", col)
+    monkeypatch.setattr(audit_store, "_kpi_checked", False)
+    monkeypatch.setattr(audit_store, "record_roi_snapshot", lambda *a, **k: None)
+    return col
+
+
+def _expected_window(col):
+    """kpi_window(30) recomputed from scratch over every stored request."""
+    totals = {"requests": 0, "by_status": {}, "cost_sum": 0.0, "cost_count": 0,
+              "turnaround_hours_sum": 0.0, "turnaround_count": 0}
+    for doc in col.find({}, {"_id": 0}):
+        _, fields = audit_store._kpi_contribution(doc)
+        for k, v in fields.items():
+            if k.startswith("by_status."):
+                st = k.split(".", 1)[1]
+                totals["by_status"][st] = totals["by_status"].get(st, 0) + v
+            else:
+                totals[k] += v
+    return totals
+
+
+def _assert_window_matches(col):
+    got = audit_store.kpi_window(30)
+    want = _expected_window(col)
+    assert got["requests"] == want["requests"]
+    assert got["by_status"] == want["by_status"]
+    assert got["cost_count"] == want["cost_count"]
+    assert got["cost_sum"] == pytest.approx(want["cost_sum"])
+    assert got["turnaround_count"] == want["turnaround_count"]
+    assert got["turnaround_hours_sum"] == pytest.approx(want["turnaround_hours_sum"])
+
+
+def test_kpi_deltas_track_every_write_path(store):
+    # A fresh database: the rollups start empty and are maintained by deltas alone.
+    assert audit_store._get_kpi_collection()[1] is False
+    audit_store.save_request("R1", "S1", {"priority": "High"}, {"final_cost": 1000}, status="DRAFT")
+    audit_store.save_request("R2", "S2", {"priority": "Low"}, {"total_cost": 250}, status="PENDING_REVIEW")
+    audit_store.save_requests_bulk([
+        {"request_id": "R3", "site_ref": "S3", "inputs": {}, "outputs": {"base_cost": 40}, "status": "PENDING_REVIEW"},
+        {"request_id": "R4", "site_ref": "S4", "inputs": {}, "outputs": {}, "status": "DRAFT"},
+    ])
+    _assert_window_matches(store)
+
+    # Re-save with a new cost and status: the old contribution is removed, not double counted.
+    audit_store.save_request("R1", "S1", {"priority": "High"}, {"final_cost": 1500}, status="PENDING_REVIEW")
+    audit_store.update_status("R2", "APPROVED", actor="lead")
+    audit_store.update_status("R3", "REJECTED", actor="lead", notes="out of scope")
+    audit_store.patch_output("R4", {"final_cost": 75})
+    audit_store.save_requests_bulk([
+        {"request_id": "R3", "site_ref": "S3", "inputs": {}, "outputs": {"final_cost": 60}, "status": "PENDING_REVIEW"},
+    ])
+    _assert_window_matches(store)
+
+    window = audit_store.kpi_window(30)
+    assert window["requests"] == 4
+    assert window["by_status"] == {"PENDING_REVIEW": 2, "APPROVED": 1, "DRAFT": 1}
+    assert window["cost_sum"] == pytest.approx(1500 + 250 + 60 + 75)
+
+
+def test_kpi_seed_is_retried_after_a_failed_rebuild(store, monkeypatch):
+    audit_store.save_request("R1", "S1", {}, {"final_cost": 100}, status="DRAFT")
+    db = store.database
+    db[audit_store.KPI_COLLECTION_NAME].drop()
+    monkeypatch.setattr(audit_store, "_kpi_checked", False)
+
+    calls = []
+
+    def _failing_rebuild():
+        calls.append(1)
+        raise RuntimeError("aggregation failed")
+
+    monkeypatch.setattr(audit_store, "rebuild_kpi_rollups", _failing_rebuild)
+    assert audit_store._get_kpi_collection() == (None, False)
+    assert audit_store._kpi_checked is False
+    # The failed seed released its claim, so the next write tries again.
+    assert db[audit_store.KPI_COLLECTION_NAME].find_one({"_id": audit_store._KPI_SEED_ID}) is None
+
+    def _rebuild():
+        calls.append(1)
+        db[audit_store.KPI_COLLECTION_NAME].insert_one({"date": "2000-01-01", "requests": 1})
+        return 1
+
+    monkeypatch.setattr(audit_store, "rebuild_kpi_rollups", _rebuild)
+    kpi, seeded = audit_store._get_kpi_collection()
+    assert seeded is True and audit_store._kpi_checked is True
+    assert kpi.find_one({"_id": audit_store._KPI_SEED_ID})["state"] == "done"
+    assert len(calls) == 2
+
+
+def test_kpi_seed_claimed_by_another_process_is_not_rebuilt(store, monkeypatch):
+    from datetime import datetime
+
+    audit_store.save_request("R1", "S1", {}, {"final_cost": 100}, status="DRAFT")
+    kpi = store.database[audit_store.KPI_COLLECTION_NAME]
+    kpi.drop()
+    kpi.insert_one({"_id": audit_store._KPI_SEED_ID, "state": "building", "at": datetime.now()})
+    monkeypatch.setattr(audit_store, "_kpi_checked", False)
+    monkeypatch.setattr(audit_store, "rebuild_kpi_rollups", lambda: pytest.fail("seed rebuilt twice"))
+
+    # Deltas are skipped (the other process's rebuild counts them) and the marker is re-checked next time.
+    assert audit_store._get_kpi_collection()[1] is True
+    assert audit_store._kpi_checked is False
+
+
+@pytest.fixture
+def mongomock_exprs(monkeypatch):
+    # mongomock lacks $convert and the $type expression; equivalent forms for string-free test data.
+    monkeypatch.setattr(audit_store, "_COST_EXPR", {
+        "$ifNull": ["$output_json.final_cost", {"$ifNull": ["$output_json.total_cost", "$output_json.base_cost"]}],
+    })
+    monkeypatch.setattr(audit_store, "_TURNAROUND_HOURS_EXPR", {"$cond": [
+        {"$ifNull": ["$approved_at", False]},
+        {"$divide": [{"$subtract": ["$approved_at", "$created_at"]}, 3600000.0]},
+        None,
+    ]})
+
+
+def test_rebuild_and_percentiles_match_the_stored_requests(store, mongomock_exprs):
+    from datetime import timedelta
+
+    audit_store._get_kpi_collection()
+    for i in range(6):
+        audit_store.save_request(f"R{i}", f"S{i}", {}, {"final_cost": 100 * (i + 1)}, status="PENDING_REVIEW")
+    for i, hours in enumerate((1, 2, 4, 8)):
+        audit_store.update_status(f"R{i}", "APPROVED", actor="lead")
+        doc = store.find_one({"request_id": f"R{i}"})
+        store.update_one({"request_id": f"R{i}"}, {"$set": {"approved_at": doc["created_at"] + timedelta(hours=hours)}})
+
+    audit_store.rebuild_kpi_rollups()
+    _assert_window_matches(store)
+
+    tat = audit_store.turnaround_percentiles(30)
+    assert tat["count"] == 4
+    assert tat["avg"] == pytest.approx(3.75)
+    assert (tat["p50"], tat["p90"]) == (pytest.approx(4.0), pytest.approx(8.0))
+
+
+def test_migrate_timestamps_converts_strings_and_resumes(store):
+    from datetime import datetime
+
+    store.insert_many([
+        {"request_id": f"R{i}", "created_at": f"2024-01-0{i + 1}T10:00:00", "updated_at": f"2024-01-0{i + 1}T11:00:00"}
+        for i in range(3)
+    ] + [{"request_id": "R9", "created_at": datetime(2024, 2, 1)}])
+
+    first = audit_store.migrate_timestamps(store, batch_size=2, limit=1)
+    assert first["created_at"] == 1 and first["updated_at"] == 1
+    rest = audit_store.migrate_timestamps(store, batch_size=2)
+    assert rest["created_at"] == 2 and rest["updated_at"] == 2
+    assert audit_store.migrate_timestamps(store) == {f: 0 for f in audit_store._TIMESTAMP_FIELDS}
+
+    doc = store.find_one({"request_id": "R0"})
+    assert doc["created_at"] == datetime(2024, 1, 1, 10) and isinstance(doc["updated_at"], datetime)
+    assert store.find_one({"request_id": "R9"})["created_at"] == datetime(2024, 2, 1)
+
+
+def test_outage_writes_sync_back_to_mongo(store, monkeypatch, tmp_path):
+    import time
+    from datetime import timedelta
+
+    monkeypatch.setattr(audit_store, "AUDIT_LOCAL_DB", str(tmp_path / "audit.sqlite3"))
+    audit_store._get_kpi_collection()
+    audit_store.save_request("R1", "S1", {}, {"final_cost": 100}, status="DRAFT")
+    audit_store.save_request("R2", "S2", {}, {"final_cost": 200}, status="DRAFT")
+    created = store.find_one({"request_id": "R1"})["created_at"]
+
+    # Another worker that can still reach MongoDB edits R2 later than this one's outage write will be.
+    store.update_one({"request_id": "R2"}, {"$set": {"status": "REJECTED", "updated_at": audit_store._now() + timedelta(minutes=5)}})
+    audit_store._apply_kpi_deltas([({"created_at": created, "status": "DRAFT", "output_json": {"final_cost": 200}},
+                                    {"created_at": created, "status": "REJECTED", "output_json": {"final_cost": 200}})])
+
+    # MongoDB goes away: writes land in the embedded store.
+    monkeypatch.setattr(audit_store, "_collection", None)
+    monkeypatch.setattr(audit_store, "_mongo_retry_at", time.monotonic() + 3600)
+    audit_store.save_request("R1", "S1", {}, {"final_cost": 150}, status="PENDING_REVIEW")
+    audit_store.save_request("R2", "S2", {}, {"final_cost": 250}, status="PENDING_REVIEW")
+    audit_store.save_requests_bulk([{"request_id": "R3", "site_ref": "S3", "inputs": {}, "outputs": {"final_cost": 300}}])
+    audit_store.update_status("R3", "APPROVED", actor="lead")
+
+
+    monkeypatch.setattr(audit_store, "_collection", store)
+    assert audit_store.sync_local_to_mongo(batch_size=2) == 2
+    assert audit_store.sync_local_to_mongo() == 0
+
+    r1 = store.find_one({"request_id": "R1"})
+    assert r1["status"] == "PENDING_REVIEW" and r1["output_json"]["final_cost"] == 150
+    assert r1["created_at"] == created
+    assert store.find_one({"request_id": "R2"})["status"] == "REJECTED"
+    r3 = store.find_one({"request_id": "R3"})
+    assert r3["status"] == "APPROVED" and isinstance(r3["approved_at"], type(created))
+    _assert_window_matches(store)
+
+
+def _seed_audit_log():
+    for i, (prio, cost) in enumerate([("Normal", 100), ("Critical", 900), ("High", 400), ("", 50),
+                                      ("Critical", 300), ("Normal", 700), ("High", 200)]):
+        audit_store.save_request(f"R{i}", f"SITE-{i}", {"priority": prio}, {"final_cost": cost}, status="PENDING_REVIEW")
+    # The approved override is what the Audit Log shows, so it is what the cost filter matches.
+    audit_store.patch_output("R0", {"approved_final_cost": 5000.0})
+
+
+def _walk(order, **filters):
+    rows, cursor = [], None
+    while True:
+        page = audit_store.list_requests_page(2, cursor, order=order, **filters)
+        rows += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows
+
+
+def _assert_audit_log_pages():
+    every = _walk("newest")
+    assert len(every) == 7
+    shown = {r["request_id"]: r["approved_final_cost"] if r["approved_final_cost"] is not None else r["final_cost"]
+             for r in every}
+    rank = {r["request_id"]: audit_store._PRIORITY_RANK.get(r["priority"], 3) for r in every}
+    newest = sorted(every, key=lambda r: (r["created_at"], r["request_id"]), reverse=True)
+    assert [r["request_id"] for r in every] == [r["request_id"] for r in newest]
+
+    by_priority = [r["request_id"] for r in _walk("priority")]
+    assert by_priority == [r["request_id"] for r in sorted(newest, key=lambda r: rank[r["request_id"]])]
+    assert [rank[r] for r in by_priority] == [0, 0, 1, 1, 2, 2, 3]
+
+    for order in ("newest", "priority"):
+        got = {r["request_id"] for r in _walk(order, min_cost=250, max_cost=1000)}
+        assert got == {k for k, v in shown.items() if 250 <= v <= 1000}
+        assert "R0" in {r["request_id"] for r in _walk(order, min_cost=4000)}
+
+
+def test_audit_log_filters_and_orders_on_mongo(store):
+    _seed_audit_log()
+    _assert_audit_log_pages()
+
+
+def test_audit_log_filters_and_orders_on_local(monkeypatch, tmp_path):
+    import time
+
+    monkeypatch.setattr(audit_store, "AUDIT_BACKEND", "local")
+    monkeypatch.setattr(audit_store, "AUDIT_LOCAL_DB", str(tmp_path / "audit.sqlite3"))
+    monkeypatch.setattr(audit_store, "_collection", None)
+    monkeypatch.setattr(audit_store, "_mongo_retry_at", time.monotonic() + 3600)
+    monkeypatch.setattr(audit_store, "record_roi_snapshot", lambda *a, **k: None)
+    _seed_audit_log()
+    _assert_audit_log_pages()
+
+
+def test_backfill_list_fields_sets_older_requests(store):
+    store.insert_one({"request_id": "OLD", "input_json": {"priority": "High"},
+                      "output_json": {"final_cost": 10, "approved_final_cost": 12}})
+    assert audit_store.backfill_list_fields(store) == 1
+    assert audit_store.backfill_list_fields(store) == 0
+    doc = store.find_one({"request_id": "OLD"})
+    assert (doc["display_cost"], doc["priority_rank"]) == (12.0, 1)